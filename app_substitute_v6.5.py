@@ -2,203 +2,45 @@ import streamlit as st
 import pandas as pd
 import re
 import datetime
-import time
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from collections import defaultdict
 
+from substitute.api import SEARCH_TIMEOUT
+from substitute.parse_cache import content_key
+from substitute.cycle_search import MAX_DEPTH
+from substitute.parallel_search import DEFAULT_WORKERS
+from substitute.swap_search import MY_CLASSES, SWAP_PAGE_SIZE
+from substitute.absence_plan import MAX_PER_DAY
+from substitute.ledger import absence_moves, cycle_moves, default_ledger, ledger_scope, swap_moves
+from substitute.notices import absence_notices, cycle_notices, slot_time, spooled, swap_notice, write_html, write_zip
+from substitute.profiling import Profiler, count, profiled, stage, write_log
+from substitute.ranking import TOP_K
+from substitute.registry import registry
+from substitute.schedule_index import highlight_styles
+from substitute.school_calendar import SchoolCalendar, load_calendar
+from substitute.xinhe_parser import DAYS, PERIODS
+
 # ==========================================
 # 0. 系統設定
 # ==========================================
 st.set_page_config(page_title="成德高中 智慧調代課系統 v40", layout="wide")
 
 # ==========================================
-# 1. 核心邏輯：欣河系統解析
-# ==========================================
-def parse_xinhe_csv(uploaded_file):
-    try:
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file, encoding='utf-8', header=None, on_bad_lines='skip')
-    except:
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file, encoding='cp950', header=None, on_bad_lines='skip')
-    
-    df = df.fillna("").astype(str)
-    all_data = []
-    current_teacher = None
-    day_col_map = {}
-    period_map_zh = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5", "六": "6", "七": "7", "八": "8", "九": "9"}
-    
-    for idx in range(len(df)):
-        row = df.iloc[idx].values
-        row_str = " ".join(row)
-
-        if "教師" in row_str:
-            match = re.search(r"教師[:：\s]*([^\s,0-9]+)", row_str)
-            if match:
-                raw_name = match.group(1).replace(":", "").strip()
-                if len(raw_name) > 1 and "課程表" not in raw_name:
-                    current_teacher = re.sub(r'(導師|老師|專任|代理|組長|教官|主任)', '', raw_name)
-                    day_col_map = {} 
-            continue
-
-        if "一" in row and "五" in row:
-            temp_map = {}
-            for col_i, val in enumerate(row):
-                val = val.strip()
-                if val in ["一", "二", "三", "四", "五"]:
-                    temp_map[col_i] = val
-            if len(temp_map) >= 3:
-                day_col_map = {v: k for k, v in temp_map.items()}
-                continue
-
-        if not current_teacher or not day_col_map: continue
-            
-        target_period = None
-        for i in range(min(5, len(row))):
-            val = row[i].strip()
-            if val in period_map_zh:
-                target_period = period_map_zh[val]
-                break
-        
-        if target_period:
-            prev_row = df.iloc[idx-1].values if idx > 0 else None
-            for day, col_idx in day_col_map.items():
-                if col_idx < len(row):
-                    class_info = row[col_idx].strip()
-                    subject_info = ""
-                    if prev_row is not None and col_idx < len(prev_row):
-                        subject_info = prev_row[col_idx].strip()
-                    
-                    subject_info = subject_info.replace("nan", "")
-                    class_info = class_info.replace("nan", "")
-                    
-                    full_content = ""
-                    if subject_info and class_info:
-                        full_content = f"{subject_info} ({class_info})"
-                    elif subject_info:
-                        full_content = subject_info
-                    elif class_info:
-                        full_content = class_info
-                        
-                    is_free = True
-                    if len(full_content) > 1 and full_content not in ["|", "nan", "None"]:
-                        is_free = False
-                        
-                    if not is_free:
-                        all_data.append({
-                            "teacher": current_teacher,
-                            "day": day,
-                            "period": target_period,
-                            "content": full_content,
-                            "subject": subject_info,
-                            "class_name": class_info
-                        })
-
-    if not all_data: return pd.DataFrame()
-    data_df = pd.DataFrame(all_data)
-    
-    teachers = data_df['teacher'].unique()
-    days = ["一", "二", "三", "四", "五"]
-    periods = [str(i) for i in range(1, 9)]
-    full_idx = pd.MultiIndex.from_product([teachers, days, periods], names=['teacher', 'day', 'period'])
-    full_df = pd.DataFrame(index=full_idx).reset_index()
-    final_df = pd.merge(full_df, data_df, on=['teacher', 'day', 'period'], how='left')
-    
-    final_df['content'] = final_df['content'].fillna("")
-    final_df['subject'] = final_df['subject'].fillna("")
-    final_df['class_name'] = final_df['class_name'].fillna("")
-    final_df['is_free'] = final_df['content'] == ""
-    
-    def split_content(row):
-        s, c = row['subject'], row['class_name']
-        if s or c: return str(s), str(c)
-        match = re.search(r"^(.*)\s+\((.*)\)$", str(row['content']))
-        if match: return match.group(1), match.group(2)
-        return str(row['content']), ""
-    
-    res = final_df.apply(split_content, axis=1)
-    final_df['subject'] = [x[0] for x in res]
-    final_df['class_name'] = [x[1] for x in res]
-    
-    return final_df.astype(str)
-
-# ==========================================
-# 2. 輔助與規則判定
-# ==========================================
-def is_locked_time(day, period, subject="", class_name=""):
-    # 1. 全校鎖定
-    if day == "三" and str(period) in ["5", "6", "7"]:
-        return True
-    
-    # 2. 閩南語不可調
-    if "閩南語" in subject:
-        return True
-    
-    # 3. 高一1~高一8 週四第7節不可調
-    if day == "四" and str(period) == "7":
-        if class_name and "高一" in class_name:
-            suffix = class_name.replace("高一", "").strip()
-            if suffix.isdigit():
-                num = int(suffix)
-                if 1 <= num <= 8:
-                    return True
-
-    return False
-
-def determine_domain(teacher_name, df):
-    manual_fix = {
-        "王安順": "自然",
-        "黃琮琪": "自然",
-    }
-    if teacher_name in manual_fix: return manual_fix[teacher_name]
-
-    subjects = df[(df['teacher'] == teacher_name) & (df['subject'] != "")]['subject'].unique()
-    all_subjects_str = "".join([str(s) for s in subjects])
-    
-    domain_map = {
-        "國文": ["國文", "國語", "閱讀", "寫作", "語文"],
-        "英文": ["英文", "英語", "English", "聽講"],
-        "數學": ["數學", "數A", "數B", "幾何", "微積分", "補強"],
-        "自然": ["物理", "化學", "生物", "地科", "科學", "探究", "實驗", "理化"],
-        "社會": ["歷史", "地理", "公民", "社會", "經濟", "心理"],
-        "健體": ["體育", "健康", "護理", "運動"],
-        "藝能": ["美術", "音樂", "藝術", "表演", "繪畫"],
-        "科技": ["資訊", "生活科技", "生科", "程式", "電腦", "機器人"],
-        "國防": ["國防", "軍訓"],
-        "特教": ["特教", "資源", "特殊"],
-        "綜合": ["班會", "週會", "輔導", "彈性", "自主", "團體"]
-    }
-    
-    scores = {domain: 0 for domain in domain_map}
-    for domain, keywords in domain_map.items():
-        for kw in keywords:
-            if kw in all_subjects_str:
-                scores[domain] += all_subjects_str.count(kw)
-    
-    best_domain = max(scores, key=scores.get)
-    if scores[best_domain] == 0:
-        return "其他" if len(all_subjects_str) > 0 else "未知"
-    return best_domain
-
-# ==========================================
-# 3. 彈出視窗與通知單
+# 1. 彈出視窗與通知單
 # ==========================================
 
 @st.dialog("課程互換與通知單", width="large")
-def show_swap_dialog(teacher_b, b_row, teacher_a, source_info, full_df):
+@profiled("dialog.swap")
+def show_swap_dialog(teacher_b, b_row, teacher_a, source_info, index):
     st.subheader(f"🤝 與 {teacher_b} 老師的互換詳情")
     
     st.markdown(f"**{teacher_b} 老師的課表：**")
-    b_df = full_df[full_df['teacher'] == teacher_b]
-    pivot = b_df.pivot(index='period', columns='day', values='content')
-    pivot = pivot.reindex([str(i) for i in range(1,9)]).reindex(columns=["一","二","三","四","五"]).fillna("")
-    
-    def highlight_cells(val, r, c):
-        if r == b_row['還課節次'] and c == b_row['還課星期']:
-            return 'background-color: #ffcccc; color: darkred; font-weight: bold'
-        return ''
+    pivot = index.pivot(teacher_b)
+    styles = highlight_styles([(b_row['還課星期'], b_row['還課節次'])], 'background-color: #ffcccc; color: darkred; font-weight: bold')
 
-    st.dataframe(pivot.style.apply(lambda x: pd.DataFrame([[highlight_cells(x.iloc[i,j], pivot.index[i], pivot.columns[j]) for j in range(5)] for i in range(8)], index=pivot.index, columns=pivot.columns), axis=None), use_container_width=True)
+    with stage("styler"):
+        st.dataframe(pivot.style.apply(lambda _: styles, axis=None), use_container_width=True)
 
     st.divider()
 
@@ -227,30 +69,26 @@ def show_swap_dialog(teacher_b, b_row, teacher_a, source_info, full_df):
         st.write("")
         enable_date = st.checkbox("加入日期顯示", value=False)
     
+    # 預設為今天起最近一次照該星期上課的日期 (已排除放假與補課日)
+    calendar = current_calendar()
+    today = datetime.date.today()
     with col_da:
-        date_a = st.date_input(f"我 (A) 調出的日期 (週{src_day})", datetime.date.today())
+        date_a = st.date_input(f"我 (A) 調出的日期 (週{src_day})", calendar.next_date(src_day, today) or today)
     
     with col_db:
-        date_b = st.date_input(f"對方 (B) 還課的日期 (週{tgt_day})", datetime.date.today())
+        date_b = st.date_input(f"對方 (B) 還課的日期 (週{tgt_day})", calendar.next_date(tgt_day, today) or today)
 
     if enable_date:
-        str_src_time = f"{date_a.strftime('%Y/%m/%d')} (星期{src_day} 第{src_per}節)"
-        str_tgt_time = f"{date_b.strftime('%Y/%m/%d')} (星期{tgt_day} 第{tgt_per}節)"
-    else:
-        str_src_time = f"星期{src_day} 第{src_per}節"
-        str_tgt_time = f"星期{tgt_day} 第{tgt_per}節"
-
-    note_content = f"""{b_name_only} 老師您好：
+        for who, date, day, per in (("A 調出", date_a, src_day, src_per), ("B 還課", date_b, tgt_day, tgt_per)):
+            view = calendar.day(date)
+            if view.day != day:
+                st.warning(f"{who}的日期 {date} 不是照星期{day}上課" + (f" (當天照星期{view.day}的課表)" if view.day else " (當天不上課)"))
+            elif not view.is_open(per):
+                st.warning(f"{who}的日期 {date} 第{per}節停止調代課：{'、'.join(view.notes)}")
 
-希望 {str_tgt_time} {tgt_cls} ({tgt_subj}) 可以跟您換 {str_src_time} {src_cls} ({src_subj})
-
-您上 {str_src_time} {src_cls}
-我上 {str_tgt_time} {tgt_cls}
-
-感謝您的協助！
-敬祝平安
-                                                {a_name_only}
-"""
+    str_src_time = slot_time(src_day, src_per, date_a if enable_date else None)
+    str_tgt_time = slot_time(tgt_day, tgt_per, date_b if enable_date else None)
+    note_content = swap_notice(b_name_only, a_name_only, (str_src_time, src_cls, src_subj), (str_tgt_time, tgt_cls, tgt_subj))["text"]
 
     st.subheader("📝 調課通知單 (可編輯)")
     final_note = st.text_area("內容預覽", value=note_content, height=250)
@@ -286,8 +124,15 @@ def show_swap_dialog(teacher_b, b_row, teacher_a, source_info, full_df):
         if st.button("關閉視窗", use_container_width=True):
             st.rerun()
 
+    # 未勾選日期時視為每週固定互換
+    moves = swap_moves(a_name_only, b_name_only, (src_day, src_per), (tgt_day, tgt_per),
+                       date_a if enable_date else None, date_b if enable_date else None)
+    if st.button("✅ 確認互換並記錄到課表", use_container_width=True, type="primary"):
+        record_moves("swap", moves, f"{a_name_only} ⇄ {b_name_only}")
+
 @st.dialog("多角調課詳細路徑圖", width="large")
-def show_multi_path_visual(path_list, full_df):
+@profiled("dialog.cycle")
+def show_multi_path_visual(path_list, index):
     st.subheader("👁️ 循環調課視覺化")
     st.info("橘色底標示為「本次調動涉及的時段」。")
 
@@ -321,27 +166,55 @@ def show_multi_path_visual(path_list, full_df):
 
     for tea in unique_teachers:
         st.markdown(f"#### 👤 {tea}")
-        t_df = full_df[full_df['teacher'] == tea]
-        pivot = t_df.pivot(index='period', columns='day', values='content')
-        pivot = pivot.reindex([str(i) for i in range(1,9)]).reindex(columns=["一","二","三","四","五"]).fillna("")
+        pivot = index.pivot(tea)
 
-        points_to_color = highlight_map.get(tea, [])
-        
-        def highlight_target(val, r, c, points):
-            if (c, r) in points:
-                return 'background-color: #ffcc99; color: black; font-weight: bold; border: 2px solid orange;'
-            return ''
-
-        st.dataframe(
-            pivot.style.apply(lambda x: pd.DataFrame([[highlight_target(x.iloc[i,j], pivot.index[i], pivot.columns[j], points_to_color) for j in range(5)] for i in range(8)], index=pivot.index, columns=pivot.columns), axis=None), 
-            use_container_width=True,
-            height=300 
-        )
+        styles = highlight_styles(highlight_map.get(tea, []), 'background-color: #ffcc99; color: black; font-weight: bold; border: 2px solid orange;')
+
+        with stage("styler"):
+            st.dataframe(
+                pivot.style.apply(lambda _: styles, axis=None), 
+                use_container_width=True,
+                height=300 
+            )
         st.write("⬇️")
     
     st.write("(循環完成)")
-    if st.button("關閉", use_container_width=True):
-        st.rerun()
+
+    st.divider()
+    st.markdown("#### 📄 批次產生通知單 (每一步一張)")
+    col_chk, col_mon = st.columns([1, 2])
+    with col_chk:
+        with_dates = st.checkbox("加入日期", value=False, key="cycle_notice_dates")
+    with col_mon:
+        today = datetime.date.today()
+        monday = st.date_input("調課當週的星期一", today - datetime.timedelta(days=today.weekday()), key="cycle_notice_monday", disabled=not with_dates)
+    notices = cycle_notices(path_list, index, path_list[0]['from'], monday if with_dates else None)
+    notice_downloads(notices, "多角調通知單", "cycle_notice")
+
+    col_rec, col_close = st.columns(2)
+    with col_rec:
+        if st.button("✅ 確認並記錄此循環", use_container_width=True, type="primary"):
+            chain = " ➔ ".join([path_list[0]['from']] + [step['to'] for step in path_list])
+            record_moves("cycle", cycle_moves(path_list, monday if with_dates else None), chain)
+    with col_close:
+        if st.button("關閉", use_container_width=True):
+            st.rerun()
+
+def record_moves(kind, moves, note):
+    # 寫入異動紀錄後重跑：有效課表改變，先前的查詢結果一併清除
+    default_ledger.record(st.session_state.ledger_scope, kind, moves, note, st.session_state.data_key)
+    reset_results()
+    st.rerun()
+
+def notice_downloads(notices, title, key):
+    # 按下時才產生檔案 (HTML 可直接列印；ZIP 內含每張通知單的文字檔與合併 HTML)
+    col_h, col_z = st.columns(2)
+    with col_h:
+        st.download_button(f"🖨️ 下載可列印 HTML ({len(notices)} 張)", data=lambda: spooled(write_html, notices, title),
+                           file_name=f"{title}.html", mime="text/html", key=f"{key}_html", on_click="ignore", use_container_width=True)
+    with col_z:
+        st.download_button("🗜️ 下載 ZIP", data=lambda: spooled(write_zip, notices, title),
+                           file_name=f"{title}.zip", mime="application/zip", key=f"{key}_zip", on_click="ignore", use_container_width=True)
 
 @st.dialog("搜尋結果", width="small")
 def show_no_result_dialog():
@@ -352,64 +225,136 @@ def show_no_result_dialog():
     if st.button("知道了", use_container_width=True):
         st.rerun()
 
+def render_cycle_paths(found_paths, who_a, first_content, index, key_prefix="btn"):
+    paths_by_len = defaultdict(list)
+    for p_list in found_paths:
+        paths_by_len[len(p_list)].append(p_list)
+    
+    for length in sorted(paths_by_len.keys()):
+        st.subheader(f"🔄 {length} 人循環調課")
+        
+        for idx, p_list in enumerate(paths_by_len[length]):
+            with st.container(border=True):
+                c_info, c_btn = st.columns([5, 1])
+                
+                persons = [who_a] + [step['to'] for step in p_list]
+                chain_str = " ➔ ".join(persons)
+                
+                desc_list = []
+                # 第一步
+                desc_list.append(f"<b>1. {who_a}</b> 釋出 週{p_list[0]['day']}{p_list[0]['period']} ({first_content})")
+                # 中間步
+                for i in range(1, len(p_list)):
+                    step = p_list[i]
+                    prev_person = p_list[i-1]['to']
+                    desc_list.append(f"<b>{i+1}. {prev_person}</b> 釋出 週{step['day']}{step['period']} ({step['content']})")
+                
+                final_desc = "  ➡️  ".join(desc_list)
+                
+                with c_info:
+                    st.markdown(f"**{chain_str}**")
+                    st.markdown(final_desc, unsafe_allow_html=True)
+                
+                with c_btn:
+                    if st.button("👁️ 檢視", key=f"{key_prefix}_{length}_{idx}"):
+                        show_multi_path_visual(p_list, index)
+
+@st.fragment(run_every=0.3)
+def show_search_progress(job, index):
+    # 搜尋進行中時定期重繪，完成後觸發整頁重跑以顯示最終結果
+    if not job.running:
+        st.rerun()
+    results = list(job.results)
+    progress = f"，{job.progress}" if job.progress else ""
+    st.info(f"🔍 搜尋中... 已展開 {job.nodes} 個節點，找到 {len(results)} 條循環 ({job.elapsed:.1f} 秒{progress})")
+    if st.button("⏹️ 取消搜尋", key="t4_cancel"):
+        job.cancel()
+    if results:
+        render_cycle_paths(results, job.meta["who_a"], job.meta["first_content"], index, key_prefix="live")
+
 # ==========================================
-# 4. 主程式 UI
+# 2. 主程式 UI
 # ==========================================
-def main():
+def current_calendar():
+    try:
+        return load_calendar()
+    except ValueError as e:
+        st.sidebar.error(f"行事曆設定檔有誤，暫不套用：{e}")
+        return SchoolCalendar()
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def reset_results():
+    st.session_state.swap_results = None
+    st.session_state.multi_swap_paths = None
+    st.session_state.absence_plan = None
+    if st.session_state.multi_job is not None:
+        st.session_state.multi_job.cancel()
+        st.session_state.multi_job = None
+
+def render_app():
     st.title("🏫 成德高中 智慧調代課系統 v40")
     
-    if 'data_loaded' not in st.session_state: st.session_state.data_loaded = False
+    if 'data_key' not in st.session_state: st.session_state.data_key = None
     if 'swap_results' not in st.session_state: st.session_state.swap_results = None
     if 'multi_swap_paths' not in st.session_state: st.session_state.multi_swap_paths = None
+    if 'multi_job' not in st.session_state: st.session_state.multi_job = None
+    if 'absence_plan' not in st.session_state: st.session_state.absence_plan = None
     
     with st.sidebar:
         st.header("步驟 1：匯入資料")
-        uploaded_file = st.file_uploader("上傳欣河 CSV", type=["csv", "xls", "xlsx"])
-
-    if uploaded_file:
-        if not st.session_state.data_loaded:
-            with st.spinner("解析欣河系統格式..."):
-                df = parse_xinhe_csv(uploaded_file)
-                st.session_state.df = df
-                st.session_state.data_loaded = True
+        uploaded_file = st.file_uploader("上傳欣河課表 (CSV、Excel 或 PDF)", type=["csv", "xls", "xlsx", "pdf"])
+
+    # 課表與衍生資料由全行程共用，session 只記住 data_key；沒有上傳檔案時使用全校發布的課表
+    session_id = current_session_id()
+    published = None if uploaded_file else registry.open_published(session_id)
+    if uploaded_file or published is not None:
+        tt = published
+        if uploaded_file:
+            data = uploaded_file.getvalue()
+            data_key = content_key(data)
+            try:
+                if st.session_state.data_key != data_key:
+                    with st.spinner("解析欣河系統格式..."):
+                        tt = registry.open(session_id, data, data_key)
+                else:
+                    tt = registry.open(session_id, data, data_key)
+            except ValueError:
+                pass
         else:
-            df = st.session_state.df
+            st.sidebar.caption("📢 目前使用全校發布的課表")
+
+        if tt is not None and st.session_state.data_key != tt.derived.key:
+            # 換了資料集 (上傳新檔或全校課表更新)：舊的查詢結果不再適用
+            reset_results()
+            st.session_state.data_key = tt.derived.key
         
-        if df.empty:
+        if tt is None:
             st.error("讀取失敗。")
         else:
-            # --- Map Setup ---
-            teacher_domain_map = {}
-            for t in df['teacher'].unique():
-                teacher_domain_map[t] = determine_domain(t, df)
-            teacher_display_map = {t: f"{t} ({d})" for t, d in teacher_domain_map.items()}
-            all_domains = ["全部"] + sorted([d for d in set(teacher_domain_map.values()) if d != "未知"])
-            unique_classes = df['class_name'].unique()
-            clean_classes = sorted([str(c) for c in unique_classes if pd.notna(c) and str(c).strip() != ""])
-            all_teachers_real = sorted(df['teacher'].unique())
-
-            class_teacher_map = {}
-            for cls in clean_classes:
-                if cls:
-                    ts = set(df[df['class_name'] == cls]['teacher'].unique())
-                    class_teacher_map[cls] = ts
-
-            # --- Pre-calculate Availability for Speed ---
-            free_map = {}
-            days = ["一","二","三","四","五"]
-            periods = [str(i) for i in range(1,9)]
-            for d in days:
-                for p in periods:
-                    if is_locked_time(d, p):
-                        free_map[(d,p)] = set()
-                    else:
-                        t_free = set(df[(df['day']==d) & (df['period']==p) & (df['is_free']=="True")]['teacher'].unique())
-                        free_map[(d,p)] = t_free
+            # 套用本週適用的調代課異動 (疊加在共用的原始課表上，不會修改它)
+            # 異動紀錄依學期存放，重新上傳修正過的課表後仍會套用
+            calendar = current_calendar()
+            st.session_state.ledger_scope = ledger_scope(calendar)
+            tt = tt.with_ledger(scope=st.session_state.ledger_scope)
+            show_ledger(st.session_state.ledger_scope, st.session_state.data_key, tt.derived.conflicts)
+
+            # --- Map Setup (每個資料集只計算一次) ---
+            derived = tt.derived
+            index = derived.index
+            teacher_domain_map = derived.teacher_domain_map
+            teacher_display_map = derived.teacher_display_map
+            display_to_teacher = derived.display_to_teacher
+            all_domains = derived.all_domains
+            clean_classes = derived.clean_classes
+            all_teachers_real = derived.all_teachers_real
 
             # ==========================================
             # 導覽列
             # ==========================================
-            nav_options = ["1. 📅 課表檢視", "2. 🚑 尋找空堂", "3. 🔄 雙人互換", "4. 🔀 多角調(測試)"]
+            nav_options = ["1. 📅 課表檢視", "2. 🚑 尋找空堂", "3. 🔄 雙人互換", "4. 🔀 多角調(測試)", "5. 🗓️ 請假代課規劃"]
             selected_nav = st.radio("功能選擇", nav_options, horizontal=True)
 
             if 'last_nav' not in st.session_state:
@@ -417,13 +362,19 @@ def main():
             
             if st.session_state.last_nav != selected_nav:
                 if "3." in st.session_state.last_nav:
-                    keys_to_clear = ["t3_dom", "t3_who", "swap_table"]
+                    keys_to_clear = ["t3_dom", "t3_who", "swap_table", "swap_shown"]
                     for k in keys_to_clear:
                         if k in st.session_state: del st.session_state[k]
                     st.session_state.swap_results = None
                 
                 if "4." in st.session_state.last_nav:
                     st.session_state.multi_swap_paths = None 
+                    if st.session_state.multi_job is not None:
+                        st.session_state.multi_job.cancel()
+                        st.session_state.multi_job = None
+                
+                if "5." in st.session_state.last_nav:
+                    st.session_state.absence_plan = None
                 
                 st.session_state.last_nav = selected_nav
                 st.rerun()
@@ -434,92 +385,116 @@ def main():
                 col_d, col_t = st.columns([1, 2])
                 with col_d: t1_domain = st.selectbox("篩選領域", all_domains, key="t1_dom")
                 with col_t:
-                    t1_opts = sorted(teacher_display_map.values()) if t1_domain == "全部" else sorted([v for k, v in teacher_display_map.items() if teacher_domain_map[k] == t1_domain])
+                    t1_opts = derived.display_options(t1_domain)
                     t_sel_display = st.selectbox("選擇教師", t1_opts, key="t1_who")
 
                 if t_sel_display:
-                    t_real = [k for k, v in teacher_display_map.items() if v == t_sel_display][0]
-                    t_df = df[df['teacher'] == t_real]
-                    pivot = t_df.pivot(index='period', columns='day', values='content')
-                    pivot = pivot.reindex([str(i) for i in range(1,9)]).reindex(columns=["一","二","三","四","五"]).fillna("")
-                    st.dataframe(pivot, use_container_width=True)
+                    t_real = display_to_teacher[t_sel_display]
+                    if derived.domain_result.is_ambiguous(t_real):
+                        scores = derived.domain_result.domain_scores(t_real)
+                        st.caption("⚠️ 領域判定不明確：" + "、".join(f"{d} {v}" for d, v in sorted(scores.items(), key=lambda x: -x[1])))
+                    st.dataframe(index.pivot(t_real), use_container_width=True)
 
             # Page 2: 尋找空堂
             elif "2." in selected_nav:
                 st.subheader("🚑 尋找空堂")
                 st.markdown("#### 1. 設定缺課時段")
+                by_date = st.checkbox("指定日期 (依行事曆換算成當天的課表，並套用該週的調代課異動)", key="t2_by_date")
                 c1, c2 = st.columns(2)
-                q_day = c1.selectbox("缺課星期", ["一","二","三","四","五"])
-                available_p_tab2 = [str(i) for i in range(1,9)]
-                if q_day == "三": available_p_tab2 = [p for p in available_p_tab2 if p not in ["5", "6", "7"]]
-                q_per = c2.selectbox("缺課節次", available_p_tab2)
-                
-                frees = df[(df['day']==q_day) & (df['period']==q_per) & (df['is_free'] == "True")]
+                if by_date:
+                    q_date = c1.date_input("缺課日期", datetime.date.today(), key="t2_date")
+                    view = calendar.day(q_date)
+                    available_p_tab2 = [] if view.day is None else [
+                        p for j, p in enumerate(PERIODS) if not view.closed[j] and not derived.slot_locked[DAYS.index(view.day), j]]
+                    if available_p_tab2:
+                        c1.caption(f"當天照星期{view.day}的課表" + (f" (學期第 {view.week} 週)" if view.week else ""))
+                    else:
+                        c1.warning("這一天不上課或全天停止調代課。")
+                    if view.notes: c1.caption("📆 " + "、".join(view.notes))
+                    q_per = c2.selectbox("缺課節次", available_p_tab2)
+                    q_tt, q_day, q_when = tt.with_ledger(week_of=q_date, scope=st.session_state.ledger_scope), view.day, q_date
+                    frees = q_tt.free_teachers_on(q_date, q_per, calendar) if q_per else []
+                else:
+                    q_day = c1.selectbox("缺課星期", ["一","二","三","四","五"])
+                    available_p_tab2 = [p for j, p in enumerate(PERIODS) if not derived.slot_locked[DAYS.index(q_day), j]]
+                    q_per = c2.selectbox("缺課節次", available_p_tab2)
+
+                    q_tt, q_when = tt, datetime.date.today()
+                    frees = tt.free_teachers(q_day, q_per)
+
+                # 指定缺課教師後，同領域、教過該班的老師排在前面
+                busy_display = sorted(teacher_display_map[t] for t in q_tt.teachers if q_per and q_day and not q_tt.index.is_free(t, q_day, q_per))
+                q_absent_display = st.selectbox("缺課教師 (可選)", busy_display, key="t2_absent", index=None, placeholder="選擇後依同領域、同班級排序...")
+                q_absent = display_to_teacher[q_absent_display] if q_absent_display else None
+                if q_absent: frees = [t for t in frees if t != q_absent]
                 
                 st.divider()
                 st.markdown("#### 2. 篩選空堂名單")
                 c3, c4 = st.columns([1, 2])
                 with c3: t2_domain = st.selectbox("篩選領域 (科別)", all_domains, key="t2_dom")
                 with c4:
-                    available_teachers = sorted(frees['teacher'].unique()) if t2_domain == "全部" else sorted([t for t in frees['teacher'].unique() if teacher_domain_map[t] == t2_domain])
+                    available_teachers = sorted(frees) if t2_domain == "全部" else sorted([t for t in frees if teacher_domain_map[t] == t2_domain])
                     available_display = [teacher_display_map[t] for t in available_teachers]
                     t2_name_filter = st.selectbox("篩選特定教師 (可選)", ["全部顯示"] + available_display, key="t2_who")
 
-                if not frees.empty:
-                    final_frees = frees.copy()
-                    if t2_domain != "全部": final_frees = final_frees[final_frees['teacher'].isin([k for k,v in teacher_domain_map.items() if v==t2_domain])]
+                if frees:
+                    final_frees = frees
+                    if t2_domain != "全部": final_frees = [t for t in final_frees if teacher_domain_map[t] == t2_domain]
                     if t2_name_filter != "全部顯示":
-                        target_real = [k for k, v in teacher_display_map.items() if v == t2_name_filter][0]
-                        final_frees = final_frees[final_frees['teacher'] == target_real]
+                        target_real = display_to_teacher[t2_name_filter]
+                        final_frees = [t for t in final_frees if t == target_real]
 
-                    if not final_frees.empty:
+                    if final_frees:
                         st.success(f"符合條件的空堂教師共 {len(final_frees)} 位：")
-                        final_frees['display_name'] = final_frees['teacher'].map(teacher_display_map)
-                        st.dataframe(final_frees[['display_name']].reset_index(drop=True), use_container_width=True)
+                        # 指定教師時先排完整份空堂名單再篩出該位，否則只會取到排名第一的人
+                        show_all = st.toggle(f"顯示全部 (預設只列前 {TOP_K} 位)", key="t2_show_all") or t2_name_filter != "全部顯示"
+                        ranked, _ = q_tt.rank_free_teachers(q_day, q_per, q_absent, default_ledger, q_when, t2_domain,
+                                                            len(frees) if show_all else TOP_K)
+                        if t2_name_filter != "全部顯示": ranked = ranked[ranked["教師"] == target_real]
+                        st.caption("依代課負擔排序：本週 / 本月已代課越多越後面，同領域、教過該班優先，與自己的課連堂者往後。")
+                        st.dataframe(ranked, use_container_width=True, hide_index=True)
                     else:
                         st.warning("在此篩選條件下，無空堂教師。")
-                else:
+                elif q_per:
                     st.warning("該時段全校皆有課。")
 
             # Page 3: 雙人互換
             elif "3." in selected_nav:
                 st.subheader("🔄 雙人直接調課")
+                with st.expander("📊 全校互換機會總覽", expanded=False):
+                    swap_matrix = derived.swap_matrix()
+                    st.caption("各班可調出的課堂中，找不到任何雙人互換對象的堂數 (卡住的班級排在前面)")
+                    st.dataframe(swap_matrix.class_summary(), use_container_width=True, hide_index=True)
+                    t3_overview_cls = st.selectbox("查看班級明細", ["不指定"] + clean_classes, key="t3_overview_cls")
+                    if t3_overview_cls != "不指定":
+                        st.dataframe(swap_matrix.by_class(t3_overview_cls), use_container_width=True, hide_index=True)
                 col_sub, col_tea = st.columns([1, 2])
                 with col_sub: filter_domain = st.selectbox("1. 篩選領域 (科別)", all_domains, key="t3_dom")
                 with col_tea:
-                    filtered_teachers = sorted(teacher_display_map.values()) if filter_domain == "全部" else sorted([v for k, v in teacher_display_map.items() if teacher_domain_map[k] == filter_domain])
+                    filtered_teachers = derived.display_options(filter_domain)
                     who_a_display = st.selectbox("2. 我是 (A老師)", filtered_teachers, key="t3_who", index=None, placeholder="請選擇您的身分...")
                 
                 if who_a_display:
-                    who_a = [k for k, v in teacher_display_map.items() if v == who_a_display][0]
+                    who_a = display_to_teacher[who_a_display]
                     
                     with st.expander(f"查看 {who_a} 的課表", expanded=False):
-                        a_full_df = df[df['teacher'] == who_a]
-                        a_pivot = a_full_df.pivot(index='period', columns='day', values='content')
-                        a_pivot = a_pivot.reindex([str(i) for i in range(1,9)]).reindex(columns=["一","二","三","四","五"]).fillna("")
-                        st.dataframe(a_pivot, use_container_width=True)
+                        st.dataframe(index.pivot(who_a), use_container_width=True)
                     
                     col_a, col_b = st.columns(2)
                     with col_a:
                         st.info("步驟 1：選擇您要調出的課")
-                        a_busy = df[(df['teacher']==who_a) & (df['is_free'] == "False")]
+                        a_busy = derived.releasable_slots(who_a)
                         src_opts = []
-                        a_src_class_map = {} 
-                        my_teaching_classes = set()
-                        if not a_busy.empty:
-                            for _, r in a_busy.iterrows():
-                                if is_locked_time(r['day'], r['period'], r['subject'], r['class_name']): continue
+                        if a_busy:
+                            for r in a_busy:
                                 opt_str = f"週{r['day']} 第{r['period']}節 | {r['content']}"
                                 src_opts.append(opt_str)
-                                a_src_class_map[opt_str] = r['class_name']
-                                if r['class_name']: my_teaching_classes.add(r['class_name'])
                         sel_src = st.selectbox("我的調出課程", src_opts)
 
                     with col_b:
                         st.info("步驟 2：選擇您想換過去的時間")
-                        a_free = df[(df['teacher']==who_a) & (df['is_free'] == "True") & (df['period'] != '8')]
-                        a_free = a_free[~a_free.apply(lambda x: is_locked_time(x['day'], x['period']), axis=1)]
-                        tgt_opts = ["不指定"] + [f"週{r['day']} 第{r['period']}節" for _, r in a_free.iterrows()]
+                        a_free = derived.receivable_slots(who_a)
+                        tgt_opts = ["不指定"] + [f"週{d} 第{p}節" for d, p in a_free]
                         sel_tgt = st.selectbox("我的調入時間 (空堂)", tgt_opts)
 
                     st.markdown("---")
@@ -527,8 +502,7 @@ def main():
                     col_f1, col_f2, col_f3, col_f4 = st.columns(4)
                     with col_f1: filter_teacher = st.selectbox("指定 B 老師", ["不指定"] + [t for t in all_teachers_real if t != who_a])
                     with col_f2: 
-                        special_class_opt = "⭐ 我的任課班級"
-                        filter_class = st.selectbox("指定 B 的班級", ["不指定", special_class_opt] + clean_classes)
+                        filter_class = st.selectbox("指定 B 的班級", ["不指定", MY_CLASSES] + clean_classes)
                     with col_f3: filter_b_day = st.selectbox("指定 B 的課程星期", ["不指定", "一", "二", "三", "四", "五"])
                     with col_f4: filter_b_per = st.selectbox("指定 B 的課程節次", ["不指定"] + [str(i) for i in range(1,9)])
 
@@ -537,7 +511,6 @@ def main():
                     if sel_src and sel_tgt:
                         s_day = re.search(r"週(.)", sel_src).group(1)
                         s_per = re.search(r"第(\d)", sel_src).group(1)
-                        my_src_class = a_src_class_map.get(sel_src, "")
 
                         if sel_tgt != "不指定":
                             t_day = re.search(r"週(.)", sel_tgt).group(1)
@@ -546,58 +519,21 @@ def main():
                             t_day, t_per = None, None
 
                         if st.button("🔍 搜尋可互換對象"):
-                            cands = df[(df['day']==s_day) & (df['period']==s_per) & (df['is_free'] == "True") & (df['teacher']!=who_a)]
-                            if filter_teacher != "不指定": cands = cands[cands['teacher'] == filter_teacher]
-                            cand_teachers = cands['teacher'].unique()
-                            
-                            results = []
-                            for b in cand_teachers:
-                                if t_day and t_per:
-                                    b_crs = df[(df['teacher']==b) & (df['day']==t_day) & (df['period']==t_per)]
-                                else:
-                                    b_crs = df[(df['teacher']==b) & (df['is_free'] == "False")]
-                                
-                                for _, row_data in b_crs.iterrows():
-                                    if is_locked_time(row_data['day'], row_data['period'], row_data['subject'], row_data['class_name']): continue
-
-                                    if not t_day:
-                                        a_check = a_free[(a_free['day'] == row_data['day']) & (a_free['period'] == row_data['period'])]
-                                        if a_check.empty: continue
-                                    
-                                    if row_data['is_free'] == "True": continue
-
-                                    b_class = row_data['class_name']
-                                    if filter_class == "⭐ 我的任課班級":
-                                        if b_class not in my_teaching_classes: continue
-                                    elif filter_class != "不指定" and b_class != filter_class:
-                                        continue
-
-                                    if filter_b_day != "不指定" and row_data['day'] != filter_b_day: continue
-                                    if filter_b_per != "不指定" and row_data['period'] != filter_b_per: continue
-
-                                    mark = ""
-                                    if my_src_class and b_class and my_src_class == b_class: mark = "⭐"
-                                    
-                                    results.append({
-                                        "標記": mark,
-                                        "教師": b,
-                                        "課程名稱": row_data['subject'],
-                                        "班級": b_class,
-                                        "還課星期": row_data['day'],
-                                        "還課節次": row_data['period'],
-                                        "_sort_score": 1 if mark else 0
-                                    })
-                            
-                            if results:
-                                st.session_state.swap_results = pd.DataFrame(results).sort_values(by='_sort_score', ascending=False).drop(columns=['_sort_score'])
-                            else:
-                                st.session_state.swap_results = pd.DataFrame()
+                            st.session_state.swap_results = tt.swap_candidates(
+                                who_a, s_day, s_per, target=(t_day, t_per) if t_day and t_per else None,
+                                filter_teacher=filter_teacher, filter_class=filter_class,
+                                filter_b_day=filter_b_day, filter_b_per=filter_b_per)
+                            st.session_state.swap_shown = SWAP_PAGE_SIZE
 
                         if st.session_state.swap_results is not None:
                             if not st.session_state.swap_results.empty:
-                                st.success(f"找到 {len(st.session_state.swap_results)} 個可互換方案！")
+                                # 依分數只取出目前要顯示的前幾名，「載入更多」再往下取
+                                results = st.session_state.swap_results
+                                shown = results.top(st.session_state.get("swap_shown", SWAP_PAGE_SIZE))
+                                st.success(f"找到 {len(results)} 個可互換方案！目前顯示最佳的 {len(shown)} 個。")
+                                st.caption("排序：⭐ 同班級、同領域、指定的調入時段優先；互換後 B 當天節數較少、不造成連堂者優先 (分數越低越好)。")
                                 event = st.dataframe(
-                                    st.session_state.swap_results, 
+                                    shown, 
                                     use_container_width=True, 
                                     selection_mode="single-row",
                                     on_select="rerun",
@@ -606,200 +542,205 @@ def main():
                                 )
                                 if len(event.selection.rows) > 0:
                                     selected_idx = event.selection.rows[0]
-                                    selected_row = st.session_state.swap_results.iloc[selected_idx]
-                                    show_swap_dialog(selected_row['教師'], selected_row, who_a_display, sel_src, df)
+                                    selected_row = shown.iloc[selected_idx]
+                                    show_swap_dialog(selected_row['教師'], selected_row, who_a_display, sel_src, index)
+                                if len(shown) < len(results):
+                                    if st.button(f"⬇️ 載入更多 (還有 {len(results) - len(shown)} 個)", key="swap_more"):
+                                        st.session_state.swap_shown = len(shown) + SWAP_PAGE_SIZE
+                                        st.rerun()
                             else:
                                 st.warning("無符合條件的互換對象。")
 
             # Page 4: 多角調
             elif "4." in selected_nav:
                 st.subheader("🔀 多角循環調課 (Beta)")
-                st.info("限制條件：\n1. 必須鎖定在「同一班級」內調動，避免產生空堂。\n2. 最多 4 人互調。\n3. 閩南語及高一週四第7節不可調動。")
+                st.info("限制條件：\n1. 必須鎖定在「同一班級」內調動，避免產生空堂。\n2. 最多 4 人互調。\n3. 鎖定不可調動：" + "、".join(derived.rules.names))
 
                 col_sub4, col_tea4 = st.columns([1, 2])
                 with col_sub4: filter_domain4 = st.selectbox("1. 篩選領域", all_domains, key="t4_dom")
                 with col_tea4:
-                    filtered_teachers4 = sorted(teacher_display_map.values()) if filter_domain4 == "全部" else sorted([v for k, v in teacher_display_map.items() if teacher_domain_map[k] == filter_domain4])
+                    filtered_teachers4 = derived.display_options(filter_domain4)
                     who_a_display4 = st.selectbox("2. 我是 (A老師)", filtered_teachers4, key="t4_who")
 
                 if who_a_display4:
-                    who_a4 = [k for k, v in teacher_display_map.items() if v == who_a_display4][0]
-                    
-                    a_busy4 = df[(df['teacher']==who_a4) & (df['is_free'] == "False")]
-                    a_src_class_map_4 = {} 
+                    who_a4 = display_to_teacher[who_a_display4]
                     
+                    a_busy4 = derived.releasable_slots(who_a4)
                     c_src, c_tgt = st.columns(2)
                     with c_src:
                         st.warning("步驟 1：A 丟出 (給 B)")
                         src_opts4 = []
-                        if not a_busy4.empty:
-                            for _, r in a_busy4.iterrows():
-                                if is_locked_time(r['day'], r['period'], r['subject'], r['class_name']): continue
+                        if a_busy4:
+                            for r in a_busy4:
                                 opt_str = f"週{r['day']} 第{r['period']}節 | {r['content']}"
                                 src_opts4.append(opt_str)
-                                a_src_class_map_4[opt_str] = r['class_name']
                         sel_src4 = st.selectbox("A 丟出的課", src_opts4, key="t4_src")
 
                     with c_tgt:
                         st.success("步驟 2：A 接收 (從 某人)")
-                        a_free4 = df[(df['teacher']==who_a4) & (df['is_free'] == "True") & (df['period'] != '8')]
-                        a_free4 = a_free4[~a_free4.apply(lambda x: is_locked_time(x['day'], x['period']), axis=1)]
-                        tgt_opts4 = ["不指定"] + [f"週{r['day']} 第{r['period']}節" for _, r in a_free4.iterrows()]
+                        a_free4 = derived.receivable_slots(who_a4)
+                        tgt_opts4 = ["不指定"] + [f"週{d} 第{p}節" for d, p in a_free4]
                         sel_tgt4 = st.selectbox("A 想要的空堂", tgt_opts4, key="t4_tgt")
 
+                    with st.expander("⚙️ 進階搜尋設定", expanded=False):
+                        c_depth, c_par, c_workers = st.columns(3)
+                        with c_depth: max_depth4 = st.number_input("搜尋深度", min_value=2, max_value=8, value=MAX_DEPTH, key="t4_depth")
+                        with c_par: use_parallel4 = st.checkbox("多核心平行搜尋", value=False, key="t4_parallel")
+                        with c_workers: workers4 = st.number_input("工作程序數", min_value=1, max_value=64, value=DEFAULT_WORKERS, key="t4_workers", disabled=not use_parallel4)
+
                     st.divider()
 
                     if sel_src4 and sel_tgt4:
                         if st.button("🚀 開始深度搜尋 (Max 60s)"):
                             st.session_state.multi_swap_paths = None
+                            if st.session_state.multi_job is not None:
+                                st.session_state.multi_job.cancel()
                             
-                            with st.status("🔍 全速運算中，請稍候...", expanded=True) as status:
-                                st.write("正在分析空堂與任課班級關係...")
-                                
-                                start_time = time.time()
-                                s_day = re.search(r"週(.)", sel_src4).group(1)
-                                s_per = re.search(r"第(\d)", sel_src4).group(1)
-                                start_class_name = a_src_class_map_4.get(sel_src4, "")
-                                
-                                # 強制鎖定班級：所有交換必須在此班級內發生
-                                target_class_lock = start_class_name 
-                                
-                                target_d, target_p = None, None
-                                if sel_tgt4 != "不指定":
-                                    target_d = re.search(r"週(.)", sel_tgt4).group(1)
-                                    target_p = re.search(r"第(\d)", sel_tgt4).group(1)
-
-                                found_paths = []
-                                max_depth = 4 
-                                
-                                if target_d:
-                                    a_valid_targets = {(target_d, target_p)}
-                                else:
-                                    a_valid_targets = set()
-                                    for _, row in a_free4.iterrows():
-                                        a_valid_targets.add((row['day'], row['period']))
-
-                                def dfs_find_loop(current_teacher, offering_day, offering_period, offering_class, path, visited):
-                                    if time.time() - start_time > 60: return "TIMEOUT"
-                                    if len(path) >= max_depth: return
-
-                                    candidates = free_map.get((offering_day, offering_period), set())
-                                    teachers_of_class = class_teacher_map.get(offering_class, set())
-                                    
-                                    valid_candidates = []
-                                    for c in candidates:
-                                        if c in visited or c == who_a4: continue
-                                        if offering_class and c not in teachers_of_class: continue
-                                        valid_candidates.append(c)
-
-                                    for next_person in valid_candidates:
-                                        next_busy_slots = df[(df['teacher']==next_person) & (df['is_free']=="False")]
-                                        
-                                        for _, row_b in next_busy_slots.iterrows():
-                                            b_out_day = row_b['day']
-                                            b_out_per = row_b['period']
-                                            
-                                            if is_locked_time(b_out_day, b_out_per, row_b['subject'], row_b['class_name']): continue
-                                            
-                                            # V40 重大修正：嚴格檢查釋出的課程是否為同一班級
-                                            if row_b['class_name'] != target_class_lock: continue
-
-                                            if (b_out_day, b_out_per) in a_valid_targets:
-                                                class_returned = row_b['class_name']
-                                                
-                                                # 再次確認收到的班級 (理論上上面已經 filter，但雙重保險)
-                                                if class_returned != target_class_lock: continue
-
-                                                final_step = {
-                                                    'from': next_person,
-                                                    'to': who_a4,
-                                                    'day': b_out_day,
-                                                    'period': b_out_per,
-                                                    'content': row_b['content'],
-                                                    'class': class_returned
-                                                }
-                                                full_path = path + [{
-                                                    'from': current_teacher,
-                                                    'to': next_person,
-                                                    'day': offering_day,
-                                                    'period': offering_period,
-                                                    'content': next_person + " 接手",
-                                                    'class': offering_class
-                                                }, final_step]
-                                                found_paths.append(full_path)
-                                                if len(found_paths) >= 50: return
-
-                                            else:
-                                                if len(path) < max_depth - 1:
-                                                    new_step = {
-                                                        'from': current_teacher,
-                                                        'to': next_person,
-                                                        'day': offering_day,
-                                                        'period': offering_period,
-                                                        'content': row_b['content'],
-                                                        'class': offering_class
-                                                    }
-                                                    dfs_status = dfs_find_loop(
-                                                        next_person, 
-                                                        b_out_day, 
-                                                        b_out_per, 
-                                                        row_b['class_name'],
-                                                        path + [new_step], 
-                                                        visited | {next_person}
-                                                    )
-                                                    if dfs_status == "TIMEOUT": return "TIMEOUT"
-
-                                status_code = dfs_find_loop(who_a4, s_day, s_per, start_class_name, [], {who_a4})
-                                
-                                st.write("整理搜尋結果...")
-                                time.sleep(0.5) 
-                                status.update(label="✅ 搜尋完成", state="complete", expanded=False)
-
-                            if status_code == "TIMEOUT":
-                                st.error("⚠️ 搜尋超時 (超過 60 秒)，顯示已找到的結果...")
+                            s_day = re.search(r"週(.)", sel_src4).group(1)
+                            s_per = re.search(r"第(\d)", sel_src4).group(1)
                             
-                            if found_paths:
-                                st.session_state.multi_swap_paths = found_paths
+                            target4 = None
+                            if sel_tgt4 != "不指定":
+                                target4 = (re.search(r"週(.)", sel_tgt4).group(1), re.search(r"第(\d)", sel_tgt4).group(1))
+
+                            # 背景執行，結果逐條出現在下方，可隨時取消 (所有交換鎖定在 A 調出課程的班級內)
+                            st.session_state.multi_job = tt.start_cycles(
+                                who_a4, s_day, s_per, target4, max_depth=max_depth4, timeout=SEARCH_TIMEOUT,
+                                workers=workers4 if use_parallel4 else None,
+                            )
+
+                        job = st.session_state.multi_job
+                        if job is not None:
+                            if job.running:
+                                show_search_progress(job, index)
                             else:
-                                show_no_result_dialog()
+                                st.session_state.multi_job = None
+                                count("dfs_nodes", job.nodes)
+                                count("cycle_search_ms", round(job.elapsed * 1000))
+                                if job.state == "timeout":
+                                    st.error("⚠️ 搜尋超時 (超過 60 秒)，顯示已找到的結果...")
+                                elif job.state == "cancelled":
+                                    st.warning("⏹️ 已取消搜尋，顯示已找到的結果...")
+                                elif job.state == "error":
+                                    st.error(f"搜尋失敗：{job.error}")
+                                
+                                if job.results:
+                                    st.session_state.multi_swap_paths = list(job.results)
+                                elif job.state != "cancelled":
+                                    show_no_result_dialog()
 
                         if st.session_state.multi_swap_paths:
                             found_paths = st.session_state.multi_swap_paths
                             st.success(f"找到 {len(found_paths)} 條符合「{sel_src4.split('|')[1].strip()}」的循環！")
-                            
-                            paths_by_len = defaultdict(list)
-                            for p_list in found_paths:
-                                paths_by_len[len(p_list)].append(p_list)
-                            
-                            for length in sorted(paths_by_len.keys()):
-                                st.subheader(f"🔄 {length} 人循環調課")
-                                
-                                for idx, p_list in enumerate(paths_by_len[length]):
-                                    with st.container(border=True):
-                                        c_info, c_btn = st.columns([5, 1])
-                                        
-                                        persons = [who_a4] + [step['to'] for step in p_list]
-                                        chain_str = " ➔ ".join(persons)
-                                        
-                                        first_content = sel_src4.split('|')[1].strip()
-                                        desc_list = []
-                                        # 第一步
-                                        desc_list.append(f"<b>1. {who_a4}</b> 釋出 週{p_list[0]['day']}{p_list[0]['period']} ({first_content})")
-                                        # 中間步
-                                        for i in range(1, len(p_list)):
-                                            step = p_list[i]
-                                            prev_person = p_list[i-1]['to']
-                                            desc_list.append(f"<b>{i+1}. {prev_person}</b> 釋出 週{step['day']}{step['period']} ({step['content']})")
-                                        
-                                        final_desc = "  ➡️  ".join(desc_list)
-                                        
-                                        with c_info:
-                                            st.markdown(f"**{chain_str}**")
-                                            st.markdown(final_desc, unsafe_allow_html=True)
-                                        
-                                        with c_btn:
-                                            if st.button("👁️ 檢視", key=f"btn_{length}_{idx}"):
-                                                show_multi_path_visual(p_list, df)
+                            render_cycle_paths(found_paths, who_a4, sel_src4.split('|')[1].strip(), index)
+
+            # Page 5: 請假代課規劃
+            elif "5." in selected_nav:
+                st.subheader("🗓️ 請假代課規劃")
+                st.info("一次排定整段請假期間的所有代課：優先同領域、避免同一位老師當天代太多節或與自己的課連堂。")
+                col_dom5, col_tea5 = st.columns([1, 2])
+                with col_dom5: filter_domain5 = st.selectbox("篩選領域", all_domains, key="t5_dom")
+                with col_tea5:
+                    who_absent_display = st.selectbox("請假教師", derived.display_options(filter_domain5), key="t5_who", index=None, placeholder="請選擇請假教師...")
+
+                if who_absent_display:
+                    who_absent = display_to_teacher[who_absent_display]
+                    today = datetime.date.today()
+                    col_r1, col_r2 = st.columns([2, 1])
+                    with col_r1:
+                        date_range = st.date_input("請假期間", (today, today + datetime.timedelta(days=4)), key="t5_dates")
+                    with col_r2:
+                        max_per_day = st.number_input("每人每天最多代課", min_value=1, max_value=4, value=MAX_PER_DAY, key="t5_max")
+
+                    if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+                        events = [f"{v.date:%m/%d} {'、'.join(v.notes)}" for v in calendar.days_between(*date_range) if v.notes]
+                        if events: st.caption("📆 依行事曆略過：" + "；".join(events))
+                        if st.button("🧮 產生代課安排"):
+                            # 請假期間可能跨週或不在本週：每一週各自套用該週的異動
+                            plan, load = tt.plan_absence(who_absent, date_range[0], date_range[1], max_per_day, calendar,
+                                                         default_ledger, st.session_state.ledger_scope)
+                            st.session_state.absence_plan = (who_absent, plan, load)
+                    else:
+                        st.caption("請選擇開始與結束日期。")
+
+                    if st.session_state.absence_plan is not None and st.session_state.absence_plan[0] == who_absent:
+                        _, plan, load = st.session_state.absence_plan
+                        if plan.empty:
+                            st.warning("請假期間內沒有需要代課的節次。")
+                        else:
+                            uncovered = int((plan["代課教師"] == "").sum())
+                            if uncovered: st.error(f"有 {uncovered} 節找不到可代課的老師，請人工處理。")
+                            else: st.success(f"共 {len(plan)} 節代課已全部排定！")
+                            st.dataframe(plan, use_container_width=True, hide_index=True)
+                            st.markdown("##### 代課負擔")
+                            st.dataframe(load, use_container_width=True, hide_index=True)
+                            st.markdown("##### 📄 代課通知單 (每位代課教師一張)")
+                            notice_downloads(absence_notices(who_absent, plan), f"{who_absent}請假代課通知單", "absence_notice")
+                            if not plan.empty and st.button("✅ 記錄代課安排", type="primary"):
+                                record_moves("substitute", absence_moves(who_absent, plan),
+                                             f"{who_absent} 請假 {plan['日期'].iloc[0]} ~ {plan['日期'].iloc[-1]}")
+
+def show_ledger(scope, data_key, conflicts):
+    elsewhere = default_ledger.recorded_on_other_datasets(scope, data_key)
+    with st.sidebar.expander("📒 調代課異動紀錄", expanded=bool(conflicts or elsewhere)):
+        for c in conflicts:
+            st.warning(f"異動 #{c['group']} 無法套用 (星期{c['day']} 第{c['period']}節)：{c['error']}")
+        if elsewhere:
+            st.info(f"有 {elsewhere} 組異動是在先前上傳的課表上記錄的，已套用到目前的課表，請確認是否仍適用。")
+        groups = default_ledger.groups(scope)
+        if groups.empty:
+            st.caption("尚無異動；在互換 / 多角調 / 代課結果中按「確認」即會記錄並套用到課表。")
+            return
+        st.caption("課表已套用下列異動 (有日期者只影響該週)。")
+        st.dataframe(groups.drop(columns=["已撤銷"]), use_container_width=True, hide_index=True)
+        col_sel, col_btn = st.columns([2, 1])
+        with col_sel:
+            gid = st.selectbox("撤銷異動", groups["編號"], key="ledger_revert", label_visibility="collapsed",
+                               format_func=lambda g: f"#{g}")
+        with col_btn:
+            if st.button("↩️ 撤銷", key="ledger_revert_btn"):
+                default_ledger.revert(scope, int(gid))
+                reset_results()
+                st.rerun()
+
+# ==========================================
+# 3. 效能診斷 (側邊欄開關；關閉時不計時也不寫記錄檔)
+# ==========================================
+DIAG_HISTORY = 10
+
+def show_diagnostics(record):
+    with st.sidebar.expander("🩺 本次執行耗時", expanded=True):
+        st.metric("總耗時", f"{record['total_ms']:.0f} ms")
+        shared = record["registry"]
+        st.caption(f"共用資料集 {shared['datasets']} 份，連線中的 session {shared['sessions']} 個")
+        stages = pd.DataFrame(
+            [{"階段": k, "毫秒": v["ms"], "次數": v["calls"]} for k, v in record["stages"].items()],
+            columns=["階段", "毫秒", "次數"],
+        ).sort_values("毫秒", ascending=False)
+        st.dataframe(stages, use_container_width=True, hide_index=True)
+        if record["counters"]:
+            st.dataframe(pd.DataFrame({"計數器": list(record["counters"]), "數值": list(record["counters"].values())}),
+                         use_container_width=True, hide_index=True)
+        history = st.session_state.diag_history
+        if len(history) > 1:
+            st.caption("最近幾次執行 (ms)")
+            st.line_chart(pd.DataFrame({"總耗時": [r["total_ms"] for r in history]}), height=120)
+
+def main():
+    if not st.session_state.get("diag"):
+        render_app()
+    else:
+        prof = Profiler("app")
+        with prof.activate():
+            with stage("total"):
+                render_app()
+        record = prof.record(page=st.session_state.get("last_nav"), registry=registry.stats())
+        write_log(record)
+        history = st.session_state.setdefault("diag_history", [])
+        history.append(record)
+        del history[:-DIAG_HISTORY]
+        show_diagnostics(record)
+    st.sidebar.toggle("🩺 效能診斷", key="diag", help="顯示各階段耗時，並寫入 .profile/profile.jsonl")
 
 if __name__ == "__main__":
     main()
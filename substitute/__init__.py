@@ -0,0 +1 @@
+# 成德高中 智慧調代課系統：與介面無關的核心模組
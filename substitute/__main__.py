@@ -0,0 +1,5 @@
+import sys
+
+from substitute.cli import main
+
+sys.exit(main())
@@ -0,0 +1,178 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 請假代課規劃：一次排定整段請假期間所有需代課的節次
+# 每個「日期 × 節次」與「代課教師 × 日期 × 當日第幾節代課」之間做最小成本指派，
+# 同一人同一天代越多節成本越高，因此自然會分散給不同教師
+# ==========================================
+MAX_PER_DAY = 2             # 每位教師每天最多代課節數
+COST_DOMAIN = 10.0          # 領域不同
+COST_DAY_LOAD = 1.0         # 當天每多一節 (原有課 + 已排代課)
+COST_WEEK_LOAD = 0.2        # 一週原有節數
+COST_CONSECUTIVE = 3.0      # 與自己的課相鄰 (每一側)
+COST_UNCOVERED = 1000.0     # 無人可代
+BREAKS = {("4", "5")}       # 午休隔開，不算連堂
+_FORBIDDEN = 1e9
+
+
+def min_cost_assignment(cost):
+    # 矩形指派問題 (列數 <= 行數) 的最短擴充路徑解法 (Hungarian / Jonker-Volgenant)
+    # 每列各指派一行、總成本最小；回傳每列對應的行編號
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    if n == 0: return np.empty(0, dtype=int)
+    if n > m: raise ValueError("列數不可多於行數")
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)      # p[j]：指派到第 j 行的列 (1 起算，0 表示未指派)
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0: break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assigned = np.empty(n, dtype=int)
+    cols = np.flatnonzero(p[1:]) + 1
+    assigned[p[cols] - 1] = cols - 1
+    return assigned
+
+
+def absence_dates(start, end, calendar=None):
+    # 期間內的上課日：(日期, 照星期幾上課, 不可代課的節次)；沒有行事曆時為週一到週五
+    if calendar is not None:
+        return [(v.date, v.day, {p for p, c in zip(PERIODS, v.closed) if c}) for v in calendar.teaching_days(start, end)]
+    dates, d = [], start
+    while d <= end:
+        if d.weekday() < len(DAYS): dates.append((d, DAYS[d.weekday()], set()))
+        d += datetime.timedelta(days=1)
+    return dates
+
+
+def is_adjacent(p, q):
+    a, b = sorted((p, q), key=PERIODS.index)
+    return PERIODS.index(b) - PERIODS.index(a) == 1 and (a, b) not in BREAKS
+
+
+def plan_absence(index, free_map, slot_locked, teacher_domain_map, absent, start, end, max_per_day=MAX_PER_DAY,
+                 calendar=None, weeks=None):
+    # 回傳 (代課安排 DataFrame, 代課教師負擔 DataFrame)
+    # weeks：{週一: (index, free_map)} 各週套用調代課異動後的課表；沒有列出的週使用 index / free_map
+    weeks = weeks or {}
+    domain = teacher_domain_map.get(absent, "未知")
+
+    def week_of(date):
+        monday = date - datetime.timedelta(days=date.weekday())
+        return monday, weeks.get(monday, (index, free_map))
+
+    # 1. 需代課的節次：請假期間內該教師有課、且不在全校鎖定時段或行事曆停課 / 停止調代課的節次
+    #    沒有任何人有空的節次仍列入，指派時成為無人可代 (COST_UNCOVERED)
+    needs = []
+    for date, d, closed in absence_dates(start, end, calendar):
+        _, (week_index, _) = week_of(date)
+        for rec in week_index.busy_slots(absent):
+            if rec['day'] != d or rec['period'] in closed: continue
+            if slot_locked[DAYS.index(d), PERIODS.index(rec['period'])]: continue
+            needs.append((date, rec))
+    if not needs: return pd.DataFrame(), pd.DataFrame()
+
+    # 2. 行：每位候選教師在每個日期各有 max_per_day 個名額，第 k 個名額成本遞增
+    n_teachers = len(index.teachers)
+    free_mask = {}      # (週一, 星期, 節次) → 有空的教師
+    for date, rec in needs:
+        monday, (_, week_free) = week_of(date)
+        key = (monday, rec['day'], rec['period'])
+        if key not in free_mask:
+            mask = np.zeros(n_teachers, dtype=bool)
+            mask[[index.teacher_pos[t] for t in week_free.get(key[1:], ())]] = True
+            mask[index.teacher_pos[absent]] = False
+            free_mask[key] = mask
+
+    def free_at(date, rec):
+        return free_mask[(week_of(date)[0], rec['day'], rec['period'])]
+
+    dates = sorted({date for date, _ in needs})
+    col_t, col_date, col_k = [], [], []
+    for di, date in enumerate(dates):
+        cands = np.flatnonzero(np.logical_or.reduce([free_at(dt, rec) for dt, rec in needs if dt == date]))
+        col_t.append(np.repeat(cands, max_per_day))
+        col_date.append(np.full(len(cands) * max_per_day, di))
+        col_k.append(np.tile(np.arange(max_per_day), len(cands)))
+    col_t, col_date, col_k = np.concatenate(col_t), np.concatenate(col_date), np.concatenate(col_k)
+    n_cols = len(col_t)
+
+    # 各項成本：當天負擔、一週負擔、領域不同、與自己的課相鄰 (依各週的課表計算)
+    mismatch = np.array([domain != "未知" and teacher_domain_map.get(t) != domain for t in index.teachers])
+
+    def load_terms(busy):
+        day_load = busy.sum(axis=2)             # [T, 5]
+        week_load = day_load.sum(axis=1)        # [T]
+        adjacent = np.zeros(busy.shape, dtype=int)
+        for i, p in enumerate(PERIODS):
+            for k, q in enumerate(PERIODS):
+                if is_adjacent(p, q): adjacent[:, :, i] += busy[:, :, k]
+        return COST_WEEK_LOAD * week_load + COST_DOMAIN * mismatch, day_load, adjacent
+
+    terms = {}
+    cost = np.full((len(needs), n_cols + len(needs)), _FORBIDDEN)
+    cost[np.arange(len(needs)), n_cols + np.arange(len(needs))] = COST_UNCOVERED
+    for j, (date, rec) in enumerate(needs):
+        monday, (week_index, _) = week_of(date)
+        if monday not in terms: terms[monday] = load_terms(week_index.busy)
+        base, day_load, adjacent = terms[monday]
+        di, pi = DAYS.index(rec['day']), PERIODS.index(rec['period'])
+        ok = (col_date == dates.index(date)) & free_at(date, rec)[col_t]
+        t = col_t[ok]
+        cost[j, np.flatnonzero(ok)] = (base[t] + COST_DAY_LOAD * (day_load[t, di] + col_k[ok])
+                                       + COST_CONSECUTIVE * adjacent[t, di, pi])
+
+    # 3. 指派並整理結果
+    assigned = min_cost_assignment(cost)
+    rows, load = [], {}
+    for (date, rec), c in zip(needs, assigned):
+        covered = c < n_cols
+        t = index.teachers[col_t[c]] if covered else ""
+        if covered: load[t] = load.get(t, 0) + 1
+        rows.append({
+            "日期": date.isoformat(),
+            "星期": rec['day'],
+            "節次": rec['period'],
+            "課程": rec['content'],
+            "班級": rec['class_name'],
+            "代課教師": t,
+            "領域": teacher_domain_map.get(t, "") if covered else "",
+            "同領域": "✔" if covered and domain != "未知" and teacher_domain_map.get(t) == domain else "",
+            "成本": round(float(cost[len(rows), c]), 1),
+        })
+    plan = pd.DataFrame(rows)
+    week_load = index.busy.sum(axis=(1, 2))
+    summary = pd.DataFrame(
+        [{"代課教師": t, "代課節數": n, "原有節數": int(week_load[index.teacher_pos[t]])} for t, n in load.items()]
+    )
+    if not summary.empty: summary = summary.sort_values(["代課節數", "原有節數"], ascending=[False, True])
+    return plan, summary.reset_index(drop=True)
@@ -0,0 +1,186 @@
+import datetime
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from substitute.absence_plan import MAX_PER_DAY, plan_absence
+from substitute.cycle_search import MAX_DEPTH, MAX_RESULTS, CycleSearch
+from substitute.derived import derived_for
+from substitute.ledger import overlay_for, week_start
+from substitute.parallel_search import parallel_find_cycles
+from substitute.parse_cache import cached_parse, content_key
+from substitute.profiling import count, stage
+from substitute.ranking import TOP_K, load_periods, rank_candidates
+from substitute.search_jobs import start_cycle_search
+from substitute.swap_search import ANY, rank_direct_swaps
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 不依賴 Streamlit 的程式介面：載入課表、找空堂、雙人互換、多角調、請假代課規劃
+# 網頁與命令列 (python -m substitute) 都透過這裡呼叫引擎
+# ==========================================
+SEARCH_TIMEOUT = 60
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)): return bytes(source)
+    if isinstance(source, (str, Path)): return Path(source).read_bytes()
+    return source.read()
+
+
+class Timetable:
+    def __init__(self, derived):
+        self.derived = derived
+        self.index = derived.index
+
+    @classmethod
+    def load(cls, source, key=None, rules=None):
+        # source：檔案路徑、bytes 或檔案物件；相同內容只解析一次
+        data = _read_bytes(source)
+        key = key or content_key(data)
+        _, df = cached_parse(data, key)
+        if df.empty: raise ValueError("讀取失敗：檔案中找不到任何課程資料")
+        return cls(derived_for(key, df, rules))
+
+    def with_ledger(self, ledger=None, week_of=None, scope=None):
+        # 套用異動紀錄後的有效課表 (scope 學期、week_of 所在那一週；沒有異動時就是原本的課表)
+        return Timetable(overlay_for(self.derived, ledger, week_of, scope))
+
+    # --- 基本資料 ---
+    @property
+    def teachers(self):
+        return self.derived.all_teachers_real
+
+    @property
+    def classes(self):
+        return self.derived.clean_classes
+
+    def domain_of(self, teacher):
+        return self.derived.teacher_domain_map.get(teacher, "未知")
+
+    def _check_teacher(self, teacher):
+        if teacher not in self.index.teacher_pos: raise ValueError(f"找不到教師：{teacher}")
+
+    def _check_target(self, teacher, target):
+        # A 指定的調入時段必須是 A 可接收的空堂 (有課、第 8 節或全校鎖定時段都不行)
+        if not target: return None
+        target = (target[0], str(target[1]))
+        if target not in self.derived.receivable_slots(teacher):
+            raise ValueError(f"{teacher} 週{target[0]} 第{target[1]}節不是可換入的空堂")
+        return target
+
+    def schedule(self, teacher):
+        self._check_teacher(teacher)
+        return self.index.pivot(teacher).copy()
+
+    # --- 尋找空堂 ---
+    def free_teachers(self, day, period, domain="全部"):
+        if day not in DAYS or str(period) not in PERIODS: raise ValueError(f"時段不正確：週{day} 第{period}節")
+        with stage("query.free"):
+            frees = self.index.free_teachers(day, str(period))
+        if domain != "全部": frees = [t for t in frees if self.domain_of(t) == domain]
+        return frees
+
+    def free_teachers_on(self, date, period, calendar, domain="全部"):
+        # 指定日期：依行事曆換成當天照哪一天的課表；放假或停止調代課時沒有人可接
+        if str(period) not in PERIODS: raise ValueError(f"節次不正確：{period}")
+        view = calendar.day(date)
+        if not view.is_open(period): return []
+        return self.free_teachers(view.day, period, domain)
+
+    def rank_free_teachers(self, day, period, absent=None, ledger=None, date=None, domain="全部", k=TOP_K):
+        # 依代課負擔排序的前 k 位空堂教師；ledger 有給時計入 date 所在週 / 月已記錄的代課節數
+        frees = [t for t in self.free_teachers(day, period, domain) if t != absent]
+        week_subs = month_subs = None
+        if ledger is not None:
+            monday, sunday, first, last = load_periods(date or datetime.date.today())
+            week_subs = ledger.substitution_loads(monday, sunday)
+            month_subs = ledger.substitution_loads(first, last)
+        with stage("query.rank"):
+            return rank_candidates(self.index, self.derived.teacher_domain_map, frees, day, period, absent,
+                                   week_subs, month_subs, k)
+
+    # --- 雙人互換 ---
+    def direct_swaps(self, teacher, day, period, target=None, filter_teacher=ANY, filter_class=ANY,
+                     filter_b_day=ANY, filter_b_per=ANY):
+        # 全部互換方案 (依分數排序) 的 DataFrame
+        return self.swap_candidates(teacher, day, period, target, filter_teacher, filter_class,
+                                    filter_b_day, filter_b_per).all()
+
+    def swap_candidates(self, teacher, day, period, target=None, filter_teacher=ANY, filter_class=ANY,
+                        filter_b_day=ANY, filter_b_per=ANY):
+        # 回傳 SwapResults：用 top(k) 逐批取得分數最佳的方案
+        self._check_teacher(teacher)
+        releasable = self.derived.releasable_slots(teacher)
+        src = [r for r in releasable if r['day'] == day and r['period'] == str(period)]
+        if not src: raise ValueError(f"{teacher} 週{day} 第{period}節沒有可調出的課")
+        target = self._check_target(teacher, target)
+        my_classes = {r['class_name'] for r in releasable if r['class_name']}
+        matrix = self.derived.swap_matrix()
+        with stage("query.swaps"):
+            return rank_direct_swaps(
+                matrix, teacher, day, str(period), target=target,
+                filter_teacher=filter_teacher, filter_class=filter_class, my_classes=my_classes,
+                filter_b_day=filter_b_day, filter_b_per=filter_b_per, my_src_class=src[0]['class_name'],
+                domain_map=self.derived.teacher_domain_map)
+
+    # --- 多角調 ---
+    def _cycle_args(self, teacher, day, period, target):
+        # 所有交換鎖定在 A 調出課程的班級內；未指定調入時段時 A 的所有可接收空堂皆可收尾
+        self._check_teacher(teacher)
+        src = [r for r in self.derived.releasable_slots(teacher) if r['day'] == day and r['period'] == str(period)]
+        if not src: raise ValueError(f"{teacher} 週{day} 第{period}節沒有可調出的課")
+        target = self._check_target(teacher, target)
+        valid_targets = {target} if target else set(self.derived.receivable_slots(teacher))
+        return self.derived.cycle_graph(src[0]['class_name']), valid_targets, src[0]
+
+    def find_cycles(self, teacher, day, period, target=None, max_depth=MAX_DEPTH, max_results=MAX_RESULTS,
+                    timeout=SEARCH_TIMEOUT, workers=None):
+        # 回傳 (循環清單, 是否超時)；workers 不為 None 時使用多行程平行搜尋
+        graph, valid_targets, _ = self._cycle_args(teacher, day, period, target)
+        deadline = time.monotonic() + timeout if timeout else None
+        with stage("query.cycles"):
+            if workers is not None:
+                paths, timed_out, nodes = parallel_find_cycles(
+                    graph, teacher, day, str(period), valid_targets, max_depth, max_results, deadline, workers)
+            else:
+                search = CycleSearch(graph, teacher, day, str(period), valid_targets, max_depth)
+                paths, timed_out = search.run(max_results, deadline)
+                nodes = search.nodes
+        count("dfs_nodes", nodes)
+        return paths, timed_out
+
+    def start_cycles(self, teacher, day, period, target=None, max_depth=MAX_DEPTH, max_results=MAX_RESULTS,
+                     timeout=SEARCH_TIMEOUT, workers=None):
+        # 背景搜尋，回傳 SearchJob (結果逐條出現、可取消)
+        graph, valid_targets, src = self._cycle_args(teacher, day, period, target)
+        deadline = time.monotonic() + timeout if timeout else None
+        return start_cycle_search(
+            graph, teacher, day, str(period), valid_targets, max_depth=max_depth, max_results=max_results,
+            deadline=deadline, workers=workers, meta={"who_a": teacher, "first_content": src['content']})
+
+    # --- 請假代課規劃 ---
+    def plan_absence(self, teacher, start, end, max_per_day=MAX_PER_DAY, calendar=None, ledger=None, scope=None):
+        # ledger 有給時，期間內每一週各自套用該週的調代課異動
+        self._check_teacher(teacher)
+        weeks = {}
+        if ledger is not None:
+            monday = week_start(start)
+            while monday <= end:
+                overlay = overlay_for(self.derived, ledger, monday, scope)
+                weeks[monday] = (overlay.index, overlay.free_map)
+                monday += datetime.timedelta(days=7)
+        with stage("query.plan"):
+            return plan_absence(self.index, self.derived.free_map, self.derived.slot_locked,
+                                self.derived.teacher_domain_map, teacher, start, end, max_per_day, calendar, weeks)
+
+
+def load_timetable(source, key=None, rules=None):
+    return Timetable.load(source, key, rules)
+
+
+def cycles_to_frame(paths):
+    # 多角調結果攤平成表格：每一步一列
+    rows = [{"循環": i + 1, "步驟": j + 1, **step} for i, path in enumerate(paths) for j, step in enumerate(path)]
+    return pd.DataFrame(rows, columns=["循環", "步驟", "from", "to", "day", "period", "content", "class"])
@@ -0,0 +1,141 @@
+import argparse
+import datetime
+import json
+import sys
+
+import pandas as pd
+
+from substitute.absence_plan import MAX_PER_DAY
+from substitute.api import SEARCH_TIMEOUT, cycles_to_frame, load_timetable
+from substitute.cycle_search import MAX_DEPTH, MAX_RESULTS
+from substitute.notices import absence_notices, cycle_notices, write_html, write_zip
+from substitute.rules import LockRules
+from substitute.school_calendar import SchoolCalendar, load_calendar
+from substitute.swap_search import ANY, MY_CLASSES
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 命令列：python -m substitute <指令> <課表檔> [選項]
+#   free    某時段有空堂的教師
+#   swaps   雙人互換
+#   cycles  多角調
+#   plan    請假代課規劃
+# 輸出 JSON (預設) 或 CSV，不會載入 Streamlit
+# ==========================================
+
+
+def _date(s):
+    return datetime.date.fromisoformat(s)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m substitute", description="智慧調代課系統 (命令列版)")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("file", help="欣河系統匯出的課表 (CSV、xlsx 或 PDF)")
+    common.add_argument("--format", choices=["json", "csv"], default="json", help="輸出格式")
+    common.add_argument("-o", "--output", help="輸出檔案 (預設為標準輸出)")
+    common.add_argument("--rules", help="鎖定規則設定檔 (預設 lock_rules.json)")
+    common.add_argument("--calendar", help="行事曆設定檔；plan 與 free --date 依此略過放假與停止調代課的節次")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("free", parents=[common], help="某時段有空堂的教師")
+    p.add_argument("--day", choices=DAYS, help="星期 (或改用 --date 指定日期)")
+    p.add_argument("--date", type=_date, help="YYYY-MM-DD；依行事曆換算成當天的課表")
+    p.add_argument("--period", required=True, choices=PERIODS)
+    p.add_argument("--domain", default="全部")
+
+    def slot_args(p):
+        p.add_argument("--teacher", required=True, help="A 老師")
+        p.add_argument("--day", required=True, choices=DAYS, help="A 調出課程的星期")
+        p.add_argument("--period", required=True, choices=PERIODS, help="A 調出課程的節次")
+        p.add_argument("--target-day", choices=DAYS, help="A 想換過去的星期 (與 --target-period 一起使用)")
+        p.add_argument("--target-period", choices=PERIODS)
+
+    p = sub.add_parser("swaps", parents=[common], help="雙人互換")
+    slot_args(p)
+    p.add_argument("--with-teacher", default=ANY, help="指定 B 老師")
+    p.add_argument("--class", dest="filter_class", default=ANY, help=f"指定 B 的班級，或「{MY_CLASSES}」")
+    p.add_argument("--b-day", default=ANY, choices=[ANY] + DAYS)
+    p.add_argument("--b-period", default=ANY, choices=[ANY] + PERIODS)
+
+    p = sub.add_parser("cycles", parents=[common], help="多角調")
+    slot_args(p)
+    p.add_argument("--depth", type=int, default=MAX_DEPTH)
+    p.add_argument("--max-results", type=int, default=MAX_RESULTS)
+    p.add_argument("--timeout", type=float, default=SEARCH_TIMEOUT, help="秒")
+    p.add_argument("--workers", type=int, help="平行搜尋的工作程序數 (不指定則單一行程)")
+    p.add_argument("--notices", help="輸出第 --path 條循環的通知單 (.html 或 .zip)")
+    p.add_argument("--path", type=int, default=1, help="要產生通知單的循環編號 (從 1 開始)")
+
+    p = sub.add_parser("plan", parents=[common], help="請假代課規劃")
+    p.add_argument("--teacher", required=True, help="請假教師")
+    p.add_argument("--start", type=_date, required=True, help="YYYY-MM-DD")
+    p.add_argument("--end", type=_date, required=True, help="YYYY-MM-DD")
+    p.add_argument("--max-per-day", type=int, default=MAX_PER_DAY)
+    p.add_argument("--notices", help="輸出代課通知單 (.html 或 .zip)")
+    return parser
+
+
+def _target(args):
+    if bool(args.target_day) != bool(args.target_period):
+        raise ValueError("--target-day 與 --target-period 必須一起指定")
+    return (args.target_day, args.target_period) if args.target_day else None
+
+
+def save_notices(notices, path, title):
+    if not notices:
+        print("沒有需要發送的通知單，未輸出檔案", file=sys.stderr)
+        return
+    write = write_zip if path.lower().endswith(".zip") else write_html
+    with open(path, "wb") as f:
+        write(notices, f, title)
+
+
+def run(args):
+    # 回傳 (JSON 物件, CSV 用的 DataFrame)
+    rules = LockRules.from_file(args.rules) if args.rules else None
+    tt = load_timetable(args.file, rules=rules)
+    calendar = SchoolCalendar.from_file(args.calendar) if args.calendar else None
+    if args.command == "free":
+        if bool(args.day) == bool(args.date): raise ValueError("--day 與 --date 須指定其中一個")
+        if args.date:
+            frees = tt.free_teachers_on(args.date, args.period, calendar or load_calendar(), args.domain)
+        else:
+            frees = tt.free_teachers(args.day, args.period, args.domain)
+        frame = pd.DataFrame({"教師": frees, "領域": [tt.domain_of(t) for t in frees]})
+        return frame.to_dict("records"), frame
+    if args.command == "swaps":
+        frame = tt.direct_swaps(args.teacher, args.day, args.period, _target(args), filter_teacher=args.with_teacher,
+                                filter_class=args.filter_class, filter_b_day=args.b_day, filter_b_per=args.b_period)
+        return frame.to_dict("records"), frame
+    if args.command == "cycles":
+        paths, timed_out = tt.find_cycles(args.teacher, args.day, args.period, _target(args), args.depth,
+                                          args.max_results, args.timeout, args.workers)
+        if args.notices:
+            if not 1 <= args.path <= len(paths): raise ValueError(f"沒有第 {args.path} 條循環 (共 {len(paths)} 條)")
+            save_notices(cycle_notices(paths[args.path - 1], tt.index, args.teacher), args.notices, "多角調通知單")
+        return {"timed_out": timed_out, "cycles": paths}, cycles_to_frame(paths)
+    if args.command == "plan":
+        plan, load = tt.plan_absence(args.teacher, args.start, args.end, args.max_per_day, calendar or load_calendar())
+        if args.notices: save_notices(absence_notices(args.teacher, plan), args.notices, f"{args.teacher}請假代課通知單")
+        return {"plan": plan.to_dict("records"), "load": load.to_dict("records")}, plan
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        obj, frame = run(args)
+    except (ValueError, OSError) as e:
+        parser.exit(2, f"錯誤：{e}\n")
+    if args.format == "csv":
+        text = frame.to_csv(index=False)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=str) + "\n"
+    if args.output:
+        encoding = "utf-8-sig" if args.format == "csv" else "utf-8"    # Excel 開啟 CSV 需要 BOM
+        with open(args.output, "w", encoding=encoding, newline="") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
@@ -0,0 +1,150 @@
+import time
+
+import numpy as np
+
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 多角調課：循環搜尋引擎
+# 規則與原本的 dfs_find_loop 相同：
+#   1. 所有釋出的課必須與 A 調出的課同一班級 (target_class_lock)
+#   2. 接手者必須在該時段有空、不在全校鎖定時段，且任教該班級
+#   3. 釋出的課若落在 A 可接收的時段即形成循環，否則繼續往下傳遞
+# 搜尋在預先建好的鄰接結構上進行，並依「距離回到 A 還需幾手」剪枝
+# ==========================================
+MAX_DEPTH = 4
+MAX_RESULTS = 50
+N_SLOTS = len(DAYS) * len(PERIODS)
+UNREACHABLE = N_SLOTS + 1
+
+
+def slot_id(day, period):
+    return DAYS.index(day) * len(PERIODS) + PERIODS.index(str(period))
+
+
+def slot_label(s):
+    return DAYS[s // len(PERIODS)], PERIODS[s % len(PERIODS)]
+
+
+class CycleGraph:
+    # 針對單一班級建立：時段 → 可接手教師、教師 → 可釋出 (未鎖定) 的該班課程
+    # 只保留名稱與整數化的鄰接清單，可直接傳給其他行程
+    def __init__(self, index, slot_locked, cell_locked, class_name):
+        self.teachers = list(index.teachers)
+        self.teacher_pos = dict(index.teacher_pos)
+        self.class_name = class_name
+        if class_name:
+            c = index.class_pos.get(class_name, -2)
+            same_class = index.class_codes == c
+        else:
+            same_class = index.class_codes == -1
+        releasable = index.busy & ~cell_locked & same_class
+
+        # 只有能釋出該班課程的教師才可能出現在循環中
+        n = len(index.teachers)
+        flat_rel = releasable.reshape(n, -1)
+        members = np.flatnonzero(flat_rel.any(axis=1))
+        flat_content = index.content.reshape(n, -1)
+        self.releases = {
+            int(t): [(int(s), str(flat_content[t, s])) for s in np.flatnonzero(flat_rel[t])]
+            for t in members
+        }
+
+        takes = index.free.reshape(n, -1)[members] & ~slot_locked.reshape(-1)
+        self.takers = [[int(t) for t in members[takes[:, s]]] for s in range(N_SLOTS)]
+
+
+class CycleSearch:
+    def __init__(self, graph, who_a, src_day, src_per, a_valid_targets, max_depth=MAX_DEPTH):
+        self.graph = graph
+        self.who_a = who_a
+        self.a = graph.teacher_pos[who_a]
+        self.src = slot_id(src_day, src_per)
+        self.targets = {slot_id(d, p) for d, p in a_valid_targets}
+        self.max_depth = max_depth
+        self.nodes = 0
+        self.deadline = None
+        self.timed_out = False
+        self.stop_event = None
+
+        # 依 A 的可接收時段拆成「直接收尾」與「繼續傳遞」兩組
+        self.closing, self.onward = {}, {}
+        for t, rel in graph.releases.items():
+            self.closing[t] = [r for r in rel if r[0] in self.targets]
+            self.onward[t] = [r for r in rel if r[0] not in self.targets]
+        self.hops = self._hops_to_close()
+
+    def _hops_to_close(self):
+        # hops[s]：從「釋出時段 s」起最少還需幾層才能回到 A (忽略已拜訪限制，作為下界)
+        hops = [UNREACHABLE] * N_SLOTS
+        for s in range(N_SLOTS):
+            if any(self.closing[t] for t in self.graph.takers[s] if t != self.a):
+                hops[s] = 1
+        for _ in range(self.max_depth):
+            changed = False
+            for s in range(N_SLOTS):
+                for t in self.graph.takers[s]:
+                    if t == self.a: continue
+                    for s2, _ in self.onward[t]:
+                        if hops[s2] + 1 < hops[s]:
+                            hops[s] = hops[s2] + 1
+                            changed = True
+            if not changed: break
+        return hops
+
+    def _step(self, giver, receiver, s, content):
+        d, p = slot_label(s)
+        return {
+            'from': giver,
+            'to': receiver,
+            'day': d,
+            'period': p,
+            'content': content,
+            'class': self.graph.class_name
+        }
+
+    def first_hops(self):
+        # 第一手可接下 A 調出課程的教師 (平行搜尋時依此分割)
+        return [t for t in self.graph.takers[self.src] if t != self.a]
+
+    def _walk(self, current, s, level, target_level, path, visited, only=None):
+        # level：目前已有的步數；target_level：本輪要在第幾層收尾；only：限定本層的接手者
+        self.nodes += 1
+        if self.deadline and time.monotonic() > self.deadline:
+            self.timed_out = True
+            return
+        if self.stop_event is not None and self.stop_event.is_set(): return
+        teachers = self.graph.teachers
+        for t in self.graph.takers[s]:
+            if visited >> t & 1: continue
+            if only is not None and t not in only: continue
+            name = teachers[t]
+            if level == target_level:
+                for s2, content in self.closing[t]:
+                    yield path + [
+                        self._step(current, name, s, name + " 接手"),
+                        self._step(name, self.who_a, s2, content),
+                    ]
+            else:
+                for s2, content in self.onward[t]:
+                    if self.hops[s2] > target_level - level: continue
+                    path.append(self._step(current, name, s, content))
+                    yield from self._walk(name, s2, level + 1, target_level, path, visited | (1 << t))
+                    path.pop()
+
+    def iter_cycles(self, first_hops=None):
+        # 依循環長度由短到長產生，同長度內順序固定
+        only = set(first_hops) if first_hops is not None else None
+        for target_level in range(self.max_depth):
+            if self.hops[self.src] > target_level + 1: continue
+            yield from self._walk(self.who_a, self.src, 0, target_level, [], 1 << self.a, only)
+            if self.timed_out or (self.stop_event is not None and self.stop_event.is_set()): return
+
+    def run(self, max_results=MAX_RESULTS, deadline=None, first_hops=None):
+        # 回傳 (循環清單, 是否超時)；deadline 為 time.monotonic() 的時間點
+        self.deadline = deadline
+        found = []
+        for path in self.iter_cycles(first_hops):
+            found.append(path)
+            if max_results and len(found) >= max_results: break
+        return found, self.timed_out
@@ -0,0 +1,182 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from substitute.cycle_search import CycleGraph
+from substitute.domains import classify_domains
+from substitute.profiling import count, stage
+from substitute.rules import load_lock_rules
+from substitute.schedule_index import ScheduleIndex, slot_pos
+from substitute.swap_search import SwapMatrix
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 衍生資料層：每個資料集版本只計算一次，跨 rerun、頁面與 session 共用
+#   建立後所有陣列設為唯讀；被 pin() 住的資料集不會被淘汰
+# ==========================================
+MEMO_ENTRIES = 4
+
+
+def _freeze(*arrays):
+    for a in arrays:
+        a.flags.writeable = False
+
+
+class DerivedData:
+    def __init__(self, key, df, rules=None):
+        self.key = key
+        self.rules = rules or load_lock_rules()
+        self.index = index = ScheduleIndex.from_frame(df)
+
+        # --- 領域與顯示名稱 ---
+        self.domain_result = classify_domains(df, index.teachers)
+        self.teacher_domain_map = {t: self.domain_result.domains[t] for t in index.teachers}
+        self.teacher_display_map = {t: f"{t} ({d})" for t, d in self.teacher_domain_map.items()}
+        self.display_to_teacher = {v: k for k, v in self.teacher_display_map.items()}
+        self.all_domains = ["全部"] + sorted([d for d in set(self.teacher_domain_map.values()) if d != "未知"])
+        self._display_options = {}
+
+        # --- 班級與教師清單 ---
+        self.clean_classes = list(index.classes)
+        self.all_teachers_real = sorted(index.teachers)
+        self.class_teacher_map = {cls: index.teachers_of_class(cls) for cls in self.clean_classes}
+
+        # --- 鎖定規則與各時段可接課教師 (全校鎖定時段為空) ---
+        self.slot_locked, self.cell_locked = self.rules.compile(index)
+        self.free_map = {}
+        for i, d in enumerate(DAYS):
+            for j, p in enumerate(PERIODS):
+                self.free_map[(d, p)] = set() if self.slot_locked[i, j] else set(index.free_teachers(d, p))
+        self._cycle_graphs = {}
+        self._swap_matrix = None
+        self.base = self
+        self.conflicts = []
+        _freeze(index.content, index.class_codes, index.subject_codes, index.busy, index.free,
+                index.class_members, self.slot_locked, self.cell_locked)
+
+    @property
+    def memo_key(self):
+        return (self.key, self.rules.fingerprint)
+
+    # --- 異動疊加層 (寫入時複製) ---
+    def overlay(self):
+        # 共用領域、名稱、鎖定規則等不受調課影響的資料，只複製課表陣列與空堂對照
+        new = copy.copy(self)
+        new.index = self.index.copy()
+        new.cell_locked = self.cell_locked.copy()
+        new.free_map = {k: set(v) for k, v in self.free_map.items()}
+        new.class_teacher_map = dict(self.class_teacher_map)
+        new._cycle_graphs = {}
+        new._swap_matrix = None
+        new.conflicts = list(self.conflicts)
+        return new
+
+    def move_lesson(self, from_teacher, to_teacher, day, period):
+        # 只能用在 overlay() 產生的物件上：from 在該時段的課改由 to 上課，並更新受影響的索引
+        if self.base is self: raise ValueError("原始課表不可修改，請先呼叫 overlay()")
+        index = self.index
+        if from_teacher not in index.teacher_pos: raise ValueError(f"找不到教師：{from_teacher}")
+        if to_teacher not in index.teacher_pos: raise ValueError(f"找不到教師：{to_teacher}")
+        t1, t2 = index.teacher_pos[from_teacher], index.teacher_pos[to_teacher]
+        d, p = slot_pos(day, period)
+        if not index.busy[t1, d, p]: raise ValueError(f"{from_teacher} 週{day} 第{period}節沒有課")
+        if index.busy[t2, d, p]: raise ValueError(f"{to_teacher} 週{day} 第{period}節已有課")
+        class_name = index.move_lesson(t1, t2, d, p)
+        self.cell_locked[t2, d, p], self.cell_locked[t1, d, p] = self.cell_locked[t1, d, p], False
+        if not self.slot_locked[d, p]:
+            free = self.free_map[(DAYS[d], PERIODS[p])]
+            free.discard(to_teacher)
+            free.add(from_teacher)
+        if class_name: self.class_teacher_map[class_name] = index.teachers_of_class(class_name)
+        # 兩位教師的空堂改變會影響他們任教的所有班級，多角調鄰接結構與互換對照表重新建立
+        self._cycle_graphs = {}
+        self._swap_matrix = None
+
+    def display_options(self, domain):
+        # 依領域篩選後排序好的顯示名稱
+        if domain not in self._display_options:
+            if domain == "全部":
+                opts = sorted(self.teacher_display_map.values())
+            else:
+                opts = sorted([v for k, v in self.teacher_display_map.items() if self.teacher_domain_map[k] == domain])
+            self._display_options[domain] = opts
+        return self._display_options[domain]
+
+    def releasable_slots(self, teacher):
+        # 可調出的課 (有課且未被鎖定)
+        t = self.index.teacher_pos[teacher]
+        return [r for r in self.index.busy_slots(teacher)
+                if not self.cell_locked[t, DAYS.index(r['day']), PERIODS.index(r['period'])]]
+
+    def receivable_slots(self, teacher):
+        # 可換入的空堂 (不含第 8 節與全校鎖定時段)
+        return [(d, p) for d, p in self.index.free_slots(teacher)
+                if p != '8' and not self.slot_locked[DAYS.index(d), PERIODS.index(p)]]
+
+    def cycle_graph(self, class_name):
+        # 多角調的鄰接結構，依班級建立一次
+        if class_name not in self._cycle_graphs:
+            with stage("cycle_graph"):
+                self._cycle_graphs[class_name] = CycleGraph(self.index, self.slot_locked, self.cell_locked, class_name)
+        return self._cycle_graphs[class_name]
+
+    def swap_matrix(self):
+        # 雙人互換的全校對照表，第一次使用時建立
+        if self._swap_matrix is None:
+            with stage("swap_matrix"):
+                self._swap_matrix = SwapMatrix(self.index, self.slot_locked, self.cell_locked)
+        return self._swap_matrix
+
+
+_memo = OrderedDict()
+_pins = {}          # memo_key → 持有中的 handle 數
+_memo_lock = threading.Lock()
+
+
+def _evict():
+    # 只淘汰沒有被 pin 住的資料集；全部被 pin 住時允許暫時超過上限
+    for memo_key in list(_memo):
+        if len(_memo) <= MEMO_ENTRIES: break
+        if not _pins.get(memo_key): del _memo[memo_key]
+
+
+def derived_for(key, df, rules=None):
+    # 鎖定規則設定檔變更時 (指紋不同) 重新計算
+    rules = rules or load_lock_rules()
+    memo_key = (key, rules.fingerprint)
+    with _memo_lock:
+        if memo_key in _memo:
+            _memo.move_to_end(memo_key)
+            count("derived.memo_hit")
+            return _memo[memo_key]
+    with stage("derived"):
+        derived = DerivedData(key, df, rules)
+    with _memo_lock:
+        derived = _memo.setdefault(memo_key, derived)
+        _memo.move_to_end(memo_key)
+        _evict()
+    return derived
+
+
+def pin(derived):
+    with _memo_lock:
+        _memo.setdefault(derived.memo_key, derived)
+        _pins[derived.memo_key] = _pins.get(derived.memo_key, 0) + 1
+
+
+def unpin(derived):
+    with _memo_lock:
+        n = _pins.get(derived.memo_key, 0) - 1
+        if n > 0: _pins[derived.memo_key] = n
+        else: _pins.pop(derived.memo_key, None)
+        _evict()
+
+
+def memo_contains(memo_key):
+    with _memo_lock:
+        return memo_key in _memo
+
+
+def memo_stats():
+    with _memo_lock:
+        return {"datasets": len(_memo), "pinned": {k[0][:12]: n for k, n in _pins.items()}}
@@ -0,0 +1,90 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 教師領域判定：一次處理全部教師
+# ==========================================
+MANUAL_FIX = {
+    "王安順": "自然",
+    "黃琮琪": "自然",
+}
+
+DOMAIN_MAP = {
+    "國文": ["國文", "國語", "閱讀", "寫作", "語文"],
+    "英文": ["英文", "英語", "English", "聽講"],
+    "數學": ["數學", "數A", "數B", "幾何", "微積分", "補強"],
+    "自然": ["物理", "化學", "生物", "地科", "科學", "探究", "實驗", "理化"],
+    "社會": ["歷史", "地理", "公民", "社會", "經濟", "心理"],
+    "健體": ["體育", "健康", "護理", "運動"],
+    "藝能": ["美術", "音樂", "藝術", "表演", "繪畫"],
+    "科技": ["資訊", "生活科技", "生科", "程式", "電腦", "機器人"],
+    "國防": ["國防", "軍訓"],
+    "特教": ["特教", "資源", "特殊"],
+    "綜合": ["班會", "週會", "輔導", "彈性", "自主", "團體"]
+}
+DOMAINS = list(DOMAIN_MAP)
+
+_KEYWORD_DOMAIN = {kw: i for i, kws in enumerate(DOMAIN_MAP.values()) for kw in kws}
+# 以前瞻比對在每個位置找出關鍵字，重疊出現的不同關鍵字也會各自計數；
+# 目前關鍵字彼此不互為前綴，因此結果與逐一 str.count 相同
+_KEYWORD_RE = re.compile("(?=(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_DOMAIN, key=len, reverse=True)) + "))")
+_SEPARATOR = "\n"
+
+
+class DomainClassification:
+    def __init__(self, teachers, scores, has_subjects):
+        self.teachers = teachers
+        self.scores = scores
+        self.teacher_pos = {t: i for i, t in enumerate(teachers)}
+
+        best = scores.argmax(axis=1)
+        top = scores.max(axis=1)
+        self.domains = {}
+        for i, t in enumerate(teachers):
+            if t in MANUAL_FIX:
+                self.domains[t] = MANUAL_FIX[t]
+            elif top[i] == 0:
+                self.domains[t] = "其他" if has_subjects[i] else "未知"
+            else:
+                self.domains[t] = DOMAINS[best[i]]
+
+        # 第一、二高分相同 (或差距在容許範圍內) 的教師視為判定不明確
+        self.top_score = top
+        self.runner_up = np.sort(scores, axis=1)[:, -2]
+
+    def domain_scores(self, teacher):
+        row = self.scores[self.teacher_pos[teacher]]
+        return {d: int(v) for d, v in zip(DOMAINS, row) if v}
+
+    def is_ambiguous(self, teacher, margin=0):
+        i = self.teacher_pos[teacher]
+        if teacher in MANUAL_FIX or self.top_score[i] == 0: return False
+        return self.top_score[i] - self.runner_up[i] <= margin
+
+
+def classify_domains(df, teachers=None):
+    if teachers is None:
+        teachers = list(pd.unique(df['teacher']))
+    teacher_pos = {t: i for i, t in enumerate(teachers)}
+
+    # 每位教師的科目去重後依出現順序串接 (與逐位教師判定時相同)
+    subj = df.loc[df['subject'] != "", ['teacher', 'subject']].drop_duplicates()
+    joined = subj.groupby('teacher', sort=False)['subject'].agg("".join)
+    joined = joined[joined.index.isin(teacher_pos)]
+
+    texts = [""] * len(teachers)
+    for t, text in joined.items():
+        texts[teacher_pos[t]] = text
+    has_subjects = np.array([len(x) > 0 for x in texts], dtype=bool)
+
+    # 全部教師串成一個字串只掃描一次，再以位置對應回教師
+    corpus = _SEPARATOR.join(texts)
+    starts = np.cumsum([0] + [len(x) + 1 for x in texts[:-1]])
+    scores = np.zeros((len(teachers), len(DOMAINS)), dtype=np.int32)
+    hits = [(m.start(), _KEYWORD_DOMAIN[m.group(1)]) for m in _KEYWORD_RE.finditer(corpus)]
+    if hits:
+        pos, dom = np.array(hits).T
+        np.add.at(scores, (np.searchsorted(starts, pos, side='right') - 1, dom), 1)
+    return DomainClassification(list(teachers), scores, has_subjects)
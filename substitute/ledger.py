@@ -0,0 +1,391 @@
+import datetime
+import os
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from substitute.derived import memo_contains
+from substitute.notices import week_date
+from substitute.school_calendar import load_calendar
+
+# ==========================================
+# 調代課異動紀錄 (SQLite)
+#   紀錄依學期 (scope) 分開，不依課表檔案：重新匯出、修正課表或解析器改版後，已記錄的異動照樣套用，
+#   無法套用者列為衝突；每組另記下當時的課表 (dataset)，換過課表時提醒使用者確認
+#   每次確認的互換 / 多角調 / 代課為一組 (groups)，組內每一步為一筆 moves：
+#   「from 老師在 星期 day 第 period 節的課改由 to 老師上」；date 為空表示每週都適用
+#   有效課表 = 原始課表 + 本週適用且未撤銷的異動，以寫入時複製的疊加層計算
+#   代課節數另存於 loads (每人每天一筆計數)，在記錄 / 撤銷的同一個交易中增減，
+#   查詢負擔時只需加總這張小表，不必掃描全部歷史異動；
+#   loads 不分資料集，重新上傳修正過的課表後各教師累計的代課節數不會歸零
+# ==========================================
+DEFAULT_LEDGER_PATH = Path(os.environ.get("SUBSTITUTE_LEDGER", Path(__file__).resolve().parent.parent / ".ledger" / "ledger.sqlite3"))
+LEDGER_SCOPE = os.environ.get("SUBSTITUTE_LEDGER_SCOPE", "")
+KINDS = {"swap": "雙人互換", "cycle": "多角調", "substitute": "代課"}
+SCHEMA_VERSION = 4
+LOAD_MEMORY_ENTRIES = 64
+OVERLAY_ENTRIES = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL DEFAULT '',
+    dataset TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    note TEXT NOT NULL DEFAULT '',
+    created TEXT NOT NULL,
+    reverted TEXT
+);
+CREATE TABLE IF NOT EXISTS moves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id INTEGER NOT NULL REFERENCES groups(id),
+    scope TEXT NOT NULL DEFAULT '',
+    dataset TEXT NOT NULL,
+    from_teacher TEXT NOT NULL,
+    to_teacher TEXT NOT NULL,
+    day TEXT NOT NULL,
+    period TEXT NOT NULL,
+    date TEXT,
+    content TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS moves_from ON moves(scope, from_teacher);
+CREATE INDEX IF NOT EXISTS moves_to ON moves(scope, to_teacher);
+CREATE INDEX IF NOT EXISTS moves_date ON moves(scope, date);
+CREATE INDEX IF NOT EXISTS moves_slot ON moves(scope, day, period);
+CREATE INDEX IF NOT EXISTS groups_scope ON groups(scope, reverted);
+"""
+LOADS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS loads (
+    date TEXT NOT NULL,
+    teacher TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (date, teacher)
+);
+"""
+# 舊版紀錄檔沒有 loads 或 loads 依資料集分開：升級時由現有的代課異動重新計算一次
+BACKFILL_LOADS = """
+DROP TABLE IF EXISTS loads;
+""" + LOADS_SCHEMA + """
+INSERT INTO loads(date, teacher, count)
+SELECT COALESCE(m.date, substr(g.created, 1, 10)), m.to_teacher, COUNT(*)
+FROM moves m JOIN groups g ON g.id = m.group_id
+WHERE g.kind = 'substitute' AND g.reverted IS NULL
+GROUP BY COALESCE(m.date, substr(g.created, 1, 10)), m.to_teacher;
+"""
+# 第 4 版以前的紀錄依課表檔案雜湊分開：全部歸入升級時的學期，版本號依各學期的組數重新起算
+SCOPE_MIGRATION = """
+DROP INDEX IF EXISTS moves_from;
+DROP INDEX IF EXISTS moves_to;
+DROP INDEX IF EXISTS moves_date;
+DROP INDEX IF EXISTS moves_slot;
+DROP INDEX IF EXISTS groups_dataset;
+DROP TABLE IF EXISTS versions;
+CREATE TABLE versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT INTO versions(scope, version)
+SELECT scope, COUNT(*) + COUNT(reverted) FROM groups GROUP BY scope;
+"""
+
+
+def ledger_scope(calendar=None):
+    # 紀錄歸屬的學期：有設定 SUBSTITUTE_LEDGER_SCOPE 時用它，否則用行事曆的學期開始日；
+    # 沒有學期設定時全部記在同一處
+    if LEDGER_SCOPE: return LEDGER_SCOPE
+    if calendar is None:
+        try:
+            calendar = load_calendar()
+        except ValueError:
+            return "default"
+    return calendar.start.isoformat() if calendar.start else "default"
+
+
+def week_start(date=None):
+    date = date or datetime.date.today()
+    return date - datetime.timedelta(days=date.weekday())
+
+
+class SwapLedger:
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = Path(path)
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._loads = OrderedDict()     # (紀錄檔版本, 起, 迄) → {教師: 代課節數}
+        self._loads_lock = threading.Lock()
+
+    def _connect(self):
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(self.path)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(SCHEMA + LOADS_SCHEMA)
+                        version = conn.execute("PRAGMA user_version").fetchone()[0]
+                        if version < SCHEMA_VERSION:
+                            if version < 3: conn.executescript(BACKFILL_LOADS)
+                            if version < 4: self._migrate_scope(conn)
+                            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                            conn.commit()
+                        conn.executescript(INDEXES)
+                    finally:
+                        conn.close()
+                    self._ready = True
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def _migrate_scope(conn):
+        for table in ("groups", "moves"):
+            if "scope" not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        scope = ledger_scope()
+        conn.execute("UPDATE groups SET scope = ? WHERE scope = ''", (scope,))
+        conn.execute("UPDATE moves SET scope = ? WHERE scope = ''", (scope,))
+        conn.executescript(SCOPE_MIGRATION)
+
+    @staticmethod
+    def _bump(conn, scope):
+        conn.execute("INSERT INTO versions(scope, version) VALUES (?, 1) "
+                     "ON CONFLICT(scope) DO UPDATE SET version = version + 1", (scope,))
+
+    @staticmethod
+    def _add_loads(conn, counts, sign):
+        # counts：{(日期字串, 教師): 節數}；sign 為 1 (記錄) 或 -1 (撤銷)
+        conn.executemany("INSERT INTO loads(date, teacher, count) VALUES (?, ?, ?) "
+                         "ON CONFLICT(date, teacher) DO UPDATE SET count = count + excluded.count",
+                         [(date, teacher, sign * n) for (date, teacher), n in counts.items()])
+        conn.execute("DELETE FROM loads WHERE count <= 0")
+
+    # --- 寫入 ---
+    def record(self, scope, kind, moves, note="", dataset=""):
+        # moves：[{"from", "to", "day", "period", "date" (datetime.date 或 None), "content"}]，回傳組別編號
+        # dataset：記錄時使用的課表 (內容雜湊)，只用來提醒換過課表
+        if kind not in KINDS: raise ValueError(f"未知的異動類型：{kind}")
+        if not moves: raise ValueError("沒有任何異動")
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        counts = Counter()
+        if kind == "substitute":
+            for m in moves:
+                counts[((m.get("date") or datetime.date.today()).isoformat(), m["to"])] += 1
+        conn = self._connect()
+        try:
+            with conn:
+                group_id = conn.execute("INSERT INTO groups(scope, dataset, kind, note, created) VALUES (?, ?, ?, ?, ?)",
+                                        (scope, dataset, kind, note, now)).lastrowid
+                conn.executemany(
+                    "INSERT INTO moves(group_id, scope, dataset, from_teacher, to_teacher, day, period, date, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(group_id, scope, dataset, m["from"], m["to"], m["day"], str(m["period"]),
+                      m["date"].isoformat() if m.get("date") else None, m.get("content", "")) for m in moves])
+                if counts: self._add_loads(conn, counts, 1)
+                self._bump(conn, scope)
+        finally:
+            conn.close()
+        return group_id
+
+    def revert(self, scope, group_id):
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        conn = self._connect()
+        try:
+            with conn:
+                n = conn.execute("UPDATE groups SET reverted = ? WHERE id = ? AND scope = ? AND reverted IS NULL",
+                                 (now, group_id, scope)).rowcount
+                if n == 0: raise ValueError(f"找不到可撤銷的異動 #{group_id}")
+                rows = conn.execute(
+                    "SELECT COALESCE(m.date, substr(g.created, 1, 10)), m.to_teacher, COUNT(*) FROM moves m "
+                    "JOIN groups g ON g.id = m.group_id WHERE g.id = ? AND g.kind = 'substitute' GROUP BY 1, 2",
+                    (group_id,)).fetchall()
+                if rows: self._add_loads(conn, {(d, t): c for d, t, c in rows}, -1)
+                self._bump(conn, scope)
+        finally:
+            conn.close()
+
+    # --- 查詢 ---
+    def version(self, scope=None):
+        # scope 為 None 時為整個紀錄檔的版本 (各學期版本的總和，任何寫入都會讓它增加)
+        conn = self._connect()
+        try:
+            if scope is None:
+                row = conn.execute("SELECT SUM(version) FROM versions").fetchone()
+            else:
+                row = conn.execute("SELECT version FROM versions WHERE scope = ?", (scope,)).fetchone()
+        finally:
+            conn.close()
+        return (row[0] or 0) if row else 0
+
+    def active_moves(self, scope, start=None, end=None):
+        # 未撤銷、且不限日期或日期落在 [start, end] 的異動，依紀錄順序
+        sql = ("SELECT m.id, m.group_id, m.from_teacher, m.to_teacher, m.day, m.period, m.date FROM moves m "
+               "JOIN groups g ON g.id = m.group_id WHERE m.scope = ? AND g.reverted IS NULL")
+        params = [scope]
+        if start is not None:
+            sql += " AND (m.date IS NULL OR m.date BETWEEN ? AND ?)"
+            params += [start.isoformat(), end.isoformat()]
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql + " ORDER BY m.id", params).fetchall()
+        finally:
+            conn.close()
+        return [{"id": r[0], "group": r[1], "from": r[2], "to": r[3], "day": r[4], "period": r[5],
+                 "date": datetime.date.fromisoformat(r[6]) if r[6] else None} for r in rows]
+
+    def substitution_loads(self, start, end):
+        # 期間內每位教師的代課節數 (不分資料集)；同一版本的查詢結果留在記憶體
+        key = (self.version(), start, end)
+        with self._loads_lock:
+            cached = self._loads.get(key)
+            if cached is not None:
+                self._loads.move_to_end(key)
+                return cached
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT teacher, SUM(count) FROM loads WHERE date BETWEEN ? AND ? GROUP BY teacher",
+                                (start.isoformat(), end.isoformat())).fetchall()
+        finally:
+            conn.close()
+        loads = dict(rows)
+        with self._loads_lock:
+            self._loads[key] = loads
+            while len(self._loads) > LOAD_MEMORY_ENTRIES:
+                self._loads.popitem(last=False)
+        return loads
+
+    def groups(self, scope, include_reverted=False):
+        sql = ("SELECT g.id, g.kind, g.note, g.created, g.reverted, COUNT(m.id), MIN(m.date), MAX(m.date) "
+               "FROM groups g JOIN moves m ON m.group_id = g.id WHERE g.scope = ?")
+        if not include_reverted: sql += " AND g.reverted IS NULL"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql + " GROUP BY g.id ORDER BY g.id DESC", (scope,)).fetchall()
+        finally:
+            conn.close()
+        return pd.DataFrame([{
+            "編號": r[0],
+            "類型": KINDS.get(r[1], r[1]),
+            "說明": r[2],
+            "節數": r[5],
+            "日期": (r[6] if r[6] == r[7] else f"{r[6]} ~ {r[7]}") if r[6] else "每週",
+            "建立時間": r[3],
+            "已撤銷": bool(r[4]),
+        } for r in rows], columns=["編號", "類型", "說明", "節數", "日期", "建立時間", "已撤銷"])
+
+    def recorded_on_other_datasets(self, scope, dataset):
+        # 在其他課表 (換檔前) 上記錄、仍在套用中的組數
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT COUNT(*) FROM groups WHERE scope = ? AND reverted IS NULL AND dataset != ?",
+                               (scope, dataset)).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+
+default_ledger = SwapLedger()
+
+
+# ==========================================
+# 有效課表：以異動疊加在唯讀的原始衍生資料上
+#   每個 (資料集, 紀錄檔, 學期, 週次) 保留最近一版疊加層；紀錄版本改變時，
+#   複製上一版並只套用新增 / 撤銷的異動，衝突時才從原始課表重建
+#   以 LRU 保留最多 OVERLAY_ENTRIES 個；原始資料集已被淘汰 (不在衍生資料快取中) 的一併丟棄，
+#   避免疊加層讓淘汰的資料集一直留在記憶體
+# ==========================================
+_overlays = OrderedDict()   # (memo_key, 紀錄檔, 學期, 週一) → (版本, 已套用的異動, 疊加層)
+_overlay_lock = threading.Lock()
+
+
+def _apply(overlay, moves):
+    applied = []
+    for m in moves:
+        try:
+            overlay.move_lesson(m["from"], m["to"], m["day"], m["period"])
+            applied.append(m)
+        except ValueError as e:
+            overlay.conflicts.append({**m, "error": str(e)})
+    return applied
+
+
+def _rebuild(derived, moves):
+    if not moves: return derived, []
+    overlay = derived.overlay()
+    return overlay, _apply(overlay, moves)
+
+
+def _incremental(derived, prev_applied, prev, moves):
+    # 撤銷的異動反向套用 (由新到舊)，再套用新增的；任何一步失敗就回傳 None 改為重建
+    ids = {m["id"] for m in moves}
+    prev_ids = {m["id"] for m in prev_applied}
+    removed = [m for m in prev_applied if m["id"] not in ids]
+    added = [m for m in moves if m["id"] not in prev_ids]
+    if removed and added and min(m["id"] for m in added) < max(m["id"] for m in removed): return None
+    if prev.conflicts: return None
+    overlay = prev.overlay() if prev is not derived else derived.overlay()
+    try:
+        for m in reversed(removed):
+            overlay.move_lesson(m["to"], m["from"], m["day"], m["period"])
+    except ValueError:
+        return None
+    applied = [m for m in prev_applied if m["id"] in ids] + _apply(overlay, added)
+    if not applied: return derived, []
+    return overlay, applied
+
+
+def overlay_for(derived, ledger=None, week_of=None, scope=None):
+    ledger = ledger or default_ledger
+    scope = scope or ledger_scope()
+    derived = derived.base
+    monday = week_start(week_of)
+    key = (derived.memo_key, str(ledger.path), scope, monday)
+    version = ledger.version(scope)
+    with _overlay_lock:
+        cached = _overlays.get(key)
+        if cached is not None: _overlays.move_to_end(key)
+    if cached is not None and cached[0] == version: return cached[2]
+
+    moves = ledger.active_moves(scope, monday, monday + datetime.timedelta(days=6))
+    result = None
+    if cached is not None:
+        result = _incremental(derived, cached[1], cached[2], moves)
+    if result is None:
+        result = _rebuild(derived, moves)
+    overlay, applied = result
+    with _overlay_lock:
+        for k in [k for k in _overlays if not memo_contains(k[0])]:
+            del _overlays[k]
+        if memo_contains(derived.memo_key):
+            _overlays[key] = (version, applied, overlay)
+            _overlays.move_to_end(key)
+        while len(_overlays) > OVERLAY_ENTRIES:
+            _overlays.popitem(last=False)
+    return overlay
+
+
+# --- 由各頁的結果產生異動 ---
+def swap_moves(teacher_a, teacher_b, src, tgt, date_a=None, date_b=None):
+    # 雙人互換：B 上 A 的 src 時段、A 上 B 的 tgt 時段；src / tgt 為 (星期, 節次)
+    return [
+        {"from": teacher_a, "to": teacher_b, "day": src[0], "period": src[1], "date": date_a},
+        {"from": teacher_b, "to": teacher_a, "day": tgt[0], "period": tgt[1], "date": date_b},
+    ]
+
+
+def cycle_moves(path, monday=None):
+    return [{"from": s['from'], "to": s['to'], "day": s['day'], "period": s['period'],
+             "date": week_date(monday, s['day'])} for s in path]
+
+
+def absence_moves(absent, plan):
+    covered = plan[plan["代課教師"] != ""]
+    return [{"from": absent, "to": r["代課教師"], "day": r["星期"], "period": r["節次"],
+             "date": datetime.date.fromisoformat(r["日期"]), "content": r["課程"]} for _, r in covered.iterrows()]
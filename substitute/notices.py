@@ -0,0 +1,117 @@
+import datetime
+import html
+import tempfile
+import zipfile
+
+from substitute.xinhe_parser import DAYS
+
+# ==========================================
+# 調課 / 代課通知單
+#   所有通知單都由 NOTICE_TEMPLATE 產生；批次輸出時逐張寫入檔案物件 (HTML 或 zip)，
+#   不會先把整份文件組在記憶體裡
+# ==========================================
+NOTICE_TEMPLATE = """{to} 老師您好：
+
+{body}
+
+感謝您的協助！
+敬祝平安
+                                                {sender}
+"""
+DEFAULT_SENDER = "教學組"
+
+HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: "Microsoft JhengHei", sans-serif; font-size: 16px; line-height: 1.8; margin: 0; }}
+.notice {{ border: 1px solid #000; padding: 30px; margin: 40px; white-space: pre-wrap; page-break-after: always; break-after: page; }}
+.notice:last-child {{ page-break-after: auto; break-after: auto; }}
+.title {{ font-weight: bold; margin-bottom: 12px; }}
+@media print {{ .notice {{ margin: 0 0 20px 0; }} }}
+</style></head><body>
+"""
+HTML_TAIL = "</body></html>\n"
+
+
+def render_notice(to, body, sender=DEFAULT_SENDER, title="調課通知單"):
+    return {"to": to, "title": title, "text": NOTICE_TEMPLATE.format(to=to, body=body, sender=sender)}
+
+
+def slot_time(day, period, date=None):
+    # 有日期時顯示「2026/01/05 (星期一 第3節)」，否則「星期一 第3節」
+    if date is None: return f"星期{day} 第{period}節"
+    return f"{date.strftime('%Y/%m/%d')} (星期{day} 第{period}節)"
+
+
+def week_date(monday, day):
+    return monday + datetime.timedelta(days=DAYS.index(day)) if monday is not None else None
+
+
+# --- 各種通知單 ---
+def swap_notice(teacher_b, sender, src, tgt):
+    # 雙人互換：src / tgt 為 (時間字串, 班級, 科目)；src 是 A 調出、tgt 是 B 還課
+    src_time, src_cls, src_subj = src
+    tgt_time, tgt_cls, tgt_subj = tgt
+    body = (f"希望 {tgt_time} {tgt_cls} ({tgt_subj}) 可以跟您換 {src_time} {src_cls} ({src_subj})\n\n"
+            f"您上 {src_time} {src_cls}\n"
+            f"我上 {tgt_time} {tgt_cls}")
+    return render_notice(teacher_b, body, sender)
+
+
+def cycle_notices(path, index, sender, monday=None):
+    # 多角調：每一步給接手的老師一張；課程內容一律從課表讀取「交出者在該時段的課」
+    chain = " ➔ ".join([path[0]['from']] + [step['to'] for step in path])
+    notices = []
+    for i, step in enumerate(path, 1):
+        slot = index.slot(step['from'], step['day'], step['period'])
+        when = slot_time(step['day'], step['period'], week_date(monday, step['day']))
+        body = (f"本次多角調課 ({chain}) 第 {i} 步：\n"
+                f"請您接手 {step['from']} 老師 {when} {slot['class_name']} ({slot['subject']}) 的課。")
+        notices.append(render_notice(step['to'], body, sender))
+    return notices
+
+
+def absence_notices(absent, plan, sender=DEFAULT_SENDER):
+    # 請假代課：每位代課教師一張，列出他負責的所有節次 (找不到代課者的節次不產生)
+    notices = []
+    if plan.empty: return notices
+    covered = plan[plan["代課教師"] != ""]
+    for teacher, rows in covered.groupby("代課教師", sort=False):
+        lines = [f"  {slot_time(r['星期'], r['節次'], datetime.date.fromisoformat(r['日期']))}  {r['課程']}"
+                 for _, r in rows.iterrows()]
+        body = f"{absent} 老師請假期間，麻煩您代以下 {len(lines)} 節課：\n" + "\n".join(lines)
+        notices.append(render_notice(teacher, body, sender, title="代課通知單"))
+    return notices
+
+
+# --- 批次輸出 ---
+def iter_html(notices, title="通知單"):
+    yield HTML_HEAD.format(title=html.escape(title))
+    for n in notices:
+        yield (f'<div class="notice"><div class="title">{html.escape(n["title"])}</div>'
+               f'{html.escape(n["text"])}</div>\n')
+    yield HTML_TAIL
+
+
+def write_html(notices, out, title="通知單"):
+    # out：二進位檔案物件；一張一張寫入
+    for chunk in iter_html(notices, title):
+        out.write(chunk.encode("utf-8"))
+
+
+def write_zip(notices, out, title="通知單"):
+    # 每張通知單一個文字檔，另附一份可直接列印的合併 HTML；out 可以是不可 seek 的串流
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, n in enumerate(notices, 1):
+            zf.writestr(f"{i:02d}_{n['to']}.txt", n["text"].encode("utf-8"))
+        with zf.open(f"{title}.html", "w") as f:
+            for chunk in iter_html(notices, title):
+                f.write(chunk.encode("utf-8"))
+
+
+def spooled(write_fn, notices, title="通知單", max_memory=1024 * 1024):
+    # 寫到暫存檔 (小於 max_memory 時留在記憶體)，回傳已倒回開頭的檔案物件供下載
+    out = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    write_fn(notices, out, title)
+    out.seek(0)
+    return out
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from substitute.cycle_search import MAX_DEPTH, MAX_RESULTS, CycleSearch
+
+# ==========================================
+# 多角調平行搜尋：依第一手接手者 (A 調出時段有空的 B) 分割到多個行程
+# 鄰接結構在每個工作行程啟動時傳送一次，之後每個工作只傳教師編號
+# 取消、超時或搜尋結束時設定共用的取消旗標，執行中的分支也會立即停止
+# ==========================================
+DEFAULT_WORKERS = int(os.environ.get("SUBSTITUTE_SEARCH_WORKERS", "0")) or os.cpu_count() or 1
+
+_worker_graph = None
+_worker_cancel = None
+
+
+def _mp_context():
+    # Linux 上使用預先載入本模組的 forkserver，工作行程不必各自重新 import；
+    # Windows 只支援 spawn
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _init_worker(graph, cancel):
+    global _worker_graph, _worker_cancel
+    _worker_graph = graph
+    _worker_cancel = cancel
+
+
+def _search_branch(who_a, src_day, src_per, a_valid_targets, max_depth, max_results, wall_deadline, branch):
+    # 跨行程以牆上時鐘傳遞截止時間，再換算為本行程的 monotonic 時間
+    deadline = time.monotonic() + (wall_deadline - time.time()) if wall_deadline is not None else None
+    search = CycleSearch(_worker_graph, who_a, src_day, src_per, a_valid_targets, max_depth)
+    search.stop_event = _worker_cancel
+    paths, timed_out = search.run(max_results=max_results, deadline=deadline, first_hops=[branch])
+    return branch, paths, timed_out, search.nodes
+
+
+def _path_key(path):
+    return tuple((step['from'], step['to'], step['day'], step['period']) for step in path)
+
+
+def merge_branch_results(branch_order, branch_paths, max_results):
+    # 依「循環長度 → 第一手順序」合併，與單一行程搜尋的輸出順序相同
+    merged, seen = [], set()
+    lengths = sorted({len(p) for paths in branch_paths.values() for p in paths})
+    for length in lengths:
+        for branch in branch_order:
+            for path in branch_paths.get(branch, []):
+                if len(path) != length: continue
+                key = _path_key(path)
+                if key in seen: continue
+                seen.add(key)
+                merged.append(path)
+    return merged[:max_results] if max_results else merged
+
+
+def parallel_find_cycles(graph, who_a, src_day, src_per, a_valid_targets,
+                         max_depth=MAX_DEPTH, max_results=MAX_RESULTS, deadline=None, workers=None,
+                         stop_event=None, on_progress=None):
+    # deadline 為本行程 time.monotonic() 的時間點；回傳 (循環清單, 是否超時, 展開節點數)
+    # on_progress(完成分支數, 分支總數, 目前節點數) 於每個分支完成時呼叫
+    planner = CycleSearch(graph, who_a, src_day, src_per, a_valid_targets, max_depth)
+    planner.stop_event = stop_event
+    branches = planner.first_hops()
+    workers = min(workers or DEFAULT_WORKERS, len(branches))
+    if workers <= 1:
+        paths, timed_out = planner.run(max_results=max_results, deadline=deadline)
+        return paths, timed_out, planner.nodes
+
+    # 每個分支各自最多取 max_results 條，合併後即為全域前 max_results 條
+    wall_deadline = time.time() + (deadline - time.monotonic()) if deadline else None
+    branch_paths, timed_out, nodes = {}, False, 0
+    ctx = _mp_context()
+    cancel = ctx.Event()    # 工作行程啟動時繼承，不必經由 Manager 轉送
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(graph, cancel))
+    try:
+        futures = [
+            pool.submit(_search_branch, who_a, src_day, src_per, a_valid_targets, max_depth, max_results, wall_deadline, b)
+            for b in branches
+        ]
+        pending = set(futures)
+        while pending:
+            if stop_event is not None and stop_event.is_set(): break
+            if deadline and time.monotonic() > deadline:
+                timed_out = True
+                break
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for fut in done:
+                branch, paths, branch_timed_out, branch_nodes = fut.result()
+                branch_paths[branch] = paths
+                timed_out = timed_out or branch_timed_out
+                nodes += branch_nodes
+            if on_progress is not None:
+                on_progress(len(branch_paths), len(branches), nodes)
+    finally:
+        # 旗標設定後執行中的分支很快結束；等工作行程都結束才釋放旗標，
+        # 否則尚未啟動完成的行程會找不到共用的旗標而出錯
+        cancel.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return merge_branch_results(branches, branch_paths, max_results), timed_out, nodes
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from substitute.profiling import count, stage
+from substitute.xinhe_parser import PARSER_VERSION, parse_xinhe_file
+
+# ==========================================
+# 解析結果快取：以 (檔案內容雜湊 + 解析器版本) 為鍵
+#   第一層：行程內 LRU (所有 session 共用)
+#   第二層：磁碟上的 Parquet 檔，依總容量淘汰最久未使用者
+# ==========================================
+DEFAULT_CACHE_DIR = Path(os.environ.get("SUBSTITUTE_CACHE_DIR", Path(__file__).resolve().parent.parent / ".parse_cache"))
+MEMORY_ENTRIES = 8
+DISK_BYTES = 512 * 1024 * 1024
+
+
+def content_key(data, version=PARSER_VERSION):
+    h = hashlib.sha256()
+    h.update(version.encode())
+    h.update(b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+class ParseCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_entries=MEMORY_ENTRIES, disk_bytes=DISK_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    # --- 第一層：記憶體 ---
+    def _memory_get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        return None
+
+    def _memory_put(self, key, df):
+        with self._lock:
+            self._memory[key] = df
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # --- 第二層：磁碟 ---
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.parquet"
+
+    def _disk_get(self, key):
+        if self.cache_dir is None: return None
+        path = self._disk_path(key)
+        try:
+            df = pd.read_parquet(path).astype(str)
+            os.utime(path)
+            return df
+        except Exception:
+            return None
+
+    def _disk_put(self, key, df):
+        if self.cache_dir is None or df.empty: return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_dir / f"{key}.{threading.get_ident()}.tmp"
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, self._disk_path(key))
+        except Exception:
+            # 缺少 pyarrow 或磁碟不可寫時只保留記憶體層
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for path in self.cache_dir.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes: break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    # --- 對外介面 ---
+    def get_or_parse(self, data, key=None, parse_fn=parse_xinhe_file):
+        key = key or content_key(data)
+        df = self._memory_get(key)
+        if df is not None:
+            count("parse_cache.memory_hit")
+            return key, df
+
+        # 同一份檔案同時被多個 session 上傳時只解析一次
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            df = self._memory_get(key)
+            if df is None:
+                with stage("parse_cache.disk_read"):
+                    df = self._disk_get(key)
+                if df is None:
+                    with stage("parse"):
+                        df = parse_fn(io.BytesIO(data))
+                    with stage("parse_cache.disk_write"):
+                        self._disk_put(key, df)
+                else:
+                    count("parse_cache.disk_hit")
+                self._memory_put(key, df)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return key, df
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir is not None:
+            for path in self.cache_dir.glob("*.parquet"):
+                path.unlink(missing_ok=True)
+
+
+default_cache = ParseCache()
+
+
+def cached_parse(data, key=None):
+    return default_cache.get_or_parse(data, key)
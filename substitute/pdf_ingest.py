@@ -0,0 +1,240 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from substitute.parse_cache import DEFAULT_CACHE_DIR
+from substitute.profiling import count, stage
+from substitute.xinhe_parser import PERIOD_MAP_ZH, parse_row_stream
+
+# ==========================================
+# 欣河系統列印的 PDF 課表
+#   每頁的表格轉成與 CSV 相同的列 (教師列、星期標題列、科目列 + 節次/班級列)，
+#   再送進同一個解析流程。表格擷取依頁面平行處理，結果以頁面內容雜湊快取
+# ==========================================
+# 頁面轉列的規則變動時須更新，讓舊的頁面快取失效
+PDF_CACHE_VERSION = "1"
+PDF_WORKERS = int(os.environ.get("SUBSTITUTE_PDF_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_PAGES = 8
+PAGE_CACHE_DIR = DEFAULT_CACHE_DIR / "pdf_pages"
+PAGE_MEMORY_ENTRIES = 4000
+PAGE_DISK_BYTES = 64 * 1024 * 1024
+
+_worker_pdf = None
+
+
+def _mp_context():
+    # 與多角調平行搜尋相同：Linux 使用預先載入本模組的 forkserver，其餘平台用 spawn
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _open_pdf(data):
+    try:
+        import pdfplumber
+    except ImportError:
+        raise ValueError("讀取 PDF 課表需要安裝 pdfplumber")
+    try:
+        return pdfplumber.open(io.BytesIO(data))
+    except Exception as e:
+        raise ValueError(f"無法開啟 PDF 檔：{e}")
+
+
+# --- 頁面 → 列 ---
+def _cell_lines(cell):
+    return [x.strip() for x in ("" if cell is None else str(cell)).split("\n") if x.strip()]
+
+
+def table_rows(table):
+    # CSV 的每一節是兩列：上一列科目、節次列放班級。PDF 表格常把「科目\n班級」印在同一格，
+    # 此時拆成兩列；前 5 欄中第一行為節次的格子 (如「一\n08:10」) 只把節次留在節次列。
+    # 表格本身已分成科目列與節次列時 (節次列前一列不是節次列或標題列) 照原樣輸出
+    out, prev_kind = [], None
+    for row in table:
+        lines = [_cell_lines(c) for c in row]
+        is_period = any(ls and ls[0] in PERIOD_MAP_ZH for ls in lines[:5])
+        if not is_period:
+            cells = [" ".join(ls) for ls in lines]
+            out.append(cells)
+            prev_kind = "header" if "一" in cells and "五" in cells else "subject"
+            continue
+        if prev_kind == "subject" and not any(len(ls) > 1 for ls in lines):
+            out.append([ls[0] if ls else "" for ls in lines])
+        else:
+            upper, lower = [], []
+            for i, ls in enumerate(lines):
+                if i < 5 and ls and ls[0] in PERIOD_MAP_ZH:
+                    upper.append("")
+                    lower.append(ls[0])
+                else:
+                    upper.append(" ".join(ls[:-1]))
+                    lower.append(ls[-1] if ls else "")
+            out.extend([upper, lower])
+        prev_kind = "period"
+    return out
+
+
+def page_rows(page):
+    # 頁面上的教師標題 (表格外的文字行) 與表格依垂直位置排序後攤平成列
+    tables = page.find_tables()
+    boxes = [t.bbox for t in tables]
+    items = []
+    for line in page.extract_text_lines():
+        if "教師" not in line["text"]: continue
+        mid = (line["top"] + line["bottom"]) / 2
+        if any(x0 <= line["x0"] <= x1 and top <= mid <= bottom for x0, top, x1, bottom in boxes): continue
+        items.append((line["top"], [[line["text"]]]))
+    for t in tables:
+        items.append((t.bbox[1], table_rows(t.extract())))
+    items.sort(key=lambda x: x[0])
+    return [row for _, rows in items for row in rows]
+
+
+def page_hash(page):
+    # 內容串流 + 頁面大小 + 各字型的 ToUnicode 對照 (子集字型的字碼在不同檔案間意義不同)
+    from pdfminer.pdftypes import resolve1
+    h = hashlib.sha256(PDF_CACHE_VERSION.encode())
+    h.update(repr(page.mediabox).encode())
+    for stream in page.page_obj.contents:
+        h.update(stream.get_data())
+    fonts = resolve1((page.page_obj.resources or {}).get("Font")) or {}
+    for name in sorted(fonts):
+        font = resolve1(fonts[name]) or {}
+        h.update(f"{name}:{font.get('BaseFont')}".encode())
+        to_unicode = resolve1(font.get("ToUnicode"))
+        if to_unicode is not None and hasattr(to_unicode, "get_data"): h.update(to_unicode.get_data())
+    return h.hexdigest()
+
+
+# --- 頁面快取 ---
+class PageCache:
+    # 與解析快取相同的兩層結構：行程內 LRU + 磁碟 JSON (依總容量淘汰最久未使用者)
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, memory_entries=PAGE_MEMORY_ENTRIES, disk_bytes=PAGE_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _memory_put(self, key, rows):
+        with self._lock:
+            self._memory[key] = rows
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if self.cache_dir is None: return None
+        path = self.cache_dir / f"{key}.json"
+        try:
+            rows = json.loads(path.read_text(encoding="utf-8"))
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._memory_put(key, rows)
+        return rows
+
+    def put(self, key, rows):
+        self._memory_put(key, rows)
+        if self.cache_dir is None: return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_dir / f"{key}.{threading.get_ident()}.tmp"
+            tmp.write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.cache_dir / f"{key}.json")
+        except OSError:
+            return
+
+    def evict(self):
+        if self.cache_dir is None or not self.cache_dir.exists(): return
+        files = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes: break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+
+default_page_cache = PageCache()
+
+
+# --- 平行擷取 ---
+def _init_worker(data):
+    global _worker_pdf
+    _worker_pdf = _open_pdf(data)
+
+
+def _extract_pages(page_numbers):
+    out = []
+    for i in page_numbers:
+        page = _worker_pdf.pages[i]
+        out.append((i, page_rows(page)))
+        page.close()
+    return out
+
+
+def _batches(items, n_batches):
+    size = max(1, -(-len(items) // n_batches))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def extract_pdf_rows(data, workers=None, cache=None):
+    # 回傳依頁序排列的每頁列清單；快取命中的頁面不再擷取
+    cache = cache or default_page_cache
+    workers = PDF_WORKERS if workers is None else workers
+    pages = {}
+    with _open_pdf(data) as pdf:
+        with stage("pdf.hash"):
+            hashes = []
+            for page in pdf.pages:
+                hashes.append(page_hash(page))
+                page.close()
+        for i, key in enumerate(hashes):
+            rows = cache.get(key)
+            if rows is not None: pages[i] = rows
+        missing = [i for i in range(len(hashes)) if i not in pages]
+        count("pdf.page_cache_hit", len(hashes) - len(missing))
+
+        with stage("pdf.extract"):
+            if workers > 1 and len(missing) >= PARALLEL_MIN_PAGES:
+                n = min(workers, len(missing))
+                with ProcessPoolExecutor(n, mp_context=_mp_context(), initializer=_init_worker, initargs=(data,)) as pool:
+                    for batch in pool.map(_extract_pages, _batches(missing, n * 4)):
+                        for i, rows in batch:
+                            pages[i] = rows
+            else:
+                for i in missing:
+                    page = pdf.pages[i]
+                    pages[i] = page_rows(page)
+                    page.close()
+    for i in missing:
+        cache.put(hashes[i], pages[i])
+    if missing: cache.evict()
+    return [pages[i] for i in range(len(hashes))]
+
+
+def parse_xinhe_pdf(source, workers=None, cache=None):
+    data = source if isinstance(source, (bytes, bytearray)) else source.read()
+    page_list = extract_pdf_rows(bytes(data), workers, cache)
+    # 同一位教師的表格可能跨頁，所以各頁直接串接 (教師列會重設解析狀態)
+    return parse_row_stream(row for rows in page_list for row in rows)
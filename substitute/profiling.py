@@ -0,0 +1,100 @@
+import contextvars
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# ==========================================
+# 效能診斷：各階段耗時與計數器
+#   引擎程式碼一律呼叫 stage() / count()；沒有啟用中的 Profiler 時只多一次 contextvar 查詢
+#   每次 rerun 的紀錄附加到滾動式 JSON Lines 記錄檔
+# ==========================================
+DEFAULT_LOG = Path(os.environ.get("SUBSTITUTE_PROFILE_LOG", Path(__file__).resolve().parent.parent / ".profile" / "profile.jsonl"))
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+_current = contextvars.ContextVar("substitute_profiler", default=None)
+_NULL = nullcontext()
+_log_lock = threading.Lock()
+
+
+class Profiler:
+    def __init__(self, label=""):
+        self.label = label
+        self.started = time.perf_counter()
+        self.stages = {}        # 名稱 → [累計秒數, 次數]
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - t0
+            entry[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def record(self, **extra):
+        return {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "label": self.label,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages": {k: {"ms": round(v[0] * 1000, 2), "calls": v[1]} for k, v in self.stages.items()},
+            "counters": dict(self.counters),
+            **extra,
+        }
+
+
+def current():
+    return _current.get()
+
+
+def stage(name):
+    p = _current.get()
+    return _NULL if p is None else p.stage(name)
+
+
+def count(name, n=1):
+    p = _current.get()
+    if p is not None: p.count(name, n)
+
+
+def profiled(name):
+    # 函式裝飾器：整個呼叫計入 name 階段
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_log(record, path=None, max_bytes=LOG_BYTES, backups=LOG_BACKUPS):
+    # 超過 max_bytes 時輪替：profile.jsonl → profile.jsonl.1 → ... → profile.jsonl.<backups>
+    path = Path(path or DEFAULT_LOG)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _log_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.stat().st_size + len(line.encode("utf-8")) > max_bytes:
+            for i in range(backups, 0, -1):
+                src = path.with_name(f"{path.name}.{i - 1}") if i > 1 else path
+                if src.exists(): os.replace(src, path.with_name(f"{path.name}.{i}"))
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
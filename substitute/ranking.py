@@ -0,0 +1,72 @@
+import datetime
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from substitute.absence_plan import is_adjacent
+from substitute.schedule_index import slot_pos
+from substitute.xinhe_parser import PERIODS
+
+# ==========================================
+# 代課人選排序：分數越低越優先
+#   本週 / 本月已代課節數越多越後面，同領域、教過該班的老師往前，
+#   與自己的課連堂的往後；各項以向量計算，再用堆積只取前 k 名
+# ==========================================
+TOP_K = 10
+WEIGHT_WEEK_SUBS = 3.0      # 本週每代一節
+WEIGHT_MONTH_SUBS = 1.0     # 本月每代一節
+WEIGHT_DAY_LOAD = 0.5       # 當天自己每有一節課
+BONUS_SAME_DOMAIN = 4.0
+BONUS_SAME_CLASS = 2.0
+COST_CONSECUTIVE = 2.0      # 與自己的課相鄰 (每一側)
+
+
+def load_periods(date):
+    # (本週一, 本週日, 本月一日, 本月最後一天)
+    monday = date - datetime.timedelta(days=date.weekday())
+    first = date.replace(day=1)
+    last = (first + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+    return monday, monday + datetime.timedelta(days=6), first, last
+
+
+def rank_candidates(index, teacher_domain_map, candidates, day, period, absent=None,
+                    week_subs=None, month_subs=None, k=TOP_K):
+    # candidates：該時段有空的教師；absent 有給時依他在該時段的課判斷同領域 / 同班
+    # 回傳 (前 k 名 DataFrame, 候選總數)
+    week_subs, month_subs = week_subs or {}, month_subs or {}
+    if not candidates: return pd.DataFrame(), 0
+    d, p = slot_pos(day, period)
+    pos = np.array([index.teacher_pos[t] for t in candidates])
+
+    week = np.array([week_subs.get(t, 0) for t in candidates], dtype=float)
+    month = np.array([month_subs.get(t, 0) for t in candidates], dtype=float)
+    day_load = index.busy[pos, d].sum(axis=1)
+    adjacent = np.zeros(len(pos), dtype=int)
+    for q, other in enumerate(PERIODS):
+        if is_adjacent(PERIODS[p], other): adjacent += index.busy[pos, d, q]
+
+    same_domain = np.zeros(len(pos), dtype=bool)
+    same_class = np.zeros(len(pos), dtype=bool)
+    if absent is not None:
+        domain = teacher_domain_map.get(absent, "未知")
+        if domain != "未知":
+            same_domain = np.array([teacher_domain_map.get(t) == domain for t in candidates])
+        c = index.class_codes[index.teacher_pos[absent], d, p]
+        if c >= 0: same_class = index.class_members[c, pos]
+
+    score = (WEIGHT_WEEK_SUBS * week + WEIGHT_MONTH_SUBS * month + WEIGHT_DAY_LOAD * day_load
+             + COST_CONSECUTIVE * adjacent - BONUS_SAME_DOMAIN * same_domain - BONUS_SAME_CLASS * same_class)
+    top = heapq.nsmallest(k, range(len(pos)), key=lambda i: (score[i], candidates[i]))
+    rows = [{
+        "教師": candidates[i],
+        "領域": teacher_domain_map.get(candidates[i], ""),
+        "本週代課": int(week[i]),
+        "本月代課": int(month[i]),
+        "當天節數": int(day_load[i]),
+        "同領域": "✔" if same_domain[i] else "",
+        "教過該班": "✔" if same_class[i] else "",
+        "連堂": int(adjacent[i]),
+        "分數": round(float(score[i]), 1),
+    } for i in top]
+    return pd.DataFrame(rows), len(pos)
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+from substitute.api import Timetable
+from substitute.derived import memo_stats, pin, unpin
+from substitute.parse_cache import content_key
+
+# ==========================================
+# 全行程共用的資料集登錄表
+#   每個 session 只持有一個 handle (資料集鍵)，課表與衍生資料全行程共用一份且唯讀
+#   以參考計數決定哪些資料集不可淘汰；超過 SESSION_TTL 未使用的 session 自動釋放
+#   發布的全校課表：SUBSTITUTE_TIMETABLE 指向的檔案被替換 (os.replace) 後，
+#   所有未自行上傳的 session 在下一次 rerun 一起切換到新版本
+# ==========================================
+PUBLISHED_PATH = os.environ.get("SUBSTITUTE_TIMETABLE") or None
+SESSION_TTL = 30 * 60
+
+
+class DatasetRegistry:
+    def __init__(self, published_path=PUBLISHED_PATH, session_ttl=SESSION_TTL):
+        self.published_path = Path(published_path) if published_path else None
+        self.session_ttl = session_ttl
+        self._sessions = {}         # session id → [Timetable, 最後使用時間]
+        self._published = None      # (mtime, Timetable)；整個 tuple 一次替換
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+    # --- session handle ---
+    def _hold(self, session_id, tt):
+        now = time.monotonic()
+        with self._lock:
+            held = self._sessions.get(session_id)
+            if held is not None and held[0].derived is tt.derived:
+                held[1] = now
+                stale = []
+            else:
+                pin(tt.derived)
+                stale = [held[0]] if held is not None else []
+                self._sessions[session_id] = [tt, now]
+            for sid, (old, last) in list(self._sessions.items()):
+                if now - last > self.session_ttl:
+                    del self._sessions[sid]
+                    stale.append(old)
+        for old in stale:
+            unpin(old.derived)
+        return tt
+
+    def open(self, session_id, source, key=None, rules=None):
+        # 上傳的檔案：解析與衍生資料依內容雜湊共用，session 只記住 handle
+        return self._hold(session_id, Timetable.load(source, key, rules))
+
+    def open_published(self, session_id):
+        tt = self.published()
+        if tt is None:
+            self.release(session_id)
+            return None
+        return self._hold(session_id, tt)
+
+    def release(self, session_id):
+        with self._lock:
+            held = self._sessions.pop(session_id, None)
+        if held is not None: unpin(held[0].derived)
+
+    # --- 發布的全校課表 ---
+    def published(self):
+        if self.published_path is None: return None
+        try:
+            mtime = self.published_path.stat().st_mtime_ns
+        except OSError:
+            return None
+        current = self._published
+        if current is not None and current[0] == mtime: return current[1]
+        with self._publish_lock:
+            current = self._published
+            if current is not None and current[0] == mtime: return current[1]
+            data = self.published_path.read_bytes()
+            try:
+                tt = Timetable.load(data, content_key(data))
+            except ValueError:
+                # 新檔案無法解析時繼續使用舊版
+                return current[1] if current is not None else None
+            pin(tt.derived)
+            self._published = (mtime, tt)
+        if current is not None: unpin(current[1].derived)
+        return tt
+
+    def stats(self):
+        with self._lock:
+            sessions = len(self._sessions)
+        return {"sessions": sessions, **memo_stats()}
+
+
+registry = DatasetRegistry()
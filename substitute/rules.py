@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 鎖定規則：由設定檔 (lock_rules.json) 宣告，每個資料集編譯一次成布林遮罩
+#   只有 days / periods 的規則為全校鎖定時段 (該時段不可接課也不可調出)
+#   加上 class / subject (正規表示式) 的規則只鎖定符合條件的課
+# ==========================================
+DEFAULT_RULES_PATH = Path(os.environ.get("SUBSTITUTE_LOCK_RULES", Path(__file__).resolve().parent.parent / "lock_rules.json"))
+RULE_KEYS = {"name", "days", "periods", "class", "subject"}
+
+
+class LockRule:
+    def __init__(self, name, days=None, periods=None, class_pattern=None, subject_pattern=None):
+        self.name = name
+        self.days = list(days) if days else list(DAYS)
+        self.periods = [str(p) for p in periods] if periods else list(PERIODS)
+        self.class_re = re.compile(class_pattern) if class_pattern else None
+        self.subject_re = re.compile(subject_pattern) if subject_pattern else None
+        for d in self.days:
+            if d not in DAYS: raise ValueError(f"鎖定規則「{name}」的星期不正確：{d}")
+        for p in self.periods:
+            if p not in PERIODS: raise ValueError(f"鎖定規則「{name}」的節次不正確：{p}")
+
+    @property
+    def school_wide(self):
+        return self.class_re is None and self.subject_re is None
+
+    def slot_mask(self):
+        return np.outer([d in self.days for d in DAYS], [p in self.periods for p in PERIODS])
+
+
+class LockRules:
+    def __init__(self, rules, fingerprint=""):
+        self.rules = list(rules)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_dict(cls, config, fingerprint=""):
+        rules = []
+        for i, r in enumerate(config.get("rules", [])):
+            name = r.get("name", f"規則 {i + 1}")
+            unknown = set(r) - RULE_KEYS
+            if unknown: raise ValueError(f"鎖定規則「{name}」有無法辨識的欄位：{', '.join(sorted(unknown))}")
+            rules.append(LockRule(name, r.get("days"), r.get("periods"), r.get("class"), r.get("subject")))
+        return cls(rules, fingerprint)
+
+    @classmethod
+    def from_file(cls, path):
+        data = Path(path).read_bytes()
+        return cls.from_dict(json.loads(data.decode("utf-8")), hashlib.sha256(data).hexdigest())
+
+    @property
+    def names(self):
+        return [r.name for r in self.rules]
+
+    def compile(self, index):
+        # slot_locked：全校鎖定時段 [5, 8]；cell_locked：各教師有課且不可調的格子 [教師, 5, 8]
+        slot_locked = np.zeros((len(DAYS), len(PERIODS)), dtype=bool)
+        cell_locked = np.zeros(index.busy.shape, dtype=bool)
+        classes = index.classes + [""]      # 代碼 -1 (無班級 / 無科目) 對應最後一格
+        subjects = index.subjects + [""]
+        for rule in self.rules:
+            if rule.school_wide:
+                slot_locked |= rule.slot_mask()
+                continue
+            class_ok = np.array([rule.class_re is None or bool(rule.class_re.search(c)) for c in classes])
+            subject_ok = np.array([rule.subject_re is None or bool(rule.subject_re.search(s)) for s in subjects])
+            cell_locked |= rule.slot_mask()[None] & class_ok[index.class_codes] & subject_ok[index.subject_codes]
+        cell_locked = (cell_locked | slot_locked[None]) & index.busy
+        return slot_locked, cell_locked
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def load_lock_rules(path=None):
+    # 依檔案修改時間重新載入，修改設定檔後不必重新啟動
+    path = Path(path or DEFAULT_RULES_PATH)
+    mtime = path.stat().st_mtime_ns
+    with _load_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, LockRules.from_file(path))
+            _loaded[path] = cached
+        return cached[1]
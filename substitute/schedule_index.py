@@ -0,0 +1,142 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 課表索引：教師 × 5 天 × 8 節 的陣列結構
+# ==========================================
+DAY_POS = {d: i for i, d in enumerate(DAYS)}
+PERIOD_POS = {p: i for i, p in enumerate(PERIODS)}
+
+
+def slot_pos(day, period):
+    return DAY_POS[day], PERIOD_POS[str(period)]
+
+
+def highlight_styles(points, css):
+    # 節次 × 星期 的 CSS 陣列 (與 pivot() 同形狀)，供 Styler.apply(axis=None) 直接使用
+    styles = np.full((len(PERIODS), len(DAYS)), "", dtype=object)
+    for day, period in points:
+        d, p = slot_pos(day, period)
+        styles[p, d] = css
+    return styles
+
+
+class ScheduleIndex:
+    # 解析完成後建立一次；教師、班級、科目皆以整數編碼 (-1 表示空白)
+    def __init__(self, teachers, classes, subjects, class_codes, subject_codes, content):
+        self.teachers = teachers
+        self.classes = classes
+        self.subjects = subjects
+        self.class_codes = class_codes
+        self.subject_codes = subject_codes
+        self.content = content
+        self.busy = content != ""
+        self.free = ~self.busy
+        self.teacher_pos = {t: i for i, t in enumerate(teachers)}
+        self.class_pos = {c: i for i, c in enumerate(classes)}
+        self._pivots = {}
+
+        # 班級 × 教師 的任課關係
+        self.class_members = np.zeros((len(classes), len(teachers)), dtype=bool)
+        t_idx, d_idx, p_idx = np.nonzero(class_codes >= 0)
+        self.class_members[class_codes[t_idx, d_idx, p_idx], t_idx] = True
+
+    @classmethod
+    def from_frame(cls, df):
+        teacher_codes, teachers = pd.factorize(df['teacher'])
+        class_codes, classes = pd.factorize(df['class_name'].where(df['class_name'] != ""), sort=True)
+        subject_codes, subjects = pd.factorize(df['subject'].where(df['subject'] != ""), sort=True)
+        day_pos = pd.Index(DAYS).get_indexer(df['day'])
+        per_pos = pd.Index(PERIODS).get_indexer(df['period'])
+
+        shape = (len(teachers), len(DAYS), len(PERIODS))
+        cls_arr = np.full(shape, -1, dtype=np.int32)
+        subj_arr = np.full(shape, -1, dtype=np.int32)
+        content = np.full(shape, "", dtype=object)
+        at = (teacher_codes, day_pos, per_pos)
+        cls_arr[at] = class_codes
+        subj_arr[at] = subject_codes
+        content[at] = df['content'].to_numpy(dtype=object)
+        return cls(list(teachers), list(classes), list(subjects), cls_arr, subj_arr, content)
+
+    # --- 寫入時複製 (異動疊加層) ---
+    def copy(self):
+        # 只複製會被異動改寫的陣列；名稱清單與對照共用，未受影響教師的 pivot 快取沿用
+        new = copy.copy(self)
+        for name in ("content", "class_codes", "subject_codes", "busy", "free", "class_members"):
+            setattr(new, name, getattr(self, name).copy())
+        new._pivots = dict(self._pivots)
+        return new
+
+    def move_lesson(self, t1, t2, d, p):
+        # t1 在 (d, p) 的課改由 t2 上；回傳該課的班級名稱 (無班級為空字串)
+        for arr, empty in ((self.content, ""), (self.class_codes, -1), (self.subject_codes, -1)):
+            arr[t2, d, p] = arr[t1, d, p]
+            arr[t1, d, p] = empty
+        self.busy[t2, d, p], self.busy[t1, d, p] = True, False
+        self.free[t2, d, p], self.free[t1, d, p] = False, True
+        c = self.class_codes[t2, d, p]
+        if c >= 0:
+            self.class_members[c, t2] = True
+            self.class_members[c, t1] = bool((self.class_codes[t1] == c).any())
+        self._pivots.pop(self.teachers[t1], None)
+        self._pivots.pop(self.teachers[t2], None)
+        return self.classes[c] if c >= 0 else ""
+
+    # --- 空堂查詢 ---
+    def free_mask(self, day, period):
+        d, p = slot_pos(day, period)
+        return self.free[:, d, p]
+
+    def free_teachers(self, day, period):
+        return [self.teachers[i] for i in np.flatnonzero(self.free_mask(day, period))]
+
+    def is_free(self, teacher, day, period):
+        d, p = slot_pos(day, period)
+        return bool(self.free[self.teacher_pos[teacher], d, p])
+
+    # --- 單一教師 ---
+    def slot(self, teacher, day, period):
+        t = self.teacher_pos[teacher]
+        d, p = slot_pos(day, period)
+        return self._slot_record(t, d, p)
+
+    def _slot_record(self, t, d, p):
+        c, s = self.class_codes[t, d, p], self.subject_codes[t, d, p]
+        return {
+            "day": DAYS[d],
+            "period": PERIODS[p],
+            "content": self.content[t, d, p],
+            "is_free": bool(self.free[t, d, p]),
+            "subject": self.subjects[s] if s >= 0 else "",
+            "class_name": self.classes[c] if c >= 0 else "",
+        }
+
+    def busy_slots(self, teacher):
+        # 依星期、節次順序回傳該教師所有有課時段
+        t = self.teacher_pos[teacher]
+        return [self._slot_record(t, d, p) for d, p in zip(*np.nonzero(self.busy[t]))]
+
+    def free_slots(self, teacher):
+        t = self.teacher_pos[teacher]
+        return [(DAYS[d], PERIODS[p]) for d, p in zip(*np.nonzero(self.free[t]))]
+
+    def pivot(self, teacher):
+        # 每位教師只建立一次；回傳的 DataFrame 為共用物件，呼叫端不可修改
+        if teacher not in self._pivots:
+            self._pivots[teacher] = pd.DataFrame(
+                self.content[self.teacher_pos[teacher]].T,
+                index=pd.Index(PERIODS, name='period'),
+                columns=pd.Index(DAYS, name='day'),
+            )
+        return self._pivots[teacher]
+
+    # --- 班級 ---
+    def teachers_of_class(self, class_name):
+        c = self.class_pos.get(class_name)
+        if c is None: return set()
+        return {self.teachers[i] for i in np.flatnonzero(self.class_members[c])}
@@ -0,0 +1,224 @@
+import bisect
+import datetime
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 行事曆：把每週固定的課表對應到學期中的實際日期
+#   設定檔 (school_calendar.json) 宣告學期起訖與例外事件：
+#     holiday 放假 (不給 periods 為整天，給了只停那幾節)、lockout 停止調代課 (如段考)、
+#     makeup 補課日 (該日照 follows 指定的星期上課)
+#   事件可用 days 限定星期、weeks 限定單 / 雙週 (學期第 1 週為單週)
+#   事件依日期放進區間索引；某一天的狀態在查詢時才計算並快取，不展開整個學期
+# ==========================================
+DEFAULT_CALENDAR_PATH = Path(os.environ.get("SUBSTITUTE_CALENDAR", Path(__file__).resolve().parent.parent / "school_calendar.json"))
+EVENT_KEYS = {"name", "kind", "start", "end", "days", "periods", "weeks", "follows"}
+EVENT_KINDS = {"holiday": "放假", "lockout": "停止調代課", "makeup": "補課日"}
+WEEK_PARITY = {"odd": 1, "even": 0}
+DAY_MEMORY_ENTRIES = 512
+
+
+def _date(value, what):
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"{what}的日期格式不正確 (應為 YYYY-MM-DD)：{value}")
+
+
+class CalendarEvent:
+    def __init__(self, name, kind, start, end=None, days=None, periods=None, weeks=None, follows=None):
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.end = end or start
+        self.days = list(days) if days else None
+        self.periods = [str(p) for p in periods] if periods else None
+        self.weeks = weeks
+        self.follows = follows
+        if kind not in EVENT_KINDS: raise ValueError(f"行事曆事件「{name}」的類型不正確：{kind}")
+        if self.start is not None and self.end < self.start: raise ValueError(f"行事曆事件「{name}」的結束日早於開始日")
+        if weeks is not None and weeks not in WEEK_PARITY: raise ValueError(f"行事曆事件「{name}」的 weeks 只能是 odd 或 even")
+        if kind == "makeup" and follows not in DAYS: raise ValueError(f"補課日「{name}」須以 follows 指定照星期幾上課")
+        for d in self.days or []:
+            if d not in DAYS: raise ValueError(f"行事曆事件「{name}」的星期不正確：{d}")
+        for p in self.periods or []:
+            if p not in PERIODS: raise ValueError(f"行事曆事件「{name}」的節次不正確：{p}")
+
+    def period_mask(self):
+        return np.array([self.periods is None or p in self.periods for p in PERIODS])
+
+
+class IntervalIndex:
+    # 依開始日排序的閉區間；max_end[i] 為前 i+1 個區間的最晚結束日，
+    # 查詢時二分找到開始日 <= 該日的最後一個區間，往前掃到 max_end 小於該日為止
+    def __init__(self, intervals):
+        items = sorted(intervals, key=lambda x: x[0])
+        self.starts = [s for s, _, _ in items]
+        self.ends = [e for _, e, _ in items]
+        self.values = [v for _, _, v in items]
+        self.max_end = []
+        latest = None
+        for e in self.ends:
+            latest = e if latest is None or e > latest else latest
+            self.max_end.append(latest)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def at(self, point):
+        out = []
+        i = bisect.bisect_right(self.starts, point) - 1
+        while i >= 0 and self.max_end[i] >= point:
+            if self.ends[i] >= point: out.append(self.values[i])
+            i -= 1
+        out.reverse()
+        return out
+
+
+class DayView:
+    # 某個日期的上課狀態：day 為照哪一天的課表上課 (None 表示不上課)；closed 為不可調代課的節次 [8]
+    def __init__(self, date, day, closed, notes, week):
+        self.date = date
+        self.day = day
+        self.closed = closed
+        self.notes = notes
+        self.week = week
+
+    @property
+    def teaching(self):
+        return self.day is not None and not self.closed.all()
+
+    def is_open(self, period):
+        return self.day is not None and not self.closed[PERIODS.index(str(period))]
+
+
+class SchoolCalendar:
+    def __init__(self, start=None, end=None, events=(), fingerprint=""):
+        self.start = start
+        self.end = end
+        self.events = list(events)
+        self.fingerprint = fingerprint
+        if start is not None and end is not None and end < start: raise ValueError("學期結束日早於開始日")
+        # 沒有給日期的事件 (如每雙週的固定活動) 視為整個學期都適用
+        lo, hi = start or datetime.date.min, end or datetime.date.max
+        self._index = IntervalIndex((e.start or lo, e.end or hi, e) for e in self.events)
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, config, fingerprint=""):
+        semester = config.get("semester", {})
+        start = _date(semester["start"], "學期開始") if semester.get("start") else None
+        end = _date(semester["end"], "學期結束") if semester.get("end") else None
+        events = []
+        for i, e in enumerate(config.get("events", [])):
+            name = e.get("name", f"事件 {i + 1}")
+            unknown = set(e) - EVENT_KEYS
+            if unknown: raise ValueError(f"行事曆事件「{name}」有無法辨識的欄位：{', '.join(sorted(unknown))}")
+            events.append(CalendarEvent(
+                name, e.get("kind", "holiday"),
+                _date(e["start"], f"事件「{name}」") if e.get("start") else None,
+                _date(e["end"], f"事件「{name}」") if e.get("end") else None,
+                e.get("days"), e.get("periods"), e.get("weeks"), e.get("follows")))
+        return cls(start, end, events, fingerprint)
+
+    @classmethod
+    def from_file(cls, path):
+        data = Path(path).read_bytes()
+        return cls.from_dict(json.loads(data.decode("utf-8")), hashlib.sha256(data).hexdigest())
+
+    # --- 單日查詢 ---
+    def week_of(self, date):
+        # 學期第幾週 (開學日所在的那一週為第 1 週)；沒有學期設定時回傳 None
+        if self.start is None: return None
+        monday = self.start - datetime.timedelta(days=self.start.weekday())
+        return (date - monday).days // 7 + 1
+
+    def in_semester(self, date):
+        return (self.start is None or date >= self.start) and (self.end is None or date <= self.end)
+
+    def day(self, date):
+        with self._lock:
+            view = self._days.get(date)
+            if view is not None:
+                self._days.move_to_end(date)
+                return view
+        view = self._build_day(date)
+        with self._lock:
+            self._days[date] = view
+            while len(self._days) > DAY_MEMORY_ENTRIES:
+                self._days.popitem(last=False)
+        return view
+
+    def _build_day(self, date):
+        week = self.week_of(date)
+        closed = np.zeros(len(PERIODS), dtype=bool)
+        if not self.in_semester(date):
+            closed[:] = True
+            closed.flags.writeable = False
+            return DayView(date, None, closed, ["非學期期間"], week)
+        day = DAYS[date.weekday()] if date.weekday() < len(DAYS) else None
+        notes = []
+        events = [e for e in self._index.at(date)
+                  if e.weeks is None or week is None or week % 2 == WEEK_PARITY[e.weeks]]
+        for e in events:
+            if e.kind == "makeup":
+                day = e.follows
+                notes.append(e.name)
+        for e in events:
+            if e.kind == "makeup" or day is None: continue
+            if e.days is not None and day not in e.days: continue
+            closed |= e.period_mask()
+            notes.append(e.name)
+        if day is None: closed[:] = True
+        closed.flags.writeable = False
+        return DayView(date, day, closed, notes, week)
+
+    def is_open(self, date, period):
+        return self.day(date).is_open(period)
+
+    # --- 區間查詢 (逐日產生，不預先展開) ---
+    def days_between(self, start, end):
+        d = start
+        while d <= end:
+            yield self.day(d)
+            d += datetime.timedelta(days=1)
+
+    def teaching_days(self, start, end):
+        return (v for v in self.days_between(start, end) if v.teaching)
+
+    def next_date(self, day, after=None):
+        # after 之後 (含當天) 第一個照星期 day 上課的日期；學期內找不到時回傳 None
+        d = after or datetime.date.today()
+        last = self.end or d + datetime.timedelta(days=366)
+        while d <= last:
+            if self.day(d).day == day: return d
+            d += datetime.timedelta(days=1)
+        return None
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def load_calendar(path=None):
+    # 與鎖定規則相同，依檔案修改時間重新載入；預設設定檔不存在時視為沒有例外的行事曆
+    path = Path(path or DEFAULT_CALENDAR_PATH)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _load_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, SchoolCalendar.from_file(path) if mtime is not None else SchoolCalendar())
+            _loaded[path] = cached
+        return cached[1]
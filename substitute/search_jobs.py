@@ -0,0 +1,87 @@
+import threading
+import time
+
+from substitute.cycle_search import MAX_DEPTH, MAX_RESULTS, CycleSearch
+from substitute.parallel_search import parallel_find_cycles
+
+# ==========================================
+# 背景搜尋工作：在執行緒中逐條產生結果，介面端定期讀取進度並可隨時取消
+# ==========================================
+
+
+class SearchJob:
+    def __init__(self, meta=None):
+        self.meta = meta or {}
+        self.results = []
+        self.nodes = 0
+        self.progress = ""
+        self.state = "running"      # running / done / cancelled / timeout / error
+        self.error = None
+        self.started = time.monotonic()
+        self.finished_after = None
+        self.stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    @property
+    def elapsed(self):
+        return (self.finished_after if self.finished_after is not None else time.monotonic() - self.started)
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def _add(self, item):
+        self.results.append(item)
+
+    def _finish(self, state):
+        self.finished_after = time.monotonic() - self.started
+        self.state = "cancelled" if self.stop_event.is_set() and state == "done" else state
+
+    def start(self, target):
+        def run():
+            try:
+                self._finish(target(self))
+            except Exception as e:
+                self.error = e
+                self._finish("error")
+        self._thread = threading.Thread(target=run, name="substitute-search", daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return self
+
+
+def start_cycle_search(graph, who_a, src_day, src_per, a_valid_targets, max_depth=MAX_DEPTH,
+                       max_results=MAX_RESULTS, deadline=None, workers=None, meta=None):
+    # workers 為 None 時在背景執行緒中逐條產生；否則交給多行程平行搜尋，分支完成時回報進度
+    job = SearchJob(meta)
+
+    def serial(job):
+        search = CycleSearch(graph, who_a, src_day, src_per, a_valid_targets, max_depth)
+        search.deadline = deadline
+        search.stop_event = job.stop_event
+        for path in search.iter_cycles():
+            job._add(path)
+            job.nodes = search.nodes
+            if max_results and len(job.results) >= max_results: break
+        job.nodes = search.nodes
+        return "timeout" if search.timed_out else "done"
+
+    def parallel(job):
+        def on_progress(done, total, nodes):
+            job.nodes = nodes
+            job.progress = f"{done}/{total} 分支"
+        paths, timed_out, nodes = parallel_find_cycles(
+            graph, who_a, src_day, src_per, a_valid_targets, max_depth, max_results, deadline,
+            workers, stop_event=job.stop_event, on_progress=on_progress)
+        for path in paths:
+            job._add(path)
+        job.nodes = nodes
+        return "timeout" if timed_out else "done"
+
+    return job.start(serial if workers is None else parallel)
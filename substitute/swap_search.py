@@ -0,0 +1,190 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from substitute.absence_plan import is_adjacent
+from substitute.cycle_search import N_SLOTS, slot_id
+from substitute.xinhe_parser import DAYS, PERIODS
+
+# ==========================================
+# 雙人直接調課：全校互換對照表
+#   A 在 s1 有課要調出、B 在 s1 有空；B 在 s2 有課可釋出、A 在 s2 可接收
+#   「(s1, s2) → 可互換的 B」與 A 無關，每個資料集只需建立一次，查詢時直接查表
+# ==========================================
+MY_CLASSES = "⭐ 我的任課班級"
+ANY = "不指定"
+
+# 互換方案排序 (分數越低越優先)
+BONUS_SAME_CLASS = 5.0      # B 還課的班級就是 A 調出的班級 (⭐)
+BONUS_SAME_DOMAIN = 2.0
+WEIGHT_B_DAY_LOAD = 0.5     # 互換後 B 在調入那天的節數
+COST_CONSECUTIVE = 1.0      # 互換後 A、B 新接的課與自己的課相鄰 (每一側)
+SWAP_PAGE_SIZE = 20
+ADJACENT = np.array([[is_adjacent(p, q) for q in PERIODS] for p in PERIODS])
+
+
+class SwapMatrix:
+    def __init__(self, index, slot_locked, cell_locked):
+        self.index = index
+        n = len(index.teachers)
+        no_last = np.array([p != '8' for p in PERIODS])
+        self.free = index.free.reshape(n, -1)
+        self.releasable = (index.busy & ~cell_locked).reshape(n, -1)
+        self.receivable = (index.free & ~slot_locked[None] & no_last[None, None, :]).reshape(n, -1)
+
+        # 對照表 (CSR)：鍵 s1 * N_SLOTS + s2，同一鍵內依教師順序排列
+        s1, b, s2 = np.nonzero(self.free.T[:, :, None] & self.releasable[None, :, :])
+        keys = s1 * N_SLOTS + s2
+        order = np.argsort(keys, kind="stable")
+        self.partner = b[order]
+        self.offsets = np.searchsorted(keys[order], np.arange(N_SLOTS * N_SLOTS + 1))
+        self.pair_counts = np.diff(self.offsets).reshape(N_SLOTS, N_SLOTS)
+        self._table = None
+
+    def partners(self, s1, s2):
+        k = s1 * N_SLOTS + s2
+        return self.partner[self.offsets[k]:self.offsets[k + 1]]
+
+    def options(self, a, s1, s2_list=None):
+        # A 在 s1 的課可換到的所有 (B, s2)，依教師、時段排序
+        if s2_list is None: s2_list = np.flatnonzero(self.receivable[a])
+        b_parts, s2_parts = [], []
+        for s2 in s2_list:
+            bs = self.partners(s1, s2)
+            b_parts.append(bs)
+            s2_parts.append(np.full(len(bs), s2))
+        if not b_parts: return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        b_idx, s2_idx = np.concatenate(b_parts), np.concatenate(s2_parts)
+        order = np.lexsort((s2_idx, b_idx))
+        return b_idx[order], s2_idx[order]
+
+    def option_counts(self):
+        # [T, 40]：每堂可調出的課有幾個互換方案；不可調出的格子為 0
+        return (self.receivable.astype(np.int64) @ self.pair_counts.T) * self.releasable
+
+    def partner_counts(self):
+        # [T, 40]：每堂可調出的課有幾位不同的互換教師
+        counts = np.zeros(self.releasable.shape, dtype=np.int64)
+        recv = self.receivable.astype(np.float32)
+        for s1 in range(N_SLOTS):
+            rows = np.flatnonzero(self.releasable[:, s1])
+            if len(rows) == 0: continue
+            q = (self.releasable & self.free[:, s1, None]).astype(np.float32)
+            counts[rows, s1] = ((recv[rows] @ q.T) > 0).sum(axis=1)
+        return counts
+
+    def table(self):
+        # 全校每堂可調出課程的互換機會，依 (教師, 時段) 與班級查詢
+        if self._table is None:
+            index = self.index
+            n = len(index.teachers)
+            t_idx, s_idx = np.nonzero(self.releasable)
+            classes = np.array(index.classes + [""], dtype=object)
+            subjects = np.array(index.subjects + [""], dtype=object)
+            self._table = pd.DataFrame({
+                "教師": np.array(index.teachers, dtype=object)[t_idx],
+                "星期": np.array(DAYS, dtype=object)[s_idx // len(PERIODS)],
+                "節次": np.array(PERIODS, dtype=object)[s_idx % len(PERIODS)],
+                "班級": classes[index.class_codes.reshape(n, -1)[t_idx, s_idx]],
+                "課程名稱": subjects[index.subject_codes.reshape(n, -1)[t_idx, s_idx]],
+                "互換方案": self.option_counts()[t_idx, s_idx],
+                "互換教師": self.partner_counts()[t_idx, s_idx],
+            })
+        return self._table
+
+    def by_class(self, class_name):
+        table = self.table()
+        return table[table["班級"] == class_name].reset_index(drop=True)
+
+    def class_summary(self):
+        # 各班可調出課程數、完全找不到互換對象的堂數 (卡住的班級排在前面)
+        table = self.table()
+        table = table[table["班級"] != ""]
+        summary = table.groupby("班級").agg(
+            課堂數=("互換方案", "size"),
+            無法互換=("互換方案", lambda s: int((s == 0).sum())),
+            最少方案=("互換方案", "min"),
+            平均方案=("互換方案", "mean"),
+        ).reset_index()
+        summary["平均方案"] = summary["平均方案"].round(1)
+        return summary.sort_values(["無法互換", "最少方案"], ascending=[False, True]).reset_index(drop=True)
+
+
+class SwapResults:
+    # 互換方案依分數由堆積逐批取出：只有顯示到的列才排序並組成表格
+    def __init__(self, columns, score):
+        self.columns = columns
+        self.score = score
+        self._heap = [(s, i) for i, s in enumerate(score.tolist())]     # 同分時維持教師、星期、節次順序
+        heapq.heapify(self._heap)
+        self._ranked = []
+
+    def __len__(self):
+        return len(self.score)
+
+    @property
+    def empty(self):
+        return len(self.score) == 0
+
+    def top(self, k):
+        while len(self._ranked) < k and self._heap:
+            self._ranked.append(heapq.heappop(self._heap)[1])
+        rows = np.array(self._ranked[:k], dtype=int)
+        frame = pd.DataFrame({name: col[rows] for name, col in self.columns.items()})
+        frame["分數"] = np.round(self.score[rows], 1)
+        return frame
+
+    def all(self):
+        return self.top(len(self))
+
+
+def rank_direct_swaps(matrix, who_a, src_day, src_per, target=None,
+                      filter_teacher=ANY, filter_class=ANY, my_classes=(), filter_b_day=ANY, filter_b_per=ANY,
+                      my_src_class="", domain_map=None):
+    # target：A 指定的調入時段 (星期, 節次)，None 表示 A 所有可接收的空堂
+    index = matrix.index
+    a = index.teacher_pos[who_a]
+    s1 = slot_id(src_day, src_per)
+    b_idx, s2_idx = matrix.options(a, s1, [slot_id(*target)] if target else None)
+
+    d_idx, p_idx = s2_idx // len(PERIODS), s2_idx % len(PERIODS)
+    class_codes = index.class_codes[b_idx, d_idx, p_idx]
+    keep = b_idx != a
+    if filter_teacher != ANY: keep &= b_idx == index.teacher_pos.get(filter_teacher, -2)
+    if filter_class == MY_CLASSES:
+        keep &= np.isin(class_codes, [index.class_pos[c] for c in my_classes if c in index.class_pos])
+    elif filter_class != ANY:
+        keep &= class_codes == index.class_pos.get(filter_class, -2)
+    if filter_b_day != ANY: keep &= d_idx == (DAYS.index(filter_b_day) if filter_b_day in DAYS else -1)
+    if filter_b_per != ANY: keep &= p_idx == (PERIODS.index(filter_b_per) if filter_b_per in PERIODS else -1)
+
+    b_idx, d_idx, p_idx, class_codes = b_idx[keep], d_idx[keep], p_idx[keep], class_codes[keep]
+    if len(b_idx) == 0: return SwapResults({}, np.empty(0))
+
+    subject_codes = index.subject_codes[b_idx, d_idx, p_idx]
+    classes = np.array(index.classes + [""], dtype=object)
+    subjects = np.array(index.subjects + [""], dtype=object)
+    starred = class_codes == (index.class_pos.get(my_src_class, -2) if my_src_class else -2)
+
+    # 各項分數：B 在 s1 接 A 的課、A 在 s2 接 B 的課；同一天互換時 B 釋出的那節不算
+    d1, p1 = s1 // len(PERIODS), s1 % len(PERIODS)
+    same_day = d_idx == d1
+    b_day_load = index.busy[b_idx, d1].sum(axis=1) + 1 - same_day
+    b_adjacent = (index.busy[b_idx, d1] & ADJACENT[p1]).sum(axis=1) - (same_day & ADJACENT[p1, p_idx])
+    a_adjacent = (index.busy[a, d_idx] & ADJACENT[p_idx]).sum(axis=1) - (same_day & ADJACENT[p_idx, p1])
+    same_domain = np.zeros(len(b_idx), dtype=bool)
+    if domain_map is not None and domain_map.get(who_a, "未知") != "未知":
+        domains = np.array([domain_map.get(t) for t in index.teachers], dtype=object)
+        same_domain = domains[b_idx] == domain_map[who_a]
+    score = (WEIGHT_B_DAY_LOAD * b_day_load + COST_CONSECUTIVE * (a_adjacent + b_adjacent)
+             - BONUS_SAME_CLASS * starred - BONUS_SAME_DOMAIN * same_domain)
+
+    return SwapResults({
+        "標記": np.where(starred, "⭐", ""),
+        "教師": np.array(index.teachers, dtype=object)[b_idx],
+        "課程名稱": subjects[subject_codes],
+        "班級": classes[class_codes],
+        "還課星期": np.array(DAYS, dtype=object)[d_idx],
+        "還課節次": np.array(PERIODS, dtype=object)[p_idx],
+    }, score.astype(float))
@@ -0,0 +1,392 @@
+import re
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 欣河系統課表解析
+# ==========================================
+# 解析結果格式或規則變動時須更新，讓舊的快取失效
+PARSER_VERSION = "3"
+
+DAYS = ["一", "二", "三", "四", "五"]
+PERIODS = [str(i) for i in range(1, 9)]
+PERIOD_MAP_ZH = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5", "六": "6", "七": "7", "八": "8", "九": "9"}
+
+TEACHER_RE = re.compile(r"教師[:：\s]*([^\s,0-9]+)")
+TITLE_RE = re.compile(r'(導師|老師|專任|代理|組長|教官|主任)')
+CONTENT_RE = r"^(.*)\s+\((.*)\)$"
+OUTPUT_COLUMNS = ["teacher", "day", "period", "content", "subject", "class_name"]
+
+XLSX_MAGIC = b"PK\x03\x04"
+XLS_MAGIC = b"\xd0\xcf\x11\xe0"
+PDF_MAGIC = b"%PDF"
+EXCEL_CHUNK_ROWS = 2000
+
+
+def read_xinhe_sheet(uploaded_file):
+    try:
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, encoding='utf-8', header=None, on_bad_lines='skip')
+    except:
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, encoding='cp950', header=None, on_bad_lines='skip')
+    return df.fillna("").astype(str)
+
+
+def parse_xinhe_csv(uploaded_file):
+    return parse_xinhe_sheet(read_xinhe_sheet(uploaded_file))
+
+
+def parse_xinhe_file(uploaded_file):
+    # 依檔頭判斷格式：xlsx (zip)、舊版 xls (OLE2)、PDF，其餘視為 CSV
+    uploaded_file.seek(0)
+    head = uploaded_file.read(8)
+    uploaded_file.seek(0)
+    if head.startswith(XLSX_MAGIC): return parse_xinhe_workbook(uploaded_file)
+    if head.startswith(XLS_MAGIC): return parse_xinhe_xls(uploaded_file)
+    if head.startswith(PDF_MAGIC):
+        from substitute.pdf_ingest import parse_xinhe_pdf
+        return parse_xinhe_pdf(uploaded_file)
+    return parse_xinhe_csv(uploaded_file)
+
+
+# ==========================================
+# Excel 課表：逐列串流，分塊送進與 CSV 相同的解析流程
+# ==========================================
+def _excel_cell(v):
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+
+def iter_workbook_rows(source):
+    # openpyxl 唯讀模式逐列讀取，不會載入整本活頁簿；每張工作表結束時產生 None
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("讀取 Excel 檔需要安裝 openpyxl")
+    try:
+        wb = load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        raise ValueError(f"無法開啟 Excel 檔：{e}")
+    try:
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                yield [_excel_cell(v) for v in row]
+            yield None
+    finally:
+        wb.close()
+
+
+def _chunk_frame(rows):
+    width = max(len(r) for r in rows)
+    return pd.DataFrame([r + [""] * (width - len(r)) for r in rows], dtype=object)
+
+
+def parse_row_stream(rows, chunk_rows=EXCEL_CHUNK_ROWS):
+    # rows：每列為字串清單，None 表示工作表結束 (狀態重設)。
+    # 有效的教師列會重設目前教師與星期對照，所以只在教師列切塊，結果與整張一次解析相同；
+    # 記憶體只需容納一塊儲存格加上已解析的紀錄
+    parts, buf = [], []
+
+    def flush():
+        if buf:
+            records = _sheet_records(_chunk_frame(buf))
+            if records is not None: parts.append(records)
+            buf.clear()
+
+    for row in rows:
+        if row is None:
+            flush()
+            continue
+        if len(buf) >= chunk_rows and _teacher_from_row(row)[0]: flush()
+        buf.append(row)
+    flush()
+    if not parts: return pd.DataFrame()
+    return expand_to_full_grid(pd.concat(parts, ignore_index=True))
+
+
+def parse_xinhe_workbook(source, chunk_rows=EXCEL_CHUNK_ROWS):
+    return parse_row_stream(iter_workbook_rows(source), chunk_rows)
+
+
+def parse_xinhe_xls(source):
+    # 舊版 .xls 無法串流，需要 xlrd 一次讀入；各工作表仍分開解析
+    try:
+        sheets = pd.read_excel(source, header=None, sheet_name=None, dtype=object)
+    except ImportError:
+        raise ValueError("不支援舊版 Excel (.xls)，請另存為 .xlsx 或 CSV")
+
+    def rows():
+        for sheet in sheets.values():
+            for row in sheet.itertuples(index=False):
+                yield ["" if pd.isna(v) else _excel_cell(v) for v in row]
+            yield None
+    return parse_row_stream(rows())
+
+
+def _teacher_from_row(row):
+    # 回傳 (是否為有效教師列, 教師名稱)；名稱可能因去除職稱而成為空字串
+    match = TEACHER_RE.search(" ".join(row))
+    if match:
+        raw_name = match.group(1).replace(":", "").strip()
+        if len(raw_name) > 1 and "課程表" not in raw_name:
+            return True, TITLE_RE.sub('', raw_name)
+    return False, None
+
+
+def _day_columns(stripped_row):
+    # 與舊版相同：同一星期出現多次時取最後一欄，順序依第一次出現
+    temp_map = {}
+    for col_i, val in enumerate(stripped_row):
+        if val in DAYS:
+            temp_map[col_i] = val
+    return {v: k for k, v in temp_map.items()}
+
+
+def parse_xinhe_sheet(sheet):
+    data_df = _sheet_records(sheet)
+    if data_df is None: return pd.DataFrame()
+    return expand_to_full_grid(data_df)
+
+
+def _sheet_records(sheet):
+    # 以整張儲存格矩陣的欄向量運算找出教師列、星期標題列與節次列，
+    # 只有教師列 (數量約等於教師人數) 需要逐列處理；回傳有課的紀錄，沒有時回傳 None
+    n_rows, n_cols = sheet.shape
+    if n_rows == 0 or n_cols == 0: return None
+
+    cells = sheet.to_numpy(dtype=object)
+    stripped = sheet.apply(lambda col: col.str.strip()).to_numpy(dtype=object)
+    has_teacher_word = sheet.apply(lambda col: col.str.contains("教師", regex=False)).to_numpy(dtype=bool).any(axis=1)
+
+    is_day = np.isin(stripped, DAYS)
+    is_header = (
+        ~has_teacher_word
+        & (cells == "一").any(axis=1)
+        & (cells == "五").any(axis=1)
+        & (is_day.sum(axis=1) >= 3)
+    )
+
+    lead = stripped[:, :min(5, n_cols)]
+    is_period_cell = np.isin(lead, list(PERIOD_MAP_ZH))
+    has_period = is_period_cell.any(axis=1)
+    period_col = is_period_cell.argmax(axis=1)
+
+    # 教師列：更新目前教師並清空星期對照
+    row_ids = np.arange(n_rows)
+    teacher_rows = np.flatnonzero(has_teacher_word)
+    # 多留一格空字串，讓尚未出現教師列的 -1 索引對應到「無教師」
+    teacher_names = np.full(n_rows + 1, "", dtype=object)
+    valid_teacher = np.zeros(n_rows, dtype=bool)
+    for idx in teacher_rows:
+        ok, name = _teacher_from_row(cells[idx])
+        if ok:
+            valid_teacher[idx] = True
+            teacher_names[idx] = name
+
+    last_teacher = np.maximum.accumulate(np.where(valid_teacher, row_ids, -1))
+    last_header = np.maximum.accumulate(np.where(is_header, row_ids, -1))
+    named = teacher_names[last_teacher] != ""
+
+    active = has_period & ~has_teacher_word & ~is_header & named & (last_header > last_teacher)
+    active_rows = np.flatnonzero(active)
+    if len(active_rows) == 0: return None
+
+    # 依星期標題的欄位配置分組 (各教師的配置通常相同)，一次取出整組的班級與前一列的科目
+    layouts = {}
+    for h in np.unique(last_header[active_rows]):
+        layouts.setdefault(tuple(_day_columns(stripped[h]).items()), []).append(h)
+
+    row_parts, pos_parts, day_parts, cls_parts, subj_parts = [], [], [], [], []
+    for layout, headers in layouts.items():
+        rows = active_rows[np.isin(last_header[active_rows], headers)]
+        days = np.array([d for d, _ in layout], dtype=object)
+        cols = np.array([c for _, c in layout])
+        k = len(cols)
+        row_parts.append(np.repeat(rows, k))
+        pos_parts.append(np.tile(np.arange(k), len(rows)))
+        day_parts.append(np.tile(days, len(rows)))
+        cls_parts.append(stripped[np.ix_(rows, cols)].ravel())
+        subj_parts.append(stripped[np.ix_(rows - 1, cols)].ravel())
+
+    # 恢復舊版的紀錄順序：依列序，同列再依星期對照的順序
+    src_rows = np.concatenate(row_parts)
+    order = np.lexsort((np.concatenate(pos_parts), src_rows))
+    src_rows = src_rows[order]
+    data_df = pd.DataFrame({
+        "teacher": teacher_names[last_teacher[src_rows]],
+        "day": np.concatenate(day_parts)[order],
+        "period": pd.Series(lead[src_rows, period_col[src_rows]], dtype=object).map(PERIOD_MAP_ZH).to_numpy(dtype=object),
+        "subject": np.concatenate(subj_parts)[order],
+        "class_name": np.concatenate(cls_parts)[order],
+    }).astype(str)
+    subj = data_df['subject'].str.replace("nan", "", regex=False)
+    cls = data_df['class_name'].str.replace("nan", "", regex=False)
+    has_s, has_c = subj != "", cls != ""
+    content = (subj + " (" + cls + ")").where(has_s & has_c, subj.where(has_s, cls))
+    keep = (content.str.len() > 1) & ~content.isin(["|", "nan", "None"])
+    if not keep.any(): return None
+
+    data_df = data_df[keep].reset_index(drop=True)
+    data_df['content'] = content[keep].to_numpy(dtype=object)
+    data_df['subject'] = subj[keep].to_numpy(dtype=object)
+    data_df['class_name'] = cls[keep].to_numpy(dtype=object)
+    return data_df[OUTPUT_COLUMNS]
+
+
+def expand_to_full_grid(data_df):
+    # 將有課的紀錄展開為 教師 × 5 天 × 8 節 的完整長表 (空堂 content 為空字串)
+    codes, teachers = pd.factorize(data_df['teacher'])
+    day_pos = pd.Index(DAYS).get_indexer(data_df['day'])
+    per_pos = pd.Index(PERIODS).get_indexer(data_df['period'])
+    in_grid = (day_pos >= 0) & (per_pos >= 0)
+    slot = codes[in_grid] * 40 + day_pos[in_grid] * 8 + per_pos[in_grid]
+
+    if len(np.unique(slot)) != len(slot):
+        return _expand_by_merge(data_df, teachers)
+
+    n = len(teachers) * 40
+    content = np.full(n, "", dtype=object)
+    subject = np.full(n, "", dtype=object)
+    class_name = np.full(n, "", dtype=object)
+    content[slot] = data_df['content'].to_numpy(dtype=object)[in_grid]
+    subject[slot] = data_df['subject'].to_numpy(dtype=object)[in_grid]
+    class_name[slot] = data_df['class_name'].to_numpy(dtype=object)[in_grid]
+
+    final_df = pd.DataFrame({
+        "teacher": np.repeat(np.asarray(teachers, dtype=object), 40),
+        "day": np.tile(np.repeat(DAYS, 8), len(teachers)),
+        "period": np.tile(PERIODS, 5 * len(teachers)),
+        "content": content,
+        "subject": subject,
+        "class_name": class_name,
+    })
+    return _finish_frame(final_df)
+
+
+def _expand_by_merge(data_df, teachers):
+    # 同一時段出現多筆紀錄時沿用舊版的合併方式，保留重複列
+    full_idx = pd.MultiIndex.from_product([teachers, DAYS, PERIODS], names=['teacher', 'day', 'period'])
+    full_df = pd.DataFrame(index=full_idx).reset_index()
+    final_df = pd.merge(full_df, data_df, on=['teacher', 'day', 'period'], how='left')
+    for col in ['content', 'subject', 'class_name']:
+        final_df[col] = final_df[col].fillna("")
+    return _finish_frame(final_df)
+
+
+def _finish_frame(final_df):
+    final_df['is_free'] = final_df['content'] == ""
+    # 科目與班級皆空白但內容有值時，才從內容「科目 (班級)」拆出
+    need_split = (final_df['subject'] == "") & (final_df['class_name'] == "") & (final_df['content'] != "")
+    if need_split.any():
+        content = final_df.loc[need_split, 'content'].astype(object)
+        parts = content.str.extract(CONTENT_RE)
+        final_df.loc[need_split, 'subject'] = parts[0].where(parts[0].notna(), content)
+        final_df.loc[need_split, 'class_name'] = parts[1].fillna("")
+    return final_df.astype(str)
+
+
+# ==========================================
+# 舊版逐列解析 (保留作為效能基準與結果對照)
+# ==========================================
+def parse_xinhe_csv_legacy(uploaded_file):
+    df = read_xinhe_sheet(uploaded_file)
+    all_data = []
+    current_teacher = None
+    day_col_map = {}
+    period_map_zh = PERIOD_MAP_ZH
+
+    for idx in range(len(df)):
+        row = df.iloc[idx].values
+        row_str = " ".join(row)
+
+        if "教師" in row_str:
+            match = re.search(r"教師[:：\s]*([^\s,0-9]+)", row_str)
+            if match:
+                raw_name = match.group(1).replace(":", "").strip()
+                if len(raw_name) > 1 and "課程表" not in raw_name:
+                    current_teacher = re.sub(r'(導師|老師|專任|代理|組長|教官|主任)', '', raw_name)
+                    day_col_map = {}
+            continue
+
+        if "一" in row and "五" in row:
+            temp_map = {}
+            for col_i, val in enumerate(row):
+                val = val.strip()
+                if val in ["一", "二", "三", "四", "五"]:
+                    temp_map[col_i] = val
+            if len(temp_map) >= 3:
+                day_col_map = {v: k for k, v in temp_map.items()}
+                continue
+
+        if not current_teacher or not day_col_map: continue
+
+        target_period = None
+        for i in range(min(5, len(row))):
+            val = row[i].strip()
+            if val in period_map_zh:
+                target_period = period_map_zh[val]
+                break
+
+        if target_period:
+            prev_row = df.iloc[idx-1].values if idx > 0 else None
+            for day, col_idx in day_col_map.items():
+                if col_idx < len(row):
+                    class_info = row[col_idx].strip()
+                    subject_info = ""
+                    if prev_row is not None and col_idx < len(prev_row):
+                        subject_info = prev_row[col_idx].strip()
+
+                    subject_info = subject_info.replace("nan", "")
+                    class_info = class_info.replace("nan", "")
+
+                    full_content = ""
+                    if subject_info and class_info:
+                        full_content = f"{subject_info} ({class_info})"
+                    elif subject_info:
+                        full_content = subject_info
+                    elif class_info:
+                        full_content = class_info
+
+                    is_free = True
+                    if len(full_content) > 1 and full_content not in ["|", "nan", "None"]:
+                        is_free = False
+
+                    if not is_free:
+                        all_data.append({
+                            "teacher": current_teacher,
+                            "day": day,
+                            "period": target_period,
+                            "content": full_content,
+                            "subject": subject_info,
+                            "class_name": class_info
+                        })
+
+    if not all_data: return pd.DataFrame()
+    data_df = pd.DataFrame(all_data)
+
+    teachers = data_df['teacher'].unique()
+    days = ["一", "二", "三", "四", "五"]
+    periods = [str(i) for i in range(1, 9)]
+    full_idx = pd.MultiIndex.from_product([teachers, days, periods], names=['teacher', 'day', 'period'])
+    full_df = pd.DataFrame(index=full_idx).reset_index()
+    final_df = pd.merge(full_df, data_df, on=['teacher', 'day', 'period'], how='left')
+
+    final_df['content'] = final_df['content'].fillna("")
+    final_df['subject'] = final_df['subject'].fillna("")
+    final_df['class_name'] = final_df['class_name'].fillna("")
+    final_df['is_free'] = final_df['content'] == ""
+
+    def split_content(row):
+        s, c = row['subject'], row['class_name']
+        if s or c: return str(s), str(c)
+        match = re.search(r"^(.*)\s+\((.*)\)$", str(row['content']))
+        if match: return match.group(1), match.group(2)
+        return str(row['content']), ""
+
+    res = final_df.apply(split_content, axis=1)
+    final_df['subject'] = [x[0] for x in res]
+    final_df['class_name'] = [x[1] for x in res]
+
+    return final_df.astype(str)
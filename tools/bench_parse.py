@@ -0,0 +1,49 @@
+# 解析器效能基準：比較向量化解析與舊版逐列解析
+#   python tools/bench_parse.py                 # 以合成課表測試 (預設 200 / 1000 位教師)
+#   python tools/bench_parse.py --csv 課表.csv   # 以實際匯出檔測試
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from substitute.xinhe_parser import parse_xinhe_csv, parse_xinhe_csv_legacy
+from synth_timetable import synth_xinhe_csv
+
+
+def best_of(fn, data, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(io.BytesIO(data))
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def run(label, data, repeat):
+    t_old, old = best_of(parse_xinhe_csv_legacy, data, repeat)
+    t_new, new = best_of(parse_xinhe_csv, data, repeat)
+    pd.testing.assert_frame_equal(old, new)
+    print(f"{label:<24} 列數 {len(new):>8}  舊版 {t_old * 1000:9.1f} ms  新版 {t_new * 1000:8.1f} ms  加速 {t_old / t_new:6.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="欣河課表解析效能比較")
+    ap.add_argument("--csv", help="實際的欣河匯出 CSV")
+    ap.add_argument("--teachers", type=int, nargs="*", default=[200, 1000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.csv:
+        run(Path(args.csv).name, Path(args.csv).read_bytes(), args.repeat)
+        return
+    for n in args.teachers:
+        run(f"合成 {n} 位教師", synth_xinhe_csv(n), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# 效能基準套件：以合成課表在不同規模下計時各個熱點，結果存成 JSON 以便跨版本比較
+#   python tools/bench_suite.py                              # 預設 50 / 200 / 500 / 1000 / 2000 位教師
+#   python tools/bench_suite.py --teachers 200 -o 結果.json
+#   python tools/bench_suite.py --compare .bench/舊版.json    # 與先前的結果比較
+import argparse
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from substitute.absence_plan import plan_absence
+from substitute.api import Timetable
+from substitute.derived import DerivedData
+from substitute.parse_cache import content_key
+from substitute.swap_search import SwapMatrix
+from substitute.xinhe_parser import DAYS, PERIODS, parse_xinhe_csv
+from synth_timetable import synth_xinhe_csv
+
+RESULTS_DIR = ROOT / ".bench"
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def timed(fn, repeat):
+    # 回傳 (每次耗時 ms 清單, 最後一次的回傳值)
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return times, out
+
+
+def record(results, scale, bench, times, ops=1, **extra):
+    row = {
+        "teachers": scale,
+        "bench": bench,
+        "ops": ops,
+        "best_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "per_op_ms": round(min(times) / ops, 4),
+        **extra,
+    }
+    results.append(row)
+    print(f"{scale:>6} 位教師  {bench:<14} 最佳 {row['best_ms']:10.2f} ms  中位數 {row['median_ms']:10.2f} ms"
+          f"  每次 {row['per_op_ms']:9.3f} ms" + "".join(f"  {k}={v}" for k, v in extra.items()))
+
+
+def bench_scale(n, args, results):
+    data = synth_xinhe_csv(n, args.classes, args.fill_rate, args.locked_rate, args.seed)
+    rng = random.Random(args.seed)
+
+    # 1. 解析
+    times, df = timed(lambda: parse_xinhe_csv(io.BytesIO(data)), args.repeat)
+    record(results, n, "parse", times, rows=len(df))
+
+    # 2. 衍生資料 (索引、領域、鎖定遮罩)
+    key = content_key(data)
+    times, derived = timed(lambda: DerivedData(key, df), args.repeat)
+    record(results, n, "derive", times)
+    tt = Timetable(derived)
+
+    # 3. 尋找空堂：全部 40 個時段各查一次
+    slots = [(d, p) for d in DAYS for p in PERIODS]
+    times, _ = timed(lambda: [tt.free_teachers(d, p) for d, p in slots], args.repeat)
+    record(results, n, "free_lookup", times, ops=len(slots))
+
+    # 4. 雙人互換：對照表建立 + 隨機查詢
+    times, matrix = timed(lambda: SwapMatrix(derived.index, derived.slot_locked, derived.cell_locked), args.repeat)
+    record(results, n, "swap_matrix", times, pairs=int(len(matrix.partner)))
+    derived._swap_matrix = matrix
+    queries = []
+    for t in rng.sample(tt.teachers, min(args.queries, len(tt.teachers))):
+        rel = derived.releasable_slots(t)
+        if rel:
+            r = rng.choice(rel)
+            queries.append((t, r['day'], r['period']))
+    times, found = timed(lambda: [len(tt.direct_swaps(t, d, p)) for t, d, p in queries], args.repeat)
+    record(results, n, "swap_query", times, ops=len(queries), found=int(sum(found)))
+
+    # 5. 多角調 (單一行程，每次最多 50 條)
+    cycle_queries = queries[:args.cycle_queries]
+    times, found = timed(lambda: [tt.find_cycles(t, d, p, timeout=args.timeout) for t, d, p in cycle_queries], 1)
+    record(results, n, "cycle_search", times, ops=len(cycle_queries),
+           found=sum(len(paths) for paths, _ in found), timed_out=sum(bool(to) for _, to in found))
+
+    # 6. 請假代課規劃 (一週)
+    monday = datetime.date(2026, 1, 5)
+    absent = [t for t, _, _ in queries[:args.cycle_queries]]
+    times, _ = timed(lambda: [plan_absence(derived.index, derived.free_map, derived.slot_locked, derived.teacher_domain_map,
+                                           t, monday, monday + datetime.timedelta(days=4)) for t in absent], args.repeat)
+    record(results, n, "absence_plan", times, ops=len(absent))
+
+
+def compare(base_path, results):
+    base = json.loads(Path(base_path).read_text(encoding="utf-8"))
+    old = {(r["teachers"], r["bench"]): r for r in base["results"]}
+    print(f"\n與 {base_path} ({base['meta'].get('commit', '?')}) 比較：")
+    for r in results:
+        o = old.get((r["teachers"], r["bench"]))
+        if o is None: continue
+        ratio = o["per_op_ms"] / r["per_op_ms"] if r["per_op_ms"] else float("inf")
+        flag = "  ⚠️ 變慢" if ratio < 0.9 else ""
+        print(f"{r['teachers']:>6} 位教師  {r['bench']:<14} {o['per_op_ms']:9.3f} → {r['per_op_ms']:9.3f} ms  {ratio:5.2f}x{flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="調代課系統效能基準")
+    ap.add_argument("--teachers", type=int, nargs="*", default=[50, 200, 500, 1000, 2000])
+    ap.add_argument("--classes", type=int, default=40)
+    ap.add_argument("--fill-rate", type=float, default=0.6)
+    ap.add_argument("--locked-rate", type=float, default=0.02)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--queries", type=int, default=50, help="雙人互換隨機查詢次數")
+    ap.add_argument("--cycle-queries", type=int, default=10, help="多角調與請假規劃的查詢次數")
+    ap.add_argument("--timeout", type=float, default=10, help="每次多角調搜尋的時間上限 (秒)")
+    ap.add_argument("-o", "--output", help=f"結果 JSON (預設存到 {RESULTS_DIR.name}/<commit>-<時間>.json)")
+    ap.add_argument("--compare", help="與先前的結果 JSON 比較")
+    args = ap.parse_args()
+
+    commit = _git_commit()
+    results = []
+    for n in args.teachers:
+        bench_scale(n, args, results)
+
+    meta = {
+        "commit": commit,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "args": vars(args),
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"\n結果已寫入 {output}")
+    if args.compare: compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# 差異比對驗證：以原本 (v40) 頁面 3 / 頁面 4 的演算法為參考答案，比對最佳化後的搜尋引擎
+#   python tools/oracle.py                     # 預設 200 組隨機課表
+#   python tools/oracle.py --cases 1000 --seed 7
+# 結果不一致時會縮減課表到最小的失敗範例，並寫出可直接上傳的欣河格式 CSV
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from substitute.api import Timetable
+from substitute.cycle_search import MAX_DEPTH, MAX_RESULTS, CycleSearch
+from substitute.derived import DerivedData
+from substitute.swap_search import ANY, MY_CLASSES
+from substitute.xinhe_parser import DAYS, PERIODS, expand_to_full_grid
+from synth_timetable import teacher_name
+
+SUBJECTS = ["國文", "英文", "數學", "物理", "歷史", "體育", "閩南語", "班會"]
+REF_DFS_BUDGET = 5000
+SKIPPED = "skipped"
+
+
+# ==========================================
+# 參考答案：凍結自 v40 的 app (逐列、以 DataFrame 查詢)，只移除 Streamlit 與結果上限
+# ==========================================
+def ref_is_locked_time(day, period, subject="", class_name=""):
+    # 1. 全校鎖定
+    if day == "三" and str(period) in ["5", "6", "7"]:
+        return True
+
+    # 2. 閩南語不可調
+    if "閩南語" in subject:
+        return True
+
+    # 3. 高一1~高一8 週四第7節不可調
+    if day == "四" and str(period) == "7":
+        if class_name and "高一" in class_name:
+            suffix = class_name.replace("高一", "").strip()
+            if suffix.isdigit():
+                num = int(suffix)
+                if 1 <= num <= 8:
+                    return True
+
+    return False
+
+
+def ref_sources(df, who_a):
+    # 頁面 3 / 4 步驟 1：可調出的課 → {(星期, 節次): 班級}
+    a_busy = df[(df['teacher'] == who_a) & (df['is_free'] == "False")]
+    out = {}
+    for _, r in a_busy.iterrows():
+        if ref_is_locked_time(r['day'], r['period'], r['subject'], r['class_name']): continue
+        out[(r['day'], r['period'])] = r['class_name']
+    return out
+
+
+def ref_free(df, who_a):
+    # 頁面 3 / 4 步驟 2：可換入的空堂
+    a_free = df[(df['teacher'] == who_a) & (df['is_free'] == "True") & (df['period'] != '8')]
+    a_free = a_free[~a_free.apply(lambda x: ref_is_locked_time(x['day'], x['period']), axis=1)] if len(a_free) else a_free
+    return a_free
+
+
+def ref_direct_swaps(df, who_a, s_day, s_per, target, filter_teacher, filter_class, filter_b_day, filter_b_per):
+    sources = ref_sources(df, who_a)
+    my_teaching_classes = {c for c in sources.values() if c}
+    my_src_class = sources.get((s_day, s_per), "")
+    a_free = ref_free(df, who_a)
+    t_day, t_per = target if target else (None, None)
+
+    cands = df[(df['day'] == s_day) & (df['period'] == s_per) & (df['is_free'] == "True") & (df['teacher'] != who_a)]
+    if filter_teacher != "不指定": cands = cands[cands['teacher'] == filter_teacher]
+    results = []
+    for b in cands['teacher'].unique():
+        if t_day and t_per:
+            b_crs = df[(df['teacher'] == b) & (df['day'] == t_day) & (df['period'] == t_per)]
+        else:
+            b_crs = df[(df['teacher'] == b) & (df['is_free'] == "False")]
+        for _, row_data in b_crs.iterrows():
+            if ref_is_locked_time(row_data['day'], row_data['period'], row_data['subject'], row_data['class_name']): continue
+            if not t_day:
+                a_check = a_free[(a_free['day'] == row_data['day']) & (a_free['period'] == row_data['period'])]
+                if a_check.empty: continue
+            if row_data['is_free'] == "True": continue
+            b_class = row_data['class_name']
+            if filter_class == "⭐ 我的任課班級":
+                if b_class not in my_teaching_classes: continue
+            elif filter_class != "不指定" and b_class != filter_class:
+                continue
+            if filter_b_day != "不指定" and row_data['day'] != filter_b_day: continue
+            if filter_b_per != "不指定" and row_data['period'] != filter_b_per: continue
+            mark = ""
+            if my_src_class and b_class and my_src_class == b_class: mark = "⭐"
+            results.append((mark, b, row_data['subject'], b_class, row_data['day'], row_data['period']))
+    return results
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def ref_find_cycles(df, who_a4, s_day, s_per, target, max_depth=MAX_DEPTH, budget=REF_DFS_BUDGET):
+    # 原本的 dfs_find_loop (不設結果上限與逾時)；展開超過 budget 個節點時放棄 (該查詢略過不比)
+    clean_classes = sorted([str(c) for c in df['class_name'].unique() if str(c).strip() != ""])
+    class_teacher_map = {cls: set(df[df['class_name'] == cls]['teacher'].unique()) for cls in clean_classes}
+    free_map = {}
+    for d in DAYS:
+        for p in PERIODS:
+            if ref_is_locked_time(d, p):
+                free_map[(d, p)] = set()
+            else:
+                free_map[(d, p)] = set(df[(df['day'] == d) & (df['period'] == p) & (df['is_free'] == "True")]['teacher'].unique())
+
+    start_class_name = ref_sources(df, who_a4).get((s_day, s_per), "")
+    target_class_lock = start_class_name
+    if target:
+        a_valid_targets = {target}
+    else:
+        a_valid_targets = {(r['day'], r['period']) for _, r in ref_free(df, who_a4).iterrows()}
+    found_paths = []
+    busy_rows = {}
+    calls = [0]
+
+    def dfs_find_loop(current_teacher, offering_day, offering_period, offering_class, path, visited):
+        calls[0] += 1
+        if calls[0] > budget: raise BudgetExceeded
+        if len(path) >= max_depth: return
+        candidates = free_map.get((offering_day, offering_period), set())
+        teachers_of_class = class_teacher_map.get(offering_class, set())
+        valid_candidates = []
+        for c in candidates:
+            if c in visited or c == who_a4: continue
+            if offering_class and c not in teachers_of_class: continue
+            valid_candidates.append(c)
+        for next_person in valid_candidates:
+            if next_person not in busy_rows:
+                next_busy_slots = df[(df['teacher'] == next_person) & (df['is_free'] == "False")]
+                busy_rows[next_person] = [row.to_dict() for _, row in next_busy_slots.iterrows()]
+            for row_b in busy_rows[next_person]:
+                b_out_day = row_b['day']
+                b_out_per = row_b['period']
+                if ref_is_locked_time(b_out_day, b_out_per, row_b['subject'], row_b['class_name']): continue
+                if row_b['class_name'] != target_class_lock: continue
+                if (b_out_day, b_out_per) in a_valid_targets:
+                    final_step = {'from': next_person, 'to': who_a4, 'day': b_out_day, 'period': b_out_per,
+                                  'content': row_b['content'], 'class': row_b['class_name']}
+                    found_paths.append(path + [{'from': current_teacher, 'to': next_person, 'day': offering_day,
+                                                'period': offering_period, 'content': next_person + " 接手",
+                                                'class': offering_class}, final_step])
+                elif len(path) < max_depth - 1:
+                    new_step = {'from': current_teacher, 'to': next_person, 'day': offering_day,
+                                'period': offering_period, 'content': row_b['content'], 'class': offering_class}
+                    dfs_find_loop(next_person, b_out_day, b_out_per, row_b['class_name'], path + [new_step], visited | {next_person})
+
+    dfs_find_loop(who_a4, s_day, s_per, start_class_name, [], {who_a4})
+    return found_paths
+
+
+# ==========================================
+# 隨機課表：直接產生有課紀錄 (教師, 星期, 節次, 科目, 班級)，方便縮減
+# ==========================================
+def random_records(rng, n_teachers, n_classes, fill_rate):
+    classes = [f"高{g}{i}" for g in "一二" for i in range(1, 10)]
+    classes = rng.sample(classes, n_classes) + ["高一 3", ""]      # 含空白與無班級的特殊情況
+    records = []
+    for t in range(n_teachers):
+        taught = rng.sample(classes, min(len(classes), rng.randint(1, 4)))
+        subject = rng.choice(SUBJECTS[:6])
+        for d in DAYS:
+            for p in PERIODS:
+                if rng.random() >= fill_rate: continue
+                subj = rng.choice(SUBJECTS) if rng.random() < 0.15 else subject
+                records.append((teacher_name(t), d, p, subj, rng.choice(taught)))
+    return records
+
+
+def to_frame(records):
+    if not records: return pd.DataFrame()
+    df = pd.DataFrame(records, columns=["teacher", "day", "period", "subject", "class_name"])
+    df["content"] = [f"{s} ({c})" if s and c else (s or c) for s, c in zip(df["subject"], df["class_name"])]
+    return expand_to_full_grid(df)
+
+
+def to_xinhe_csv(records):
+    # 寫回欣河格式 (科目列 + 班級列)，可直接在網頁或命令列重現
+    cells = {(t, d, p): (s, c) for t, d, p, s, c in records}
+    lines = []
+    for t in dict.fromkeys(r[0] for r in records):
+        lines += ["成德高中 教師課程表,,,,,,", f"教師：{t}老師,,,,,,", "節次,時間,一,二,三,四,五"]
+        for i, p in enumerate(PERIODS):
+            row = [cells.get((t, d, p), ("", "")) for d in DAYS]
+            lines.append(",," + ",".join(s for s, _ in row))
+            lines.append(f"{'一二三四五六七八'[i]},{8 + i:02d}:10," + ",".join(c for _, c in row))
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================
+# 比對
+# ==========================================
+def _path_key(path):
+    return tuple((s['from'], s['to'], s['day'], s['period'], s['content'], s['class']) for s in path)
+
+
+def check_query(records, query):
+    # 回傳不一致的說明；一致 (或此查詢在縮減後已不成立) 回傳 None，參考答案算不完回傳 SKIPPED
+    df = to_frame(records)
+    if df.empty: return None
+    kind, who_a, s_day, s_per, target = query[:5]
+    if who_a not in set(df['teacher']): return None
+    if (s_day, s_per) not in ref_sources(df, who_a): return None
+    if target and target not in {(r['day'], r['period']) for _, r in ref_free(df, who_a).iterrows()}: return None
+    tt = Timetable(DerivedData("oracle", df))
+
+    if kind == "sources":
+        ref = (set(ref_sources(df, who_a)), {(r['day'], r['period']) for _, r in ref_free(df, who_a).iterrows()})
+        got = ({(r['day'], r['period']) for r in tt.derived.releasable_slots(who_a)}, set(tt.derived.receivable_slots(who_a)))
+        return None if ref == got else f"可調出 / 可換入時段不同：參考 {ref}，引擎 {got}"
+
+    if kind == "swaps":
+        filters = query[5]
+        ref = sorted(ref_direct_swaps(df, who_a, s_day, s_per, target, *filters))
+        res = tt.direct_swaps(who_a, s_day, s_per, target, *filters)
+        rows = list(map(tuple, res.drop(columns="分數").values.tolist())) if len(res) else []
+        if sorted(rows) != sorted(ref):
+            missing, extra = set(ref) - set(rows), set(rows) - set(ref)
+            return f"雙人互換結果不同：缺少 {sorted(missing)[:5]}，多出 {sorted(extra)[:5]}"
+        if len(res) and not res["分數"].is_monotonic_increasing:
+            return "雙人互換：未依分數排序"
+        return None
+
+    if kind == "cycles":
+        try:
+            ref = {_path_key(p) for p in ref_find_cycles(df, who_a, s_day, s_per, target)}
+        except BudgetExceeded:
+            return SKIPPED
+        graph, valid_targets, _ = tt._cycle_args(who_a, s_day, s_per, target)
+        full, _ = CycleSearch(graph, who_a, s_day, s_per, valid_targets).run(max_results=0)
+        got = [_path_key(p) for p in full]
+        if len(got) != len(set(got)): return "多角調：引擎產生重複的循環"
+        if set(got) != ref:
+            return f"多角調結果不同：缺少 {len(ref - set(got))} 條，多出 {len(set(got) - ref)} 條"
+        capped, _ = tt.find_cycles(who_a, s_day, s_per, target, timeout=None)
+        capped = [_path_key(p) for p in capped]
+        if len(capped) != min(MAX_RESULTS, len(ref)) or not set(capped) <= ref:
+            return f"多角調 (上限 {MAX_RESULTS} 條)：得到 {len(capped)} 條，應為 {min(MAX_RESULTS, len(ref))} 條且皆為參考解"
+        lengths = [len(p) for p in capped]
+        if lengths != sorted(lengths): return "多角調：結果未依循環長度由短到長排列"
+        return None
+
+
+def random_queries(rng, records, n):
+    df = to_frame(records)
+    if df.empty: return []
+    teachers = list(dict.fromkeys(r[0] for r in records))
+    classes = sorted({r[4] for r in records if r[4]})
+    queries = []
+    for _ in range(n * 4):
+        if len(queries) >= n: break
+        who_a = rng.choice(teachers)
+        sources = sorted(ref_sources(df, who_a))
+        if not sources: continue
+        s_day, s_per = rng.choice(sources)
+        frees = [(r['day'], r['period']) for _, r in ref_free(df, who_a).iterrows()]
+        target = rng.choice(frees) if frees and rng.random() < 0.4 else None
+        kind = rng.choice(["sources", "swaps", "swaps", "cycles"])
+        filters = (
+            rng.choice([ANY] * 4 + teachers),
+            rng.choice([ANY] * 3 + [MY_CLASSES] + classes),
+            rng.choice([ANY] * 4 + DAYS),
+            rng.choice([ANY] * 4 + PERIODS),
+        )
+        queries.append((kind, who_a, s_day, s_per, target, filters))
+    return queries
+
+
+def shrink(records, query):
+    # ddmin：反覆移除一段紀錄，只要仍然失敗就保留移除後的版本
+    n = 2
+    while len(records) >= 2:
+        chunk = max(1, len(records) // n)
+        reduced = False
+        for start in range(0, len(records), chunk):
+            candidate = records[:start] + records[start + chunk:]
+            if check_query(candidate, query) not in (None, SKIPPED):
+                records = candidate
+                n = max(n - 1, 2)
+                reduced = True
+                break
+        if not reduced:
+            if chunk == 1: break
+            n = min(n * 2, len(records))
+    return records
+
+
+def main():
+    ap = argparse.ArgumentParser(description="頁面 3 / 4 搜尋引擎與原始演算法的差異比對")
+    ap.add_argument("--cases", type=int, default=200, help="隨機課表數")
+    ap.add_argument("--queries", type=int, default=4, help="每份課表的查詢數")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-teachers", type=int, default=14)
+    ap.add_argument("-o", "--output", default="oracle_failure.csv", help="最小失敗範例的輸出檔")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    counts = {}
+    for case in range(args.cases):
+        records = random_records(rng, rng.randint(3, args.max_teachers), rng.randint(2, 6), rng.uniform(0.3, 0.8))
+        for query in random_queries(rng, records, args.queries):
+            problem = check_query(records, query)
+            kind = "skipped" if problem == SKIPPED else query[0]
+            counts[kind] = counts.get(kind, 0) + 1
+            if problem in (None, SKIPPED): continue
+
+            print(f"❌ 第 {case} 組課表不一致：{problem}")
+            print(f"   查詢：{query}")
+            minimal = shrink(records, query)
+            Path(args.output).write_text(to_xinhe_csv(minimal), encoding="utf-8")
+            print(f"   縮減為 {len(minimal)} 筆有課紀錄 ({len({r[0] for r in minimal})} 位教師)：{check_query(minimal, query)}")
+            for r in minimal: print("   ", r)
+            print(f"   已寫出 {args.output}")
+            sys.exit(1)
+    summary = "、".join(f"{k} {v} 次" for k, v in sorted(counts.items()))
+    print(f"✅ {args.cases} 組課表全部一致 ({summary})，耗時 {time.perf_counter() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()